@@ -20,6 +20,7 @@ class Settings(BaseSettings):
     APP_VERSION: str = Field(default="1.0.0")
     DEBUG: bool = Field(default=True)
     AUDIO_OUTPUT_DIR: str = Field(default="./cache/audio")
+    DATABASE_URL: str = Field(default="sqlite:///./jardin.db")
 
     # Configuración de Groq AI
     # Modelos disponibles con VISIÓN en Groq:
@@ -29,6 +30,10 @@ class Settings(BaseSettings):
         default="llama-3.2-11b-vision-preview",
         description="Modelo de Groq para análisis de imágenes (debe soportar visión)"
     )
+    GROQ_LARGE_MODEL: str = Field(
+        default="llama-3.2-90b-vision-preview",
+        description="Modelo de visión grande al que se escala (vacío = solo GROQ_MODEL)"
+    )
     
     # Modelo para texto solamente (sin imágenes)
     GROQ_TEXT_MODEL: str = Field(
@@ -36,8 +41,245 @@ class Settings(BaseSettings):
         description="Modelo de Groq para texto (moderación, etc.)"
     )
     
+    GROQ_BASE_URL: str = Field(
+        default="",
+        description="URL base de la API (vacía = api.groq.com); p. ej. scripts/fake_groq_server.py"
+    )
     GROQ_TIMEOUT: int = Field(default=30, description="Timeout en segundos")
 
+    # Pool de conexiones HTTP compartido por el cliente asíncrono de Groq
+    GROQ_MAX_CONNECTIONS: int = Field(
+        default=20,
+        description="Máximo de conexiones HTTP simultáneas hacia Groq"
+    )
+    GROQ_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=10,
+        description="Conexiones keep-alive que se mantienen abiertas en el pool"
+    )
+    GROQ_KEEPALIVE_EXPIRY: float = Field(
+        default=30.0,
+        description="Segundos que una conexión ociosa permanece en el pool"
+    )
+
+    # Subida de imágenes (app/utils/uploads.py)
+    UPLOAD_MAX_BYTES: int = Field(
+        default=10 * 1024 * 1024,
+        description="Tamaño máximo de una imagen subida; más grande responde 413"
+    )
+    UPLOAD_CHUNK_BYTES: int = Field(
+        default=64 * 1024,
+        description="Bloque de copia a disco (memoria por subida)"
+    )
+
+    # Almacén de imágenes direccionado por contenido (app/services/blob_store.py)
+    IMAGE_STORE_DIR: str = Field(
+        default="uploads/blobs",
+        description="Raíz del almacén; debe quedar dentro de uploads/ para servirse"
+    )
+    IMAGE_STORE_GC_GRACE_SECONDS: int = Field(
+        default=24 * 3600,
+        description="Un blob sin referencias se borra tras este tiempo sin usarse"
+    )
+    IMAGE_STORE_GC_INTERVAL_SECONDS: float = Field(
+        default=3600.0,
+        description="Cada cuánto se buscan y borran blobs sin referencias (0 = solo con el script)"
+    )
+
+    # Procesos para el trabajo de imagen con CPU (app/services/image_workers.py)
+    IMAGE_WORKERS: int = Field(
+        default=2,
+        description="Procesos del pool de imágenes (0 = en hilos del propio worker)"
+    )
+    IMAGE_WORKER_QUEUE_DEPTH: int = Field(
+        default=32,
+        description="Tareas que pueden esperar en cola además de las que se ejecutan"
+    )
+    IMAGE_WORKER_QUEUE_TIMEOUT: float = Field(
+        default=10.0,
+        description="Espera máxima por un hueco en la cola antes de responder 503 (segundos)"
+    )
+
+    # Miniaturas WebP/JPEG de cada blob, generadas en el pool de imágenes (app/services/thumbnailer.py)
+    THUMBNAIL_WORKERS: int = Field(
+        default=1,
+        description="Miniaturas que se generan a la vez (0 = no generarlas); el resto del pool queda para las peticiones"
+    )
+    THUMBNAIL_SIZES: str = Field(
+        default="128,384,1024",
+        description="Lados mayores de las miniaturas, separados por comas"
+    )
+    THUMBNAIL_QUALITY: int = Field(default=80, description="Calidad WebP/JPEG de las miniaturas")
+
+    # Servidor de /uploads (app/utils/image_files.py)
+    IMAGE_SERVE_WEBP: bool = Field(
+        default=True,
+        description="Servir la versión .webp de una imagen del almacén si el cliente acepta image/webp"
+    )
+
+    # Preprocesamiento de imágenes antes de enviarlas al modelo de visión
+    LLM_IMAGE_PREPROCESS: bool = Field(
+        default=True,
+        description="Rotar según EXIF, reducir, recomprimir y quitar metadatos"
+    )
+    LLM_IMAGE_FORMAT: str = Field(default="JPEG", description="JPEG o WEBP")
+    LLM_IMAGE_QUALITY: int = Field(default=82, description="Calidad de recompresión (1-95)")
+    LLM_IMAGE_MAX_SIDE_GUIDANCE: int = Field(
+        default=512,
+        description="Lado mayor (px) para la validación rápida / guía de cámara"
+    )
+    LLM_IMAGE_MAX_SIDE_VALIDATION: int = Field(default=768)
+    LLM_IMAGE_MAX_SIDE_DIAGNOSIS: int = Field(default=1280)
+
+    # Validación local de calidad (NumPy/Pillow) antes de llamar a la IA
+    LOCAL_VALIDATION_ENABLED: bool = Field(default=True)
+    LOCAL_VALIDATION_ACCEPT_SCORE: float = Field(
+        default=0.75,
+        description="Puntaje local a partir del cual se acepta sin consultar a Groq"
+    )
+    LOCAL_VALIDATION_REJECT_SCORE: float = Field(
+        default=0.4,
+        description="Puntaje local por debajo del cual se rechaza sin consultar a Groq"
+    )
+
+    # WebSocket de guía de cámara (/api/diagnosis/ws/guidance)
+    WS_GUIDANCE_MAX_INFLIGHT: int = Field(
+        default=1,
+        description="Frames procesados en paralelo por conexión (los viejos se descartan)"
+    )
+    WS_GUIDANCE_MAX_FRAME_BYTES: int = Field(default=2 * 1024 * 1024)
+    WS_GUIDANCE_FRAME_TIMEOUT: float = Field(
+        default=5.0,
+        description="Segundos máximos para puntuar un frame"
+    )
+
+    # /capture-guidance: lanzar el diagnóstico en paralelo con la validación.
+    # Menor latencia a cambio de gastar un diagnóstico cuando la foto se rechaza.
+    CAPTURE_SPECULATIVE_DIAGNOSIS: bool = Field(default=False)
+
+    # Planificador de llamadas a Groq (prioridades + límites del proveedor).
+    # Los límites por minuto en 0 desactivan esa restricción.
+    LLM_MAX_CONCURRENCY: int = Field(
+        default=8,
+        description="Llamadas simultáneas máximas al LLM en todo el proceso"
+    )
+    LLM_REQUESTS_PER_MINUTE: int = Field(default=30, description="Presupuesto RPM del proveedor")
+    LLM_TOKENS_PER_MINUTE: int = Field(default=7000, description="Presupuesto TPM del proveedor")
+    # Espera máxima en cola por clase antes de descartar la petición (0 = sin límite)
+    LLM_QUEUE_DEADLINE_GUIDANCE: float = Field(default=2.0)
+    LLM_QUEUE_DEADLINE_DIAGNOSIS: float = Field(default=30.0)
+    LLM_QUEUE_DEADLINE_COMPARISON: float = Field(default=30.0)
+    LLM_QUEUE_DEADLINE_MODERATION: float = Field(default=10.0)
+
+    # Reintentos y hedging de llamadas a Groq (dentro del plazo GROQ_TIMEOUT)
+    LLM_RETRY_MAX_ATTEMPTS: int = Field(default=3, description="Intentos por llamada (1 = sin reintentos)")
+    LLM_RETRY_BASE_DELAY: float = Field(default=0.5, description="Backoff inicial en segundos")
+    LLM_RETRY_MAX_DELAY: float = Field(default=4.0, description="Backoff máximo en segundos")
+    LLM_HEDGE_ENABLED: bool = Field(
+        default=True,
+        description="Duplicar una petición lenta cuando supera el percentil observado"
+    )
+    LLM_HEDGE_PERCENTILE: float = Field(default=95.0)
+    LLM_HEDGE_MIN_SAMPLES: int = Field(
+        default=20,
+        description="Muestras de latencia necesarias antes de activar el hedging"
+    )
+
+    # Circuit breaker del backend LLM: tras N fallos seguidos las llamadas
+    # fallan al instante hacia alternativas locales durante el tiempo de recuperación
+    LLM_BREAKER_FAILURE_THRESHOLD: int = Field(default=5)
+    LLM_BREAKER_RECOVERY_SECONDS: float = Field(
+        default=30.0,
+        description="Segundos en estado abierto antes de probar una llamada"
+    )
+
+    # Enrutado entre GROQ_MODEL (rápido) y GROQ_LARGE_MODEL
+    MODEL_ROUTER_ENABLED: bool = Field(default=True)
+    MODEL_ROUTER_ESCALATION_CONFIDENCE: float = Field(
+        default=0.6,
+        description="Diagnósticos con confianza menor se repiten con el modelo grande"
+    )
+    MODEL_ROUTER_LOW_QUALITY_SCORE: float = Field(
+        default=0.4,
+        description="Fotos con calidad local menor van directamente al modelo grande"
+    )
+    MODEL_ROUTER_MAX_ERROR_RATE: float = Field(
+        default=0.5,
+        description="Tasa de error (EWMA) a partir de la cual se evita un modelo"
+    )
+    MODEL_ROUTER_EWMA_ALPHA: float = Field(default=0.2)
+
+    # Medición de tokens por usuario/endpoint/modelo (tabla llm_usage)
+    USAGE_FLUSH_SECONDS: float = Field(
+        default=10.0,
+        description="Cada cuánto se vuelca a la BD el consumo acumulado en memoria"
+    )
+    LLM_DAILY_TOKEN_QUOTA: int = Field(
+        default=0,
+        description="Tokens por usuario y día (UTC); al superarlos se responde 429 (0 = sin límite)"
+    )
+    ADMIN_API_KEY: str = Field(
+        default="",
+        description="Clave para /api/admin (cabecera X-Admin-Key); vacía = solo en modo DEBUG"
+    )
+
+    # Moderación por micro-lotes: un prompt para los textos que llegan casi a la vez
+    MODERATION_BATCH_ENABLED: bool = Field(default=True)
+    MODERATION_BATCH_MAX_SIZE: int = Field(default=16, description="Textos por prompt")
+    MODERATION_BATCH_MAX_WAIT_MS: float = Field(
+        default=25.0,
+        description="Espera máxima para completar un lote (milisegundos)"
+    )
+    MODERATION_BATCH_SHADOW_RATE: float = Field(
+        default=0.0,
+        description="Fracción de textos que se moderan también por separado para medir coincidencia"
+    )
+
+    # Prefiltro local y caché de veredictos delante del LLM de moderación
+    MODERATION_PREFILTER_ENABLED: bool = Field(default=True)
+    MODERATION_PREFILTER_MAX_LINKS: int = Field(
+        default=2,
+        description="Textos con más enlaces se rechazan como spam sin llamar al LLM"
+    )
+    MODERATION_CACHE_ENABLED: bool = Field(default=True)
+    MODERATION_CACHE_DB_PATH: str = Field(default="./cache/moderation_cache.db")
+    MODERATION_CACHE_TTL_SECONDS: int = Field(default=30 * 24 * 3600)
+    MODERATION_CACHE_MAX_MEMORY_ENTRIES: int = Field(default=2048)
+    MODERATION_CACHE_MAX_DISK_ENTRIES: int = Field(default=50000)
+
+    # Diagnósticos en segundo plano (async_mode=true → 202 + job id)
+    DIAGNOSIS_JOB_WORKERS: int = Field(
+        default=2,
+        description="Workers que procesan la cola de diagnósticos en cada proceso"
+    )
+    DIAGNOSIS_JOB_MAX_ATTEMPTS: int = Field(default=5)
+    DIAGNOSIS_JOB_POLL_SECONDS: float = Field(
+        default=2.0,
+        description="Cada cuánto se revisa la tabla diagnosis_jobs sin avisos locales"
+    )
+    DIAGNOSIS_JOB_LEASE_SECONDS: float = Field(
+        default=300.0,
+        description="Un trabajo 'running' más antiguo se considera abandonado y se reintenta"
+    )
+
+    # Caché de diagnósticos (memoria LRU + SQLite persistente)
+    DIAGNOSIS_CACHE_ENABLED: bool = Field(default=True)
+    DIAGNOSIS_CACHE_DB_PATH: str = Field(
+        default="./cache/llm_cache.db",
+        description="Archivo SQLite del nivel persistente de la caché"
+    )
+    DIAGNOSIS_CACHE_TTL_SECONDS: int = Field(
+        default=7 * 24 * 3600,
+        description="Vigencia de un diagnóstico cacheado (segundos)"
+    )
+    DIAGNOSIS_CACHE_MAX_MEMORY_ENTRIES: int = Field(default=256)
+    DIAGNOSIS_CACHE_MAX_DISK_ENTRIES: int = Field(default=5000)
+
+    # Variantes A/B de prompts (ver app/utils/prompts.py)
+    PROMPT_AB_SPLITS: str = Field(
+        default="",
+        description="Reparto 'prompt:variante=peso' separado por comas, p. ej. 'diagnosis:compact=0.2'; el resto usa 'default'"
+    )
+
     # CORS
     ALLOWED_ORIGINS: List[str] = Field(default=["*"])
 
@@ -71,5 +313,7 @@ if __name__ == "__main__":
     print(f"Groq Model (Vision): {settings.GROQ_MODEL}")
     print(f"Groq Model (Text): {settings.GROQ_TEXT_MODEL}")
     print(f"Groq Timeout: {settings.GROQ_TIMEOUT}s")
+    print(f"Groq Pool: {settings.GROQ_MAX_CONNECTIONS} conexiones "
+          f"({settings.GROQ_MAX_KEEPALIVE_CONNECTIONS} keep-alive)")
     print(f"API Key configurada: {'✓' if settings.GROQ_API_KEY else '✗'}")
     print("=" * 60)
@@ -1,14 +1,23 @@
 """
 Aplicación principal de FastAPI - Jardín Inteligente API
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from app.config import get_settings
+from app.services.groq_service import init_groq_client, close_groq_client
+from app.services.usage_meter import QuotaExceededError, get_usage_meter
+from app.services.blob_store import get_blob_store
+from app.services.diagnosis_jobs import get_diagnosis_jobs
+from app.services.image_workers import ImageWorkersBusy, get_image_workers
+from app.services.thumbnailer import get_thumbnailer
+from app.utils.image_files import ImageFiles
+import asyncio
 import logging
 from pathlib import Path
 import os
 import hashlib
+from datetime import datetime, timedelta
 
 # Configurar logging
 logging.basicConfig(
@@ -46,8 +55,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Montar archivos estáticos para servir imágenes
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Montar archivos estáticos para servir imágenes (ETag, caché inmutable, rangos, WebP)
+app.mount("/uploads", ImageFiles(directory="uploads", serve_webp=settings.IMAGE_SERVE_WEBP), name="uploads")
+
+
+@app.exception_handler(QuotaExceededError)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceededError):
+    """Cuota diaria de tokens agotada: 429 hasta la medianoche UTC"""
+    now = datetime.utcnow()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return JSONResponse(
+        status_code=429,
+        content={
+            "detail": "Alcanzaste tu límite diario de análisis con IA. Vuelve a intentarlo mañana.",
+            "tokens_used": exc.used,
+            "daily_token_quota": exc.limit,
+        },
+        headers={"Retry-After": str(int((tomorrow - now).total_seconds()) + 1)},
+    )
+
+
+@app.exception_handler(ImageWorkersBusy)
+async def image_workers_busy_handler(request: Request, exc: ImageWorkersBusy):
+    """Cola de procesamiento de imágenes llena: 503 para que el cliente reintente"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "El servidor está procesando muchas imágenes. Vuelve a intentarlo en unos segundos."},
+        headers={"Retry-After": "2"},
+    )
 
 
 def hash_password(password: str) -> str:
@@ -64,9 +99,26 @@ async def startup_event():
     logger.info(f"🤖 Modelo de Groq (Vision): {settings.GROQ_MODEL}")
     logger.info(f"📝 Modelo de Groq (Text): {settings.GROQ_TEXT_MODEL}")
     logger.info(f"⏱️  Timeout: {settings.GROQ_TIMEOUT}s")
+    logger.info(f"🔌 Pool Groq: {settings.GROQ_MAX_CONNECTIONS} conexiones, "
+                f"{settings.GROQ_MAX_KEEPALIVE_CONNECTIONS} keep-alive")
     logger.info(f"🔧 Debug mode: {settings.DEBUG}")
     logger.info("=" * 60)
     
+    # Cliente asíncrono de Groq compartido por todas las peticiones
+    init_groq_client()
+    
+    # Volcado periódico del consumo de tokens a la tabla llm_usage
+    get_usage_meter().start()
+    
+    # Recolección periódica de blobs sin referencias del almacén de imágenes
+    get_blob_store().start()
+    
+    # Procesos para decodificar/reducir/recomprimir imágenes fuera del event loop
+    await get_image_workers().start()
+    
+    # Workers de diagnósticos en segundo plano (retoma los pendientes tras un reinicio)
+    get_diagnosis_jobs().start()
+    
     # Crear usuario demo si no existe
     from app.models.database import SessionLocal, UserDB
     
@@ -99,6 +151,17 @@ async def startup_event():
 async def shutdown_event():
     """Evento ejecutado al cerrar la aplicación"""
     logger.info("👋 Cerrando Jardín Inteligente API")
+    await get_diagnosis_jobs().stop()
+    await close_groq_client()
+    await get_usage_meter().stop()
+    await get_thumbnailer().stop()
+    await get_image_workers().stop()
+    await get_blob_store().stop()
+    
+    from app.services.diagnosis_cache import get_diagnosis_cache
+    from app.services.moderation_cache import get_moderation_cache
+    get_diagnosis_cache().close()
+    get_moderation_cache().close()
 
 
 @app.get("/")
@@ -127,12 +190,50 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint para verificar el estado de la API"""
+    from app.services.groq_service import get_circuit_breaker
+    
+    breaker = get_circuit_breaker().snapshot()
     return {
-        "status": "healthy",
+        "status": "healthy" if breaker["state"] == "closed" else "degraded",
         "app": settings.APP_NAME,
         "version": settings.APP_VERSION,
         "groq_model": settings.GROQ_MODEL,
-        "groq_text_model": settings.GROQ_TEXT_MODEL
+        "groq_text_model": settings.GROQ_TEXT_MODEL,
+        "llm_backend": breaker
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Contadores e histogramas de latencia internos (cachés, llamadas a Groq, etc.)"""
+    from app.services.diagnosis_cache import get_diagnosis_cache
+    from app.services.moderation_cache import get_moderation_cache
+    from app.services.groq_service import (
+        get_llm_scheduler, get_model_router, get_moderation_batcher, get_singleflight
+    )
+    from app.utils.metrics import metrics
+    from app.utils.prompts import get_prompt_registry
+    
+    # Estas estadísticas consultan SQLite: fuera del event loop
+    job_stats, diagnosis_cache_stats, moderation_cache_stats = await asyncio.gather(
+        asyncio.to_thread(get_diagnosis_jobs().stats),
+        asyncio.to_thread(get_diagnosis_cache().stats),
+        asyncio.to_thread(get_moderation_cache().stats),
+    )
+    return {
+        **metrics.snapshot(),
+        "groq_in_flight": get_singleflight().in_flight,
+        "llm_scheduler": get_llm_scheduler().stats(),
+        "model_router": get_model_router().stats(),
+        "moderation_batcher": get_moderation_batcher().stats(),
+        "diagnosis_jobs": job_stats,
+        "thumbnails": get_thumbnailer().stats(),
+        "image_workers": get_image_workers().stats(),
+        "prompts": get_prompt_registry().describe(),
+        "caches": {
+            "diagnosis": diagnosis_cache_stats,
+            "moderation": moderation_cache_stats
+        }
     }
 
 
@@ -145,6 +246,8 @@ async def get_config():
         "debug": settings.DEBUG,
         "audio_dir": settings.AUDIO_OUTPUT_DIR,
         "groq_model": settings.GROQ_MODEL,
+        "groq_large_model": settings.GROQ_LARGE_MODEL,
+        "model_router_enabled": settings.MODEL_ROUTER_ENABLED,
         "groq_text_model": settings.GROQ_TEXT_MODEL,
         "groq_timeout": settings.GROQ_TIMEOUT,
         "api_key_configured": bool(settings.GROQ_API_KEY),
@@ -156,7 +259,7 @@ async def get_config():
 
 
 # Importar y registrar rutas
-from app.routes import diagnosis, plants, community, gamification, auth, reminders, comparison_routes
+from app.routes import diagnosis, plants, community, gamification, auth, reminders, comparison_routes, admin
 from app.models.database import init_db
 
 # Registrar routers
@@ -167,6 +270,7 @@ app.include_router(community.router)
 app.include_router(gamification.router)
 app.include_router(reminders.router)
 app.include_router(comparison_routes.router, prefix="/api", tags=["comparison"])
+app.include_router(admin.router)
 
 # Inicializar base de datos
 init_db()
@@ -1,12 +1,17 @@
 """Base de datos SQLAlchemy"""
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./jardin.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+from app.config import get_settings
+
+SQLALCHEMY_DATABASE_URL = get_settings().DATABASE_URL
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -25,6 +30,7 @@ class UserDB(Base):
     streak_days = Column(Integer, default=0)
     last_activity = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    diagnosis_count = Column(Integer, default=0)
     plants = relationship("PlantDB", back_populates="owner")
     diagnoses = relationship("DiagnosisDB", back_populates="user")
 
@@ -60,6 +66,9 @@ class DiagnosisDB(Base):
     recommendations = Column(Text)  # JSON string
     created_at = Column(DateTime, default=datetime.utcnow)
     is_shared = Column(Boolean, default=False)
+    # Procedencia: variante y huella del prompt que produjo el diagnóstico
+    prompt_variant = Column(String, nullable=True)
+    prompt_fingerprint = Column(String, nullable=True, index=True)
     plant = relationship("PlantDB", back_populates="diagnoses")
     user = relationship("UserDB", back_populates="diagnoses")
 
@@ -139,6 +148,63 @@ class ReminderDB(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class DiagnosisJobDB(Base):
+    """Diagnóstico en segundo plano (modo asíncrono de /analyze y update-with-diagnosis)"""
+    __tablename__ = "diagnosis_jobs"
+    id = Column(String, primary_key=True)  # uuid4 hex
+    kind = Column(String)  # "analyze", "plant_update"
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed
+    user_id = Column(Integer, ForeignKey("users.id"))
+    plant_id = Column(Integer, ForeignKey("plants.id"), nullable=True)
+    image_path = Column(String)
+    symptoms = Column(Text, nullable=True)
+    use_cache = Column(Boolean, default=True)
+    prompt_variant = Column(String, nullable=True)  # variante A/B pedida (None = reparto)
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime, nullable=True)  # reintento diferido
+    diagnosis_id = Column(Integer, ForeignKey("diagnoses.id"), nullable=True)
+    result = Column(Text, nullable=True)  # JSON con la misma respuesta que el modo síncrono
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class LLMUsageDB(Base):
+    """Consumo de tokens del LLM agregado por minuto, usuario, endpoint y modelo"""
+    __tablename__ = "llm_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(DateTime, index=True)  # inicio del minuto (UTC)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    endpoint = Column(String)
+    model = Column(String)
+    requests = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+
+    __table_args__ = (Index("ix_llm_usage_user_bucket", "user_id", "bucket"),)
+
+
+class ImageBlobDB(Base):
+    """
+    Imagen del almacén direccionado por contenido (app/services/blob_store.py).
+    ref_count = filas que apuntan a ella (diagnósticos, plantas, posts y
+    comparaciones); se mantiene al hacer flush de la sesión.
+    """
+    __tablename__ = "image_blobs"
+    sha256 = Column(String, primary_key=True)
+    path = Column(String, nullable=False)  # "uploads/blobs/ab/cd/<sha256>.jpg"
+    size = Column(Integer, default=0)
+    format = Column(String)  # jpeg, png, webp, gif
+    content_type = Column(String)
+    ref_count = Column(Integer, default=0, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_referenced_at = Column(DateTime, nullable=True)
+    # JSON {tamaño: [ancho, alto]} de las miniaturas ya generadas (app/utils/thumbnails.py)
+    derivatives = Column(Text, nullable=True)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -147,9 +213,39 @@ def get_db():
         db.close()
 
 
+# Columnas añadidas a tablas ya existentes: create_all no las crea en una BD
+# antigua, así que init_db las añade con ALTER TABLE (tabla, columna, tipo SQL)
+ADDED_COLUMNS = (
+    ("users", "diagnosis_count", "INTEGER DEFAULT 0"),
+    ("diagnoses", "prompt_variant", "VARCHAR"),
+    ("diagnoses", "prompt_fingerprint", "VARCHAR"),
+    ("diagnosis_jobs", "prompt_variant", "VARCHAR"),
+    ("image_blobs", "derivatives", "TEXT"),
+)
+
+
+def add_missing_columns(bind=None):
+    """Añade las columnas de ADDED_COLUMNS que falten (idempotente)"""
+    bind = bind or engine
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table, column, sql_type in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
+        # Índices declarados sobre esas columnas (create_all tampoco los crea)
+        for table in {table for table, _, _ in ADDED_COLUMNS} & tables:
+            for index in Base.metadata.tables[table].indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def init_db():
-    """Inicializar base de datos y crear tablas"""
+    """Inicializar base de datos, crear tablas y añadir columnas nuevas"""
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
 
 
 def reset_db():
@@ -206,6 +206,7 @@ class DiagnosisResponse(BaseModel):
     recommendations: List[str]
     weekly_plan: List[dict] = []
     audio_url: Optional[str] = None
+    status: str = "completed"  # sin IA disponible /analyze responde 202 con un trabajo
     # Nuevos campos para comunicación adaptativa (Mejora #2)
     user_level: Optional[str] = None
     level_badge: Optional[str] = None
@@ -0,0 +1,111 @@
+"""Rutas de administración: consumo de tokens del LLM"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.database import get_db, LLMUsageDB, UserDB
+from app.services.usage_meter import get_usage_meter
+
+settings = get_settings()
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"])
+
+
+def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Exige la cabecera X-Admin-Key; sin ADMIN_API_KEY configurada solo se permite en DEBUG"""
+    if settings.ADMIN_API_KEY:
+        if x_admin_key != settings.ADMIN_API_KEY:
+            raise HTTPException(403, "Clave de administración inválida")
+    elif not settings.DEBUG:
+        raise HTTPException(403, "Configura ADMIN_API_KEY para usar la administración")
+
+
+def _totals(row) -> dict:
+    return {
+        "requests": int(row.requests or 0),
+        "prompt_tokens": int(row.prompt_tokens or 0),
+        "completion_tokens": int(row.completion_tokens or 0),
+        "total_tokens": int(row.total_tokens or 0),
+    }
+
+
+@router.get("/usage", dependencies=[Depends(require_admin)])
+async def get_llm_usage(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    user_id: Optional[int] = None,
+    top: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Consumo de tokens del LLM en las últimas `hours` horas: totales, por
+    endpoint, por modelo, por hora y los usuarios que más consumen.
+    """
+    # Incluir lo que aún está en el búfer en memoria
+    await get_usage_meter().flush()
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    sums = (
+        func.sum(LLMUsageDB.requests).label("requests"),
+        func.sum(LLMUsageDB.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsageDB.completion_tokens).label("completion_tokens"),
+        func.sum(LLMUsageDB.total_tokens).label("total_tokens"),
+    )
+
+    def query(*columns):
+        q = db.query(*columns, *sums).filter(LLMUsageDB.bucket >= since)
+        if user_id is not None:
+            q = q.filter(LLMUsageDB.user_id == user_id)
+        return q
+
+    by_endpoint = query(LLMUsageDB.endpoint).group_by(LLMUsageDB.endpoint).order_by(
+        func.sum(LLMUsageDB.total_tokens).desc()
+    ).all()
+    by_model = query(LLMUsageDB.model).group_by(LLMUsageDB.model).order_by(
+        func.sum(LLMUsageDB.total_tokens).desc()
+    ).all()
+
+    # Agregado por minuto en SQL y por hora aquí (sin funciones de fecha propias del motor)
+    by_hour = {}
+    for row in query(LLMUsageDB.bucket).group_by(LLMUsageDB.bucket).all():
+        hour = row.bucket.replace(minute=0, second=0, microsecond=0)
+        totals = by_hour.setdefault(hour, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+        for key, value in _totals(row).items():
+            totals[key] += value
+
+    top_users = query(LLMUsageDB.user_id, UserDB.username).outerjoin(
+        UserDB, UserDB.id == LLMUsageDB.user_id
+    ).group_by(LLMUsageDB.user_id, UserDB.username).order_by(
+        func.sum(LLMUsageDB.total_tokens).desc()
+    ).limit(top).all()
+
+    return {
+        "since": since.isoformat(),
+        "hours": hours,
+        "user_id": user_id,
+        "totals": _totals(query().one()),
+        "by_endpoint": [{"endpoint": row.endpoint, **_totals(row)} for row in by_endpoint],
+        "by_model": [{"model": row.model, **_totals(row)} for row in by_model],
+        "by_hour": [{"hour": hour.isoformat(), **totals} for hour, totals in sorted(by_hour.items())],
+        "top_users": [
+            {"user_id": row.user_id, "username": row.username, **_totals(row)}
+            for row in top_users
+        ],
+        "daily_token_quota": settings.LLM_DAILY_TOKEN_QUOTA or None,
+    }
+
+
+@router.get("/usage/users/{user_id}/today", dependencies=[Depends(require_admin)])
+async def get_user_usage_today(user_id: int):
+    """Tokens consumidos hoy (UTC) por un usuario frente a su cuota diaria"""
+    used = await get_usage_meter().tokens_used_today(user_id)
+    quota = settings.LLM_DAILY_TOKEN_QUOTA
+    return {
+        "user_id": user_id,
+        "tokens_used_today": used,
+        "daily_token_quota": quota or None,
+        "remaining": max(0, quota - used) if quota else None,
+    }
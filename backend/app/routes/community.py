@@ -3,18 +3,15 @@ from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
 from sqlalchemy.orm import Session
 from app.models.database import get_db, CommunityPostDB, CommentDB, DiagnosisDB, UserDB
 from app.models.schemas import CommunityPost, CommentCreate, CommunityPostCreate
+from app.services.blob_store import get_blob_store
 from app.services.groq_service import moderate_content
+from app.services.thumbnailer import get_thumbnailer
+from app.services.usage_meter import usage_scope
 from typing import Optional
-import os
-import uuid
 from datetime import datetime
 
 router = APIRouter(prefix="/api/community", tags=["Community"])
 
-# Directorio para guardar imágenes
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "uploads", "community")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 @router.post("/posts", response_model=CommunityPost)
 async def create_post(post: CommunityPostCreate, user_id: int = 1, db: Session = Depends(get_db)):
     """CU-07: Publicar caso a la comunidad (desde diagnóstico existente)"""
@@ -23,7 +20,8 @@ async def create_post(post: CommunityPostCreate, user_id: int = 1, db: Session =
         raise HTTPException(404, "Diagnóstico no encontrado")
     
     # CU-09: Moderación asistida por IA
-    is_appropriate = await moderate_content(diagnosis.diagnosis_text)
+    with usage_scope(user_id, "community.create_post"):
+        is_appropriate = await moderate_content(diagnosis.diagnosis_text)
     if not is_appropriate:
         raise HTTPException(400, "Contenido inapropiado detectado")
     
@@ -74,20 +72,15 @@ async def create_post_with_image(
         
         # CU-09: Moderar contenido
         content_to_moderate = f"{description} {plant_name or ''} {symptoms or ''}"
-        is_appropriate = await moderate_content(content_to_moderate)
+        with usage_scope(user_id_int, "community.create_post_with_image"):
+            is_appropriate = await moderate_content(content_to_moderate)
         if not is_appropriate:
             raise HTTPException(400, "Contenido inapropiado detectado")
         
-        # Guardar imagen
-        file_extension = image.filename.split(".")[-1] if "." in image.filename else "jpg"
-        file_name = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, file_name)
-        
-        with open(file_path, "wb") as f:
-            content = await image.read()
-            f.write(content)
+        # Guardar imagen (la extensión sale del formato real, no del nombre del archivo)
+        stored = await get_blob_store().put_upload(image)
         
-        image_url = f"uploads/community/{file_name}"  # Sin / inicial para que funcione con base_url
+        image_url = stored.path  # Sin / inicial para que funcione con base_url
         
         # Crear diagnóstico temporal para el post
         import json
@@ -139,6 +132,8 @@ async def create_post_with_image(
             "created_at": db_post.created_at.isoformat()
         }
         
+    except HTTPException:
+        raise
     except ValueError:
         raise HTTPException(400, "user_id inválido")
     except Exception as e:
@@ -181,6 +176,11 @@ async def get_posts(limit: int = 20, db: Session = Depends(get_db)):
             "created_at": post.created_at.isoformat()
         })
     
+    # Miniaturas para el feed (una consulta para toda la página)
+    variants = get_thumbnailer().variants_for(db, [item["image_url"] for item in result])
+    for item, image_variants in zip(result, variants):
+        item.update(image_variants)
+    
     return result
 
 
@@ -192,7 +192,8 @@ async def add_comment(post_id: int, comment: CommentCreate, user_id: int = 1, db
         raise HTTPException(404, "Post no encontrado")
     
     # Moderar contenido
-    is_appropriate = await moderate_content(comment.content)
+    with usage_scope(user_id, "community.add_comment"):
+        is_appropriate = await moderate_content(comment.content)
     if not is_appropriate:
         raise HTTPException(400, "Comentario inapropiado detectado")
     
@@ -5,40 +5,28 @@ Permite comparar fotos antes/después de tratamiento
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
 from sqlalchemy.orm import Session
 from typing import Dict, Any, Optional
+import asyncio
 import logging
 import json
 from datetime import datetime, timedelta
+from pathlib import Path
 
 from app.models.database import get_db
 from app.models.comparison_models import PlantComparison, ComparisonMetric
-from app.services.groq_service import GroqService
-from app.utils.image_processing import save_image
-import os
+from app.services.blob_store import get_blob_store
+from app.services.groq_service import get_groq_service
+from app.services.usage_meter import get_usage_meter, usage_scope
+from app.utils.json_extraction import parse_llm_json
+from app.utils.prompts import get_prompt_registry
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-async def save_comparison_image(upload_file: UploadFile, prefix: str = "") -> str:
-    """Guardar imagen de comparación"""
-    image_data = await upload_file.read()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"comparison/{prefix}{timestamp}.jpg"
-    
-    # Crear directorio si no existe
-    os.makedirs("uploads/comparison", exist_ok=True)
-    
-    # Usar save_image existente
-    from PIL import Image
-    import io
-    from pathlib import Path
-    
-    img = Image.open(io.BytesIO(image_data))
-    path = Path(f"uploads/{filename}")
-    path.parent.mkdir(exist_ok=True, parents=True)
-    img.save(path)
-    
-    return str(path)
+async def save_comparison_image(upload_file: UploadFile) -> str:
+    """Guardar imagen de comparación tal cual se subió, en el almacén por contenido"""
+    stored = await get_blob_store().put_upload(upload_file)
+    return stored.path
 
 
 @router.post("/comparison/create")
@@ -66,52 +54,53 @@ async def create_comparison(
     Returns:
         Análisis comparativo con métricas de mejora
     """
+    await get_usage_meter().check_quota(user_id)
     try:
         # Guardar imágenes
-        before_path = await save_comparison_image(before_image, prefix="before_")
-        after_path = await save_comparison_image(after_image, prefix="after_")
+        before_path = await save_comparison_image(before_image)
+        after_path = await save_comparison_image(after_image)
         
         logger.info(f"Imágenes guardadas: {before_path}, {after_path}")
         
         # Analizar ambas imágenes con Groq
-        service = GroqService()
-        
-        # Leer imágenes
-        with open(before_path, "rb") as f:
-            before_bytes = f.read()
-        with open(after_path, "rb") as f:
-            after_bytes = f.read()
-        
-        # Analizar foto "antes"
-        before_result = await service.analyze_image_with_prompt(
-            image_bytes=before_bytes,
-            prompt="Analiza esta foto de planta y describe su salud en JSON: {health_score: 0-100, issues: [lista]}",
-            temperature=0.3,
-            max_tokens=300
-        )
-        
-        # Analizar foto "después"
-        after_result = await service.analyze_image_with_prompt(
-            image_bytes=after_bytes,
-            prompt="Analiza esta foto de planta y describe su salud en JSON: {health_score: 0-100, issues: [lista]}",
-            temperature=0.3,
-            max_tokens=300
-        )
-        
-        # Parsear resultados
-        try:
-            before_content = before_result["content"].replace("```json", "").replace("```", "").strip()
-            after_content = after_result["content"].replace("```json", "").replace("```", "").strip()
-            before_data = json.loads(before_content)
-            after_data = json.loads(after_content)
-        except Exception as parse_error:
-            logger.warning(f"Error parseando JSON: {parse_error}, usando valores por defecto")
-            before_data = {"health_score": 50, "issues": []}
-            after_data = {"health_score": 50, "issues": []}
+        service = get_groq_service()
+        
+        # Leer imágenes (fuera del event loop)
+        before_bytes = await asyncio.to_thread(Path(before_path).read_bytes)
+        after_bytes = await asyncio.to_thread(Path(after_path).read_bytes)
+        
+        prompt = get_prompt_registry().get("health_summary").text
+        with usage_scope(user_id, "comparison.create"):
+            # Analizar foto "antes"
+            before_result = await service.analyze_image_with_prompt(
+                image_bytes=before_bytes,
+                prompt=prompt,
+                temperature=0.3,
+                max_tokens=300,
+                purpose="comparison"
+            )
+            
+            # Analizar foto "después"
+            after_result = await service.analyze_image_with_prompt(
+                image_bytes=after_bytes,
+                prompt=prompt,
+                temperature=0.3,
+                max_tokens=300,
+                purpose="comparison"
+            )
+        
+        # Parsear resultados (cada foto por separado: un fallo no descarta la otra)
+        default_data = {"health_score": 50, "issues": []}
+        before_data = parse_llm_json(before_result.get("content"), "health_summary")
+        after_data = parse_llm_json(after_result.get("content"), "health_summary")
+        if before_data is None or after_data is None:
+            logger.warning("Error parseando JSON de comparación, usando valores por defecto")
+        before_data = before_data or default_data
+        after_data = after_data or default_data
         
         # Calcular mejora
-        health_before = before_data.get("health_score", 50)
-        health_after = after_data.get("health_score", 50)
+        health_before = before_data["health_score"]
+        health_after = after_data["health_score"]
         health_improvement = health_after - health_before
         
         # Determinar progresión
@@ -174,6 +163,8 @@ async def create_comparison(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error en comparación: {e}")
         db.rollback()
@@ -1,19 +1,35 @@
 """Rutas para diagnóstico de plantas (CU-01, CU-02, CU-03, CU-08, CU-12)"""
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Request, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
-from app.models.database import get_db, DiagnosisDB, PlantDB, DiagnosisFeedbackDB
+from app.models.database import get_db, SessionLocal, DiagnosisDB, PlantDB, DiagnosisFeedbackDB
 from app.models.schemas import DiagnosisResponse, CaptureGuidance
-from app.services.groq_service import get_plant_diagnosis, validate_photo_quality, validate_photo_quality_fast
+from app.services.groq_service import (
+    get_plant_diagnosis, stream_plant_diagnosis, validate_photo_quality, validate_photo_quality_fast
+)
+from app.services.diagnosis_jobs import (
+    TERMINAL_STATUSES, JobRetryLater, accepted_payload, get_diagnosis_jobs, job_to_dict
+)
+from app.services.blob_store import get_blob_store
+from app.services.thumbnailer import get_thumbnailer
 from app.services.communication_adapter import CommunicationAdapter, UserLevel, adapt_full_diagnosis
+from app.services.usage_meter import QuotaExceededError, get_usage_meter, usage_scope
 from app.utils.image_processing import save_image
+from app.utils.uploads import read_upload
+from app.utils.metrics import metrics
+from app.config import get_settings
 from sqlalchemy import text, func
+import asyncio
 import json
+import time
 from datetime import datetime
+from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/api/diagnosis", tags=["Diagnosis"])
 
@@ -45,38 +61,27 @@ def get_full_image_url(image_path: Optional[str], request: Request) -> Optional[
     return f"{base_url}/{clean_path}"
 
 
-@router.post("/analyze", response_model=DiagnosisResponse)
-async def analyze_plant(
-    request: Request,
-    plant_id: int = Form(0),
-    image: UploadFile = File(...),
-    symptoms: Optional[str] = Form(None),
-    user_id: int = Form(1),
-    db: Session = Depends(get_db)
-):
-    """CU-02: Diagnóstico automático + explicación LLM - ACTUALIZADO con Mejora #2"""
-    # Si plant_id es 0, es un diagnóstico sin planta asociada (modo invitado o rápido)
-    if plant_id > 0:
-        plant = db.query(PlantDB).filter(PlantDB.id == plant_id).first()
-        if not plant:
-            raise HTTPException(404, "Planta no encontrada")
-    
-    # Guardar imagen
-    image_data = await image.read()
-    image_path = await save_image(image_data, plant_id if plant_id > 0 else user_id)
-    
-    logger.info(f"Imagen guardada en: {image_path}")
-    
-    # Obtener diagnóstico de Groq
-    diagnosis_data = await get_plant_diagnosis(image_path, symptoms)
+def persist_diagnosis(
+    db: Session,
+    diagnosis_data: dict,
+    image_path: str,
+    plant_id: int,
+    user_id: int
+) -> DiagnosisDB:
+    """
+    Adapta el diagnóstico al nivel del usuario (Mejora #2), lo guarda en DB y
+    actualiza contador del usuario y estado de la planta. Modifica diagnosis_data.
     
+    Los diagnósticos "queued" (IA no disponible) no se guardan: se encolan con
+    enqueue_when_available y el trabajo guarda el diagnóstico real.
+    """
     # ========== MEJORA #2: Adaptar comunicación según nivel de usuario ==========
     diagnosis_count = db.query(func.count(DiagnosisDB.id)).filter(
         DiagnosisDB.user_id == user_id
     ).scalar() or 0
     
     user_level = CommunicationAdapter.detect_user_level(diagnosis_count)
-    diagnosis_data = adapt_full_diagnosis(diagnosis_data, user_level)
+    diagnosis_data.update(adapt_full_diagnosis(diagnosis_data, user_level))
     
     logger.info(f"Diagnóstico adaptado para nivel {user_level.value} (count: {diagnosis_count})")
     # ========== FIN DE MEJORA #2 ==========
@@ -90,7 +95,9 @@ async def analyze_plant(
         confidence=diagnosis_data["confidence"],
         disease_name=diagnosis_data.get("disease_name"),
         severity=diagnosis_data["severity"],
-        recommendations=json.dumps(diagnosis_data["recommendations"])
+        recommendations=json.dumps(diagnosis_data["recommendations"]),
+        prompt_variant=diagnosis_data.get("prompt_variant"),
+        prompt_fingerprint=diagnosis_data.get("prompt_fingerprint")
     )
     db.add(diagnosis)
     db.commit()
@@ -120,6 +127,69 @@ async def analyze_plant(
             
             db.commit()
     
+    return diagnosis
+
+
+@router.post("/analyze", response_model=DiagnosisResponse)
+async def analyze_plant(
+    request: Request,
+    plant_id: int = Form(0),
+    image: UploadFile = File(...),
+    symptoms: Optional[str] = Form(None),
+    user_id: int = Form(1),
+    use_cache: bool = Form(True),
+    async_mode: bool = Form(False),
+    prompt_variant: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """CU-02: Diagnóstico automático + explicación LLM - ACTUALIZADO con Mejora #2
+    
+    use_cache=false fuerza un análisis nuevo aunque la misma foto ya se haya diagnosticado.
+    prompt_variant fija la variante A/B del prompt (p. ej. "compact"); sin él se
+    aplica el reparto de PROMPT_AB_SPLITS.
+    async_mode=true guarda la foto, encola el diagnóstico y responde 202 con el
+    job id; el resultado se consulta en /api/diagnosis/jobs/{job_id}. Lo mismo
+    ocurre, aunque no se pida, si el servicio de IA no está disponible.
+    """
+    # Si plant_id es 0, es un diagnóstico sin planta asociada (modo invitado o rápido)
+    if plant_id > 0:
+        plant = db.query(PlantDB).filter(PlantDB.id == plant_id).first()
+        if not plant:
+            raise HTTPException(404, "Planta no encontrada")
+    
+    await get_usage_meter().check_quota(user_id)
+    
+    # Guardar imagen
+    image_path = await save_image(image)
+    
+    logger.info(f"Imagen guardada en: {image_path}")
+    
+    if async_mode:
+        job = get_diagnosis_jobs().enqueue(
+            db, "analyze", user_id=user_id, image_path=image_path,
+            plant_id=plant_id, symptoms=symptoms, use_cache=use_cache, prompt_variant=prompt_variant
+        )
+        return job_accepted_response(job)
+    
+    # Obtener diagnóstico de Groq
+    with usage_scope(user_id, "diagnosis.analyze"):
+        diagnosis_data = await get_plant_diagnosis(
+            image_path, symptoms, use_cache=use_cache, prompt_variant=prompt_variant
+        )
+    
+    if diagnosis_data.get("status") == "queued":
+        job = enqueue_when_available(
+            db, user_id=user_id, image_path=image_path, plant_id=plant_id,
+            symptoms=symptoms, use_cache=use_cache, prompt_variant=prompt_variant
+        )
+        return job_accepted_response(job)
+    
+    diagnosis = persist_diagnosis(db, diagnosis_data, image_path, plant_id, user_id)
+    return build_diagnosis_response(diagnosis, diagnosis_data)
+
+
+def build_diagnosis_response(diagnosis: DiagnosisDB, diagnosis_data: dict) -> DiagnosisResponse:
+    """Respuesta de /analyze a partir del diagnóstico guardado y el ya adaptado"""
     # CU-03: Plan semanal ya viene incluido en el diagnóstico
     weekly_plan = diagnosis_data.get("weekly_plan", [])
     
@@ -131,12 +201,212 @@ async def analyze_plant(
         severity=diagnosis.severity,
         recommendations=diagnosis_data["recommendations"],
         weekly_plan=weekly_plan,
+        status=diagnosis_data.get("status", "completed"),
         user_level=diagnosis_data.get("user_level"),
         level_badge=diagnosis_data.get("level_badge"),
         educational_tips=diagnosis_data.get("educational_tips", [])
     )
 
 
+def job_accepted_response(job) -> JSONResponse:
+    """202 Accepted con el id del trabajo y dónde seguirlo"""
+    payload = accepted_payload(job)
+    return JSONResponse(status_code=202, content=payload, headers={"Location": payload["status_url"]})
+
+
+def enqueue_when_available(db: Session, user_id: int, image_path: str, **job_fields):
+    """
+    Encola un trabajo "analyze" para la foto ya guardada cuando el servicio de
+    IA no está disponible (circuito abierto). El primer intento espera a que
+    el circuito pueda cerrarse; el trabajo guarda el diagnóstico al terminar.
+    """
+    metrics.incr("diagnosis.deferred_to_queue")
+    logger.warning(f"IA no disponible: diagnóstico de {image_path} encolado")
+    return get_diagnosis_jobs().enqueue(
+        db, "analyze", user_id=user_id, image_path=image_path,
+        delay=settings.LLM_BREAKER_RECOVERY_SECONDS, **job_fields
+    )
+
+
+async def run_analyze_job(job: dict) -> dict:
+    """Handler de la cola para los trabajos "analyze" (mismo flujo que /analyze)"""
+    with usage_scope(job["user_id"], "diagnosis.analyze_job"):
+        diagnosis_data = await get_plant_diagnosis(
+            job["image_path"], job["symptoms"], use_cache=job["use_cache"], prompt_variant=job["prompt_variant"]
+        )
+    if diagnosis_data.get("status") == "queued":
+        # IA no disponible: reintentar cuando el circuito pueda cerrarse
+        raise JobRetryLater(settings.LLM_BREAKER_RECOVERY_SECONDS, "Servicio de IA no disponible")
+    
+    db = SessionLocal()
+    try:
+        diagnosis = persist_diagnosis(db, diagnosis_data, job["image_path"], job["plant_id"] or 0, job["user_id"])
+        return {
+            "diagnosis_id": diagnosis.id,
+            "result": build_diagnosis_response(diagnosis, diagnosis_data).model_dump()
+        }
+    finally:
+        db.close()
+
+
+get_diagnosis_jobs().register("analyze", run_analyze_job)
+
+
+@router.get("/jobs/{job_id}")
+async def get_diagnosis_job(job_id: str, db: Session = Depends(get_db)):
+    """Estado de un diagnóstico en segundo plano; con status "completed" incluye el resultado"""
+    queue = get_diagnosis_jobs()
+    job = queue.get(db, job_id)
+    if not job:
+        raise HTTPException(404, "Trabajo no encontrado")
+    return {**job_to_dict(job), "queue_position": queue.queue_position(db, job)}
+
+
+@router.get("/jobs/{job_id}/events")
+async def diagnosis_job_events(job_id: str):
+    """
+    Estado del trabajo por Server-Sent Events: un evento "status" en cada
+    cambio y, al terminar, "completed" (con el resultado) o "failed".
+    """
+    queue = get_diagnosis_jobs()
+    db = SessionLocal()
+    try:
+        if not queue.get(db, job_id):
+            raise HTTPException(404, "Trabajo no encontrado")
+    finally:
+        db.close()
+    
+    async def event_stream():
+        last = None
+        while True:
+            db = SessionLocal()
+            try:
+                job = queue.get(db, job_id)
+                data = {**job_to_dict(job), "queue_position": queue.queue_position(db, job)}
+            finally:
+                db.close()
+            state = (data["status"], data["attempts"], data["queue_position"])
+            if data["status"] in TERMINAL_STATUSES:
+                yield _sse_event(data["status"], data)
+                return
+            if state != last:
+                yield _sse_event("status", data)
+                last = state
+            else:
+                # Mantener viva la conexión a través de proxies
+                yield ": keep-alive\n\n"
+            # Aviso inmediato si el worker está en este proceso; si no, sondeo
+            await queue.wait_for_change(job_id, timeout=settings.DIAGNOSIS_JOB_POLL_SECONDS)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse_event(event: str, data) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+# Campos del esquema de DiagnosisPrompts.get_diagnosis_prompt que se emiten con su propio evento
+STREAM_FIELDS = frozenset({
+    "species", "health_score", "status", "issues", "symptoms", "causes",
+    "immediate_actions", "long_term_care", "summary", "empathetic_message",
+})
+
+
+def _field_event(field: str, value) -> str:
+    """
+    Evento de un campo del diagnóstico en streaming. Los nombres los decide
+    el modelo: los que no son del esquema van en un evento "partial" para
+    que no se confundan con los de control ("done", "error", "queued"...).
+    """
+    if field in STREAM_FIELDS:
+        return _sse_event(field, value)
+    return _sse_event("partial", {"field": field, "value": value})
+
+
+@router.post("/analyze/stream")
+async def analyze_plant_stream(
+    plant_id: int = Form(0),
+    image: UploadFile = File(...),
+    symptoms: Optional[str] = Form(None),
+    user_id: int = Form(1),
+    use_cache: bool = Form(True),
+    prompt_variant: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    CU-02 en streaming (Server-Sent Events).
+    
+    Emite cada campo del diagnóstico en cuanto el modelo lo genera
+    (species, health_score, status, issues, immediate_actions, ...; los
+    campos fuera del esquema llegan como "partial" con su nombre), luego
+    "diagnosis" con el resultado adaptado al usuario y por último "done"
+    con el diagnosis_id persistido. Los errores llegan como evento "error".
+    Si la IA no está disponible el diagnóstico se encola y el último evento
+    es "queued" con el job id (como la respuesta 202 de /analyze).
+    """
+    if plant_id > 0:
+        plant = db.query(PlantDB).filter(PlantDB.id == plant_id).first()
+        if not plant:
+            raise HTTPException(404, "Planta no encontrada")
+    
+    await get_usage_meter().check_quota(user_id)
+    
+    image_path = await save_image(image)
+    logger.info(f"Imagen guardada en: {image_path} (diagnóstico en streaming)")
+    
+    async def event_stream():
+        started = time.perf_counter()
+        yield _sse_event("accepted", {"image_url": image_path})
+        first_field = True
+        with usage_scope(user_id, "diagnosis.analyze_stream"):
+            async for kind, payload in stream_plant_diagnosis(
+                image_path, symptoms, use_cache=use_cache, prompt_variant=prompt_variant
+            ):
+                if kind == "field":
+                    field, value = payload
+                    if first_field:
+                        metrics.observe("diagnosis.stream.first_field_ms", (time.perf_counter() - started) * 1000)
+                        first_field = False
+                    yield _field_event(field, value)
+                elif kind == "error":
+                    yield _sse_event("error", {"message": payload})
+                    return
+                elif kind == "result":
+                    # La sesión de la petición ya está cerrada cuando se consume el stream
+                    stream_db = SessionLocal()
+                    try:
+                        if payload.get("status") == "queued":
+                            # IA no disponible: el diagnóstico sigue como trabajo en segundo plano
+                            job = enqueue_when_available(
+                                stream_db, user_id=user_id, image_path=image_path, plant_id=plant_id,
+                                symptoms=symptoms, use_cache=use_cache, prompt_variant=prompt_variant
+                            )
+                            queued, diagnosis_id = accepted_payload(job), None
+                        else:
+                            queued, diagnosis_id = None, persist_diagnosis(
+                                stream_db, payload, image_path, plant_id, user_id
+                            ).id
+                    finally:
+                        stream_db.close()
+                    if queued is not None:
+                        yield _sse_event("queued", queued)
+                        return
+                    yield _sse_event("diagnosis", payload)
+                    yield _sse_event("done", {"diagnosis_id": diagnosis_id})
+        metrics.observe("diagnosis.stream.total_ms", (time.perf_counter() - started) * 1000)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/validate-fast")
 async def validate_photo_fast(
     image: UploadFile = File(...),
@@ -146,9 +416,11 @@ async def validate_photo_fast(
     MEJORA #1: Endpoint de validación RÁPIDA para streaming en tiempo real.
     Optimizado para < 2 segundos de respuesta.
     """
+    await get_usage_meter().check_quota(user_id)
+    image_bytes = await read_upload(image)
     try:
-        image_bytes = await image.read()
-        result = await validate_photo_quality_fast(image_bytes)
+        with usage_scope(user_id, "diagnosis.validate_fast"):
+            result = await validate_photo_quality_fast(image_bytes)
         
         logger.info(f"Validación rápida para user {user_id}: {result['success']}")
         
@@ -172,6 +444,131 @@ async def validate_photo_fast(
         }
 
 
+@router.websocket("/ws/guidance")
+async def guidance_stream(websocket: WebSocket, user_id: int = 1):
+    """
+    MEJORA #1: Guía de cámara en tiempo real por WebSocket.
+    
+    El cliente envía frames JPEG de baja resolución como mensajes binarios.
+    El servidor solo puntúa el frame más reciente (los que llegan mientras
+    se procesa otro se descartan) y responde con un JSON por frame:
+    {"type": "guidance", "seq", "success", "voice_guidance", "details", "latency_ms", "dropped"}
+    (o {"type": "timeout" | "error", "seq", ...} si ese frame no se pudo puntuar).
+    """
+    await websocket.accept()
+    try:
+        await get_usage_meter().check_quota(user_id)
+    except QuotaExceededError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1008)
+        return
+    logger.info(f"🎥 Guía por WebSocket iniciada para user {user_id}")
+    
+    latest = {"frame": None, "seq": 0}
+    state = {"received": 0, "processed": 0, "dropped": 0, "last_sent_seq": 0}
+    frame_ready = asyncio.Event()
+    slots = asyncio.Semaphore(max(1, settings.WS_GUIDANCE_MAX_INFLIGHT))
+    send_lock = asyncio.Lock()
+    pending = set()
+    
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            frame = message.get("bytes")
+            if not frame:
+                continue
+            state["received"] += 1
+            metrics.incr("ws.guidance.frames_received")
+            if len(frame) > settings.WS_GUIDANCE_MAX_FRAME_BYTES:
+                metrics.incr("ws.guidance.frames_rejected")
+                async with send_lock:
+                    await websocket.send_json({"type": "error", "message": "Frame demasiado grande"})
+                continue
+            # El último frame gana: si había uno esperando, se descarta
+            if latest["frame"] is not None:
+                state["dropped"] += 1
+                metrics.incr("ws.guidance.frames_dropped")
+            latest["seq"] += 1
+            latest["frame"] = frame
+            frame_ready.set()
+    
+    async def score_frame(frame: bytes, seq: int, received_at: float):
+        try:
+            result = await asyncio.wait_for(
+                validate_photo_quality_fast(frame), timeout=settings.WS_GUIDANCE_FRAME_TIMEOUT
+            )
+            payload = {
+                "type": "guidance",
+                "seq": seq,
+                "success": result["success"],
+                "voice_guidance": result["guidance"],
+                "details": result["details"],
+            }
+        except asyncio.TimeoutError:
+            metrics.incr("ws.guidance.frames_timeout")
+            payload = {"type": "timeout", "seq": seq}
+        except Exception as e:
+            logger.error(f"Error puntuando el frame {seq} de la guía por WebSocket: {e}")
+            metrics.incr("ws.guidance.frames_error")
+            payload = {"type": "error", "seq": seq}
+        finally:
+            slots.release()
+        
+        latency_ms = (time.perf_counter() - received_at) * 1000
+        metrics.observe("ws.guidance.frame_ms", latency_ms)
+        async with send_lock:
+            # Con varios frames en paralelo, no enviar uno más viejo que el último enviado
+            if seq < state["last_sent_seq"]:
+                return
+            state["last_sent_seq"] = seq
+            state["processed"] += 1
+            try:
+                await websocket.send_json({
+                    **payload,
+                    "latency_ms": round(latency_ms, 1),
+                    "dropped": state["dropped"],
+                })
+            except Exception:
+                # El cliente ya se desconectó
+                pass
+    
+    async def process_frames():
+        while True:
+            await slots.acquire()
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, seq = latest["frame"], latest["seq"]
+            latest["frame"] = None
+            if frame is None:
+                slots.release()
+                continue
+            metrics.incr("ws.guidance.frames_processed")
+            task = asyncio.create_task(score_frame(frame, seq, time.perf_counter()))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    
+    receiver = asyncio.create_task(receive_frames())
+    with usage_scope(user_id, "diagnosis.ws_guidance"):
+        # Las tareas de frames heredan el contexto: el consumo se atribuye al usuario
+        processor = asyncio.create_task(process_frames())
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    except Exception as e:
+        logger.warning(f"Guía por WebSocket terminada con error: {e}")
+    finally:
+        for task in (receiver, processor, *pending):
+            task.cancel()
+        logger.info(
+            f"🎥 Guía por WebSocket cerrada para user {user_id}: "
+            f"{state['received']} recibidos, {state['processed']} procesados, {state['dropped']} descartados"
+        )
+
+
 @router.get("/communication-profile/{user_id}")
 async def get_communication_profile(
     user_id: int,
@@ -217,6 +614,7 @@ async def get_communication_profile(
 async def get_capture_guidance(
     image: UploadFile = File(...),
     user_id: int = Form(1),
+    speculative: Optional[bool] = Form(None),
     db: Session = Depends(get_db)
 ):
     """
@@ -226,19 +624,58 @@ async def get_capture_guidance(
     1. Validación de calidad de foto (siempre)
     2. Diagnóstico completo (si calidad >= 40%)
     
+    En modo especulativo (CAPTURE_SPECULATIVE_DIAGNOSIS o speculative=true)
+    validación y diagnóstico arrancan a la vez; si la foto no pasa la
+    validación, el diagnóstico se cancela y su resultado se descarta.
+    
     Retorna:
     - guidance: Recomendaciones para mejorar la foto
     - diagnosis: Diagnóstico de la planta (si calidad >= 40%)
     - quality_score: Puntaje de calidad de la foto (0-100)
     """
+    await get_usage_meter().check_quota(user_id)
+    with usage_scope(user_id, "diagnosis.capture_guidance"):
+        return await _capture_guidance(image, user_id, speculative, db)
+
+
+async def _capture_guidance(
+    image: UploadFile,
+    user_id: int,
+    speculative: Optional[bool],
+    db: Session
+):
+    """Implementación de /capture-guidance (dentro del usage_scope del usuario)"""
+    temp_path = None
     try:
-        # Leer imagen
-        image_bytes = await image.read()
-        logger.info(f"📸 Validando imagen capturada ({len(image_bytes)} bytes)")
+        started = time.perf_counter()
+        speculative = settings.CAPTURE_SPECULATIVE_DIAGNOSIS if speculative is None else speculative
+        mode = "speculative" if speculative else "sequential"
+        
+        # Guardar imagen (el diagnóstico la lee de disco) y leerla para la validación
+        stored = await get_blob_store().put_upload(image)
+        temp_path = stored.path
+        image_bytes = await asyncio.to_thread(Path(temp_path).read_bytes)
+        logger.info(f"📸 Validando imagen capturada ({stored.size} bytes, modo {mode})")
+        
+        async def run_diagnosis():
+            diagnosis_started = time.perf_counter()
+            data = await get_plant_diagnosis(temp_path)
+            metrics.observe(f"capture.{mode}.diagnosis_ms", (time.perf_counter() - diagnosis_started) * 1000)
+            return data
+        
+        diagnosis_task = asyncio.create_task(run_diagnosis()) if speculative else None
         
         # 1. VALIDAR CALIDAD DE LA FOTO (SIEMPRE)
-        validation_result = await validate_photo_quality(image_bytes)
-        quality_score = validation_result.get("overall_quality", 0) * 100
+        validation_started = time.perf_counter()
+        try:
+            validation_result = await validate_photo_quality(image_bytes)
+        except BaseException:
+            if diagnosis_task is not None:
+                diagnosis_task.cancel()
+            raise
+        metrics.observe(f"capture.{mode}.validation_ms", (time.perf_counter() - validation_started) * 1000)
+        validation_details = validation_result.get("details", {})
+        quality_score = validation_details.get("overall", 0) * 100
         
         logger.info(f"📊 Calidad de foto: {quality_score:.1f}%")
         
@@ -247,31 +684,26 @@ async def get_capture_guidance(
         if quality_score >= 40:
             logger.info(f"✅ Calidad suficiente ({quality_score:.1f}%), realizando diagnóstico completo...")
             
-            # Guardar imagen temporalmente
-            import uuid
-            import os
-            temp_filename = f"temp_{uuid.uuid4()}.jpg"
-            temp_path = f"./uploads/{temp_filename}"
-            
-            os.makedirs("./uploads", exist_ok=True)
+            # Realizar diagnóstico completo (o esperar el especulativo ya en curso)
+            diagnosis_data = await diagnosis_task if diagnosis_task is not None else await run_diagnosis()
             
-            with open(temp_path, "wb") as f:
-                f.write(image_bytes)
-            
-            # Realizar diagnóstico completo
-            diagnosis_data = await get_plant_diagnosis(image_bytes)
-            
-            if diagnosis_data.get("success"):
+            if diagnosis_data.get("status") == "queued":
+                # IA no disponible: la foto ya está guardada, el diagnóstico sigue en la cola
+                job = enqueue_when_available(db, user_id=user_id, image_path=temp_path)
+                diagnosis_result = {**accepted_payload(job), "diagnosis_id": None}
+            elif diagnosis_data.get("success"):
                 # Guardar en base de datos
                 diagnosis_db = DiagnosisDB(
                     plant_id=None,
                     user_id=user_id,
-                    image_url=f"/uploads/{temp_filename}",
-                    diagnosis_text=diagnosis_data.get("diagnosis_text", ""),
-                    disease_name=diagnosis_data.get("disease_name", "Desconocido"),
+                    image_url=temp_path,
+                    diagnosis_text=diagnosis_data.get("diagnosis", ""),
+                    disease_name=diagnosis_data.get("disease_name") or "Desconocido",
                     confidence=diagnosis_data.get("confidence", 0.0),
                     severity=diagnosis_data.get("severity", "unknown"),
-                    recommendations=json.dumps(diagnosis_data.get("recommendations", []))
+                    recommendations=json.dumps(diagnosis_data.get("recommendations", [])),
+                    prompt_variant=diagnosis_data.get("prompt_variant"),
+                    prompt_fingerprint=diagnosis_data.get("prompt_fingerprint")
                 )
                 
                 db.add(diagnosis_db)
@@ -280,36 +712,50 @@ async def get_capture_guidance(
                 
                 diagnosis_result = {
                     "diagnosis_id": diagnosis_db.id,
-                    "diagnosis_text": diagnosis_data.get("diagnosis_text"),
+                    "diagnosis_text": diagnosis_data.get("diagnosis"),
                     "disease_name": diagnosis_data.get("disease_name"),
                     "confidence": diagnosis_data.get("confidence"),
                     "severity": diagnosis_data.get("severity"),
-                    "recommendations": diagnosis_data.get("recommendations", [])
+                    "recommendations": diagnosis_data.get("recommendations", []),
+                    "status": "completed"
                 }
                 
                 logger.info(f"✅ Diagnóstico completado: {diagnosis_db.disease_name} (ID: {diagnosis_db.id})")
         else:
             logger.info(f"⚠️ Calidad insuficiente ({quality_score:.1f}%), solo validación")
+            if diagnosis_task is not None:
+                diagnosis_task.cancel()
+                metrics.incr("capture.speculative.discarded")
+        
+        # Sin diagnóstico la imagen queda sin referencias y la recoge el GC del almacén
+        
+        metrics.observe(f"capture.{mode}.total_ms", (time.perf_counter() - started) * 1000)
         
         # 3. PREPARAR RESPUESTA CON VALIDACIÓN + DIAGNÓSTICO (si aplica)
         response = {
             "success": True,
             "quality_score": round(quality_score, 1),
             "validation": {
-                "lighting": round(validation_result.get("lighting", 0) * 100, 1),
-                "focus": round(validation_result.get("focus", 0) * 100, 1),
-                "distance": round(validation_result.get("distance", 0) * 100, 1),
-                "angle": round(validation_result.get("angle", 0) * 100, 1)
+                "lighting": round(validation_details.get("lighting", 0) * 100, 1),
+                "focus": round(validation_details.get("focus", 0) * 100, 1),
+                "distance": round(validation_details.get("distance", 0) * 100, 1),
+                "angle": round(validation_details.get("angle", 0) * 100, 1)
             },
             "guidance": validation_result.get("guidance", "Foto aceptable"),
-            "details": validation_result.get("details", {})
+            "details": validation_details
         }
         
         # Agregar diagnóstico si existe
         if diagnosis_result:
             response["diagnosis"] = diagnosis_result
             response["has_diagnosis"] = True
-            response["message"] = "✅ Diagnóstico completado"
+            if diagnosis_result["status"] == "queued":
+                response["message"] = (
+                    "⏳ Diagnóstico en cola: el servicio de IA no está disponible ahora; "
+                    "consulta el resultado en status_url"
+                )
+            else:
+                response["message"] = "✅ Diagnóstico completado"
         else:
             response["has_diagnosis"] = False
             response["message"] = "⚠️ Mejora la calidad de la foto para obtener un diagnóstico preciso (mínimo 40%)"
@@ -318,6 +764,8 @@ async def get_capture_guidance(
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error en validación de foto: {e}")
         import traceback
@@ -352,10 +800,19 @@ async def get_diagnosis(diagnosis_id: int, request: Request, db: Session = Depen
         "severity": diagnosis.severity,
         "image_url": get_full_image_url(diagnosis.image_url, request),
         "recommendations": json.loads(diagnosis.recommendations) if diagnosis.recommendations else [],
+        "prompt_variant": diagnosis.prompt_variant,
+        "prompt_fingerprint": diagnosis.prompt_fingerprint,
         "created_at": diagnosis.created_at.isoformat()
     }
 
 
+def _add_thumbnails(db: Session, items: List[dict]) -> None:
+    """Añade thumbnail_url/srcset a cada diagnóstico de un listado"""
+    variants = get_thumbnailer().variants_for(db, [item["image_url"] for item in items])
+    for item, image_variants in zip(items, variants):
+        item.update(image_variants)
+
+
 @router.get("/history/{user_id}")
 async def get_diagnosis_history(user_id: int, request: Request, limit: int = 20, db: Session = Depends(get_db)):
     """CU-08: Obtener historial de diagnósticos del usuario."""
@@ -381,6 +838,7 @@ async def get_diagnosis_history(user_id: int, request: Request, limit: int = 20,
             "created_at": diag.created_at.isoformat()
         })
     
+    _add_thumbnails(db, result)
     logger.info(f"Historial obtenido: {len(result)} diagnósticos para usuario {user_id}")
     return {"diagnoses": result, "total": len(result)}
 
@@ -412,6 +870,7 @@ async def get_diagnosis_history_by_plant(plant_id: int, request: Request, limit:
             "created_at": diag.created_at.isoformat()
         })
     
+    _add_thumbnails(db, result)
     return result
 
 
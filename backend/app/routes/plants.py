@@ -1,14 +1,23 @@
 """Rutas para gestión de plantas (CU-04, CU-08, CU-16, CU-20)"""
 from fastapi import APIRouter, Depends, HTTPException, Request, File, Form, UploadFile
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional
-from app.models.database import get_db, PlantDB, UserDB, DiagnosisDB
+from app.config import get_settings
+from app.models.database import get_db, SessionLocal, PlantDB, UserDB, DiagnosisDB
 from app.models.schemas import Plant, PlantCreate, ProgressStats, PlantUpdate
+from app.services.blob_store import get_blob_store
+from app.services.diagnosis_jobs import JobRetryLater, accepted_payload, get_diagnosis_jobs
+from app.services.groq_service import get_plant_diagnosis
+from app.services.thumbnailer import get_thumbnailer
+from app.services.usage_meter import QuotaExceededError, get_usage_meter, usage_scope
 from datetime import datetime
+import json
 import os
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/api/plants", tags=["Plants"])
 
@@ -106,6 +115,8 @@ async def create_plant(plant: PlantCreate, request: Request, db: Session = Depen
 async def get_user_plants(user_id: int, request: Request, db: Session = Depends(get_db)):
     """CU-04, CU-08, CU-16: Obtener inventario de plantas del usuario"""
     plants = db.query(PlantDB).filter(PlantDB.user_id == user_id).order_by(PlantDB.created_at.desc()).all()
+    image_urls = [get_full_image_url(p.image_url, request) for p in plants]
+    variants = get_thumbnailer().variants_for(db, image_urls)
     
     return [
         {
@@ -113,7 +124,8 @@ async def get_user_plants(user_id: int, request: Request, db: Session = Depends(
             "name": p.name,
             "species": p.species,
             "description": p.description,
-            "image_url": get_full_image_url(p.image_url, request),
+            "image_url": image_url,
+            **image_variants,
             "status": p.status,
             "health_score": p.health_score,
             "location": p.location,
@@ -121,7 +133,7 @@ async def get_user_plants(user_id: int, request: Request, db: Session = Depends(
             "last_fertilized": p.last_fertilized.isoformat() if p.last_fertilized else None,
             "created_at": p.created_at.isoformat()
         }
-        for p in plants
+        for p, image_url, image_variants in zip(plants, image_urls, variants)
     ]
 
 
@@ -214,8 +226,10 @@ async def delete_plant(plant_id: int, user_id: int, db: Session = Depends(get_db
     
     logger.info(f"🗑️ Eliminando planta '{plant_name}' (ID: {plant_id}) con {diagnoses_count} diagnósticos")
     
-    # Eliminar diagnósticos asociados (por seguridad, aunque CASCADE debería hacerlo)
-    db.query(DiagnosisDB).filter(DiagnosisDB.plant_id == plant_id).delete()
+    # Eliminar diagnósticos asociados (por seguridad, aunque CASCADE debería hacerlo);
+    # uno a uno para que el almacén de imágenes descuente sus referencias
+    for diagnosis in db.query(DiagnosisDB).filter(DiagnosisDB.plant_id == plant_id):
+        db.delete(diagnosis)
     
     # Eliminar la planta
     db.delete(plant)
@@ -286,11 +300,117 @@ async def fertilize_plant(plant_id: int, db: Session = Depends(get_db)):
 
 
 
+def apply_diagnosis_to_plant(
+    db: Session,
+    plant: PlantDB,
+    diagnosis_data: dict,
+    image_url: str,
+    user_id: int
+) -> dict:
+    """
+    Guarda el diagnóstico en el historial de la planta y actualiza su foto,
+    estado y health_score. Devuelve la respuesta de update-with-diagnosis
+    (con image_url relativa).
+    """
+    diagnosis_db = DiagnosisDB(
+        plant_id=plant.id,
+        user_id=user_id,
+        image_url=image_url,
+        diagnosis_text=diagnosis_data.get("diagnosis", ""),
+        disease_name=diagnosis_data.get("disease_name", "Desconocido"),
+        confidence=diagnosis_data.get("confidence", 0.0),
+        severity=diagnosis_data.get("severity", "unknown"),
+        recommendations=json.dumps(diagnosis_data.get("recommendations", [])),
+        prompt_variant=diagnosis_data.get("prompt_variant"),
+        prompt_fingerprint=diagnosis_data.get("prompt_fingerprint")
+    )
+    
+    db.add(diagnosis_db)
+    
+    # Actualizar la planta con la nueva imagen y estado
+    plant.image_url = image_url
+    plant.status = diagnosis_data.get("severity", "unknown")
+    
+    # Actualizar health_score basado en severity
+    severity_to_health = {
+        "healthy": 100,
+        "low": 80,
+        "moderate": 60,
+        "warning": 60,
+        "high": 40,
+        "critical": 20,
+        "unknown": 70
+    }
+    plant.health_score = severity_to_health.get(
+        diagnosis_data.get("severity", "unknown"),
+        70
+    )
+    
+    db.commit()
+    db.refresh(diagnosis_db)
+    db.refresh(plant)
+    
+    logger.info(f"✅ Planta '{plant.name}' actualizada. Nuevo diagnóstico ID: {diagnosis_db.id}")
+    
+    return {
+        "success": True,
+        "message": f"Planta '{plant.name}' actualizada exitosamente",
+        "diagnosis": {
+            "diagnosis_id": diagnosis_db.id,
+            "diagnosis_text": diagnosis_data.get("diagnosis"),
+            "disease_name": diagnosis_data.get("disease_name"),
+            "confidence": diagnosis_data.get("confidence"),
+            "severity": diagnosis_data.get("severity"),
+            "recommendations": diagnosis_data.get("recommendations", [])
+        },
+        "plant": {
+            "id": plant.id,
+            "name": plant.name,
+            "species": plant.species,
+            "image_url": plant.image_url,
+            "status": plant.status,
+            "health_score": plant.health_score,
+            "last_diagnosis": diagnosis_db.created_at.isoformat() if diagnosis_db.created_at else None,
+            "created_at": plant.created_at.isoformat() if plant.created_at else None
+        }
+    }
+
+
+async def run_plant_update_job(job: dict) -> dict:
+    """Handler de la cola para los trabajos "plant_update" (update-with-diagnosis asíncrono)"""
+    with usage_scope(job["user_id"], "plants.update_with_diagnosis_job"):
+        diagnosis_data = await get_plant_diagnosis(
+            job["image_path"], use_cache=job["use_cache"], prompt_variant=job["prompt_variant"]
+        )
+    if diagnosis_data.get("status") == "queued":
+        raise JobRetryLater(settings.LLM_BREAKER_RECOVERY_SECONDS, "Servicio de IA no disponible")
+    if not diagnosis_data.get("success"):
+        raise RuntimeError("Error al analizar la imagen")
+    
+    db = SessionLocal()
+    try:
+        plant = db.query(PlantDB).filter(
+            PlantDB.id == job["plant_id"],
+            PlantDB.user_id == job["user_id"]
+        ).first()
+        if not plant:
+            raise RuntimeError("Planta no encontrada")
+        image_url = f"/{job['image_path']}"
+        result = apply_diagnosis_to_plant(db, plant, diagnosis_data, image_url, job["user_id"])
+        return {"diagnosis_id": result["diagnosis"]["diagnosis_id"], "result": result}
+    finally:
+        db.close()
+
+
+get_diagnosis_jobs().register("plant_update", run_plant_update_job)
+
+
 @router.put("/{plant_id}/update-with-diagnosis")
 async def update_plant_with_diagnosis(
     plant_id: int,
     image: UploadFile = File(...),
     user_id: int = Form(...),
+    async_mode: bool = Form(False),
     request: Request = None,
     db: Session = Depends(get_db)
 ):
@@ -302,12 +422,10 @@ async def update_plant_with_diagnosis(
     - Agregar un nuevo diagnóstico al historial
     - Actualizar el estado de salud de la planta
     - Actualizar health_score basado en el nuevo diagnóstico
-    """
-    import logging
-    import uuid
-    import os
-    logger = logging.getLogger(__name__)
     
+    Con async_mode=true responde 202 con un job id y el diagnóstico se
+    procesa en segundo plano (ver /api/diagnosis/jobs/{job_id}).
+    """
     try:
         # Buscar la planta
         plant = db.query(PlantDB).filter(
@@ -318,98 +436,37 @@ async def update_plant_with_diagnosis(
         if not plant:
             raise HTTPException(404, "Planta no encontrada o no tienes permiso")
         
-        logger.info(f"📸 Actualizando planta '{plant.name}' (ID: {plant_id}) con nuevo diagnóstico")
-        
-        # Leer imagen
-        image_bytes = await image.read()
-        
-        # Guardar imagen
-        temp_filename = f"plant_{plant_id}_{uuid.uuid4()}.jpg"
-        temp_path = f"./uploads/{temp_filename}"
+        await get_usage_meter().check_quota(user_id)
         
-        os.makedirs("./uploads", exist_ok=True)
+        logger.info(f"📸 Actualizando planta '{plant.name}' (ID: {plant_id}) con nuevo diagnóstico")
         
-        with open(temp_path, "wb") as f:
-            f.write(image_bytes)
+        # Guardar imagen (por bloques, sin cargarla entera en memoria)
+        stored = await get_blob_store().put_upload(image)
+        temp_path = stored.path
+        image_url = f"/{stored.path}"
         
-        image_url = f"/uploads/{temp_filename}"
+        if async_mode:
+            job = get_diagnosis_jobs().enqueue(
+                db, "plant_update", user_id=user_id, image_path=temp_path, plant_id=plant_id
+            )
+            payload = accepted_payload(job)
+            return JSONResponse(status_code=202, content=payload, headers={"Location": payload["status_url"]})
         
         # Realizar diagnóstico
-        from app.services.groq_service import get_plant_diagnosis
-        diagnosis_data = await get_plant_diagnosis(image_bytes)
+        with usage_scope(user_id, "plants.update_with_diagnosis"):
+            diagnosis_data = await get_plant_diagnosis(temp_path)
         
         if not diagnosis_data.get("success"):
             raise HTTPException(400, "Error al analizar la imagen")
         
-        # Crear nuevo diagnóstico
-        import json
-        diagnosis_db = DiagnosisDB(
-            plant_id=plant_id,
-            user_id=user_id,
-            image_url=image_url,
-            diagnosis_text=diagnosis_data.get("diagnosis_text", ""),
-            disease_name=diagnosis_data.get("disease_name", "Desconocido"),
-            confidence=diagnosis_data.get("confidence", 0.0),
-            severity=diagnosis_data.get("severity", "unknown"),
-            recommendations=json.dumps(diagnosis_data.get("recommendations", []))
-        )
-        
-        db.add(diagnosis_db)
-        
-        # Actualizar la planta con la nueva imagen y estado
-        plant.image_url = image_url
-        plant.status = diagnosis_data.get("severity", "unknown")
-        
-        # Actualizar health_score basado en severity
-        severity_to_health = {
-            "healthy": 100,
-            "low": 80,
-            "moderate": 60,
-            "high": 40,
-            "critical": 20,
-            "unknown": 70
-        }
-        plant.health_score = severity_to_health.get(
-            diagnosis_data.get("severity", "unknown"),
-            70
-        )
-        
-        from datetime import datetime
-        plant.last_diagnosis = datetime.utcnow()
-        
-        db.commit()
-        db.refresh(diagnosis_db)
-        db.refresh(plant)
-        
-        logger.info(f"✅ Planta '{plant.name}' actualizada. Nuevo diagnóstico ID: {diagnosis_db.id}")
+        result = apply_diagnosis_to_plant(db, plant, diagnosis_data, image_url, user_id)
         
         # Construir URL completa para la imagen
-        full_image_url = get_full_image_url(plant.image_url, request) if request else plant.image_url
-        
-        return {
-            "success": True,
-            "message": f"Planta '{plant.name}' actualizada exitosamente",
-            "diagnosis": {
-                "diagnosis_id": diagnosis_db.id,
-                "diagnosis_text": diagnosis_data.get("diagnosis_text"),
-                "disease_name": diagnosis_data.get("disease_name"),
-                "confidence": diagnosis_data.get("confidence"),
-                "severity": diagnosis_data.get("severity"),
-                "recommendations": diagnosis_data.get("recommendations", [])
-            },
-            "plant": {
-                "id": plant.id,
-                "name": plant.name,
-                "species": plant.species,
-                "image_url": full_image_url,
-                "status": plant.status,
-                "health_score": plant.health_score,
-                "last_diagnosis": plant.last_diagnosis.isoformat() if plant.last_diagnosis else None,
-                "created_at": plant.created_at.isoformat() if plant.created_at else None
-            }
-        }
+        if request:
+            result["plant"]["image_url"] = get_full_image_url(result["plant"]["image_url"], request)
+        return result
         
-    except HTTPException:
+    except (HTTPException, QuotaExceededError):
         raise
     except Exception as e:
         logger.error(f"❌ Error al actualizar planta: {e}")
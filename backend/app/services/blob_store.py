@@ -0,0 +1,321 @@
+"""
+Almacén de imágenes direccionado por contenido.
+
+Cada imagen se guarda una sola vez en IMAGE_STORE_DIR/ab/cd/<sha256>.<ext>
+(dos niveles de subdirectorios con los primeros bytes del hash), así la
+misma foto diagnosticada, añadida como planta y publicada en la comunidad
+ocupa un único archivo.
+
+Cada blob tiene una fila en image_blobs con ref_count = número de filas de
+diagnoses, plants, community_posts y plant_comparisons que la apuntan. El
+contador se actualiza en el flush de cualquier sesión (ver _track_references),
+de modo que las rutas solo tienen que guardar la ruta del blob en su columna.
+collect_garbage borra los blobs sin referencias pasado un periodo de gracia.
+"""
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import event, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.comparison_models import PlantComparison
+from app.models.database import (
+    CommunityPostDB, DiagnosisDB, DiagnosisJobDB, ImageBlobDB, PlantDB, SessionLocal
+)
+from app.utils.metrics import metrics
+from app.utils.uploads import (
+    IMAGE_FORMATS, SNIFF_BYTES, StoredUpload, hash_file, sniff_image_format, store_upload
+)
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Columnas que referencian imágenes
+TRACKED_COLUMNS: Tuple[Tuple[type, Tuple[str, ...]], ...] = (
+    (DiagnosisDB, ("image_url",)),
+    (PlantDB, ("image_url",)),
+    (CommunityPostDB, ("image_url",)),
+    (PlantComparison, ("before_image_path", "after_image_path")),
+)
+
+_BLOB_PATH_RE = re.compile(r"blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z]+")
+
+
+def blob_hash_from_url(url: Optional[str]) -> Optional[str]:
+    """sha256 de un blob a partir de su ruta o URL ("/uploads/...", "http://.../uploads/...")"""
+    if not url:
+        return None
+    match = _BLOB_PATH_RE.search(url)
+    return match.group(1) if match else None
+
+
+class BlobStore:
+    def __init__(self, root: str, gc_interval: float = 3600.0):
+        self.root = Path(root)
+        self.gc_interval = gc_interval
+        self._gc_task: Optional[asyncio.Task] = None
+
+    def path_for(self, sha256: str, image_format: str) -> Path:
+        extension = IMAGE_FORMATS[image_format][0]
+        return self.root / sha256[:2] / sha256[2:4] / f"{sha256}{extension}"
+
+    async def put_upload(self, upload: UploadFile, max_bytes: Optional[int] = None) -> StoredUpload:
+        """
+        Guarda una imagen subida (mismas validaciones que store_upload) y
+        devuelve la ruta de su blob; si ya existía, la subida se descarta.
+        Las miniaturas se generan en segundo plano (si ya existen no se rehacen).
+        """
+        from app.services.thumbnailer import get_thumbnailer
+
+        incoming = await store_upload(
+            upload, str(self.root / ".incoming" / f"{os.urandom(8).hex()}.jpg"), max_bytes=max_bytes
+        )
+        stored = await asyncio.to_thread(self._commit, Path(incoming.path), incoming)
+        get_thumbnailer().schedule(stored.sha256, stored.path)
+        return stored
+
+    def put_file(self, source: Path, move: bool = False) -> StoredUpload:
+        """Incorpora un archivo existente (migración); con move=True el original desaparece"""
+        with source.open("rb") as f:
+            image_format = sniff_image_format(f.read(SNIFF_BYTES))
+        if image_format is None:
+            raise ValueError(f"{source} no es una imagen admitida")
+        size, sha256 = hash_file(source)
+        stored = StoredUpload(source.as_posix(), size, sha256, image_format, IMAGE_FORMATS[image_format][1])
+        if not move:
+            # Copia temporal para que _commit pueda moverla
+            temporary = self.root / ".incoming" / f"{os.urandom(8).hex()}.part"
+            temporary.parent.mkdir(parents=True, exist_ok=True)
+            with source.open("rb") as src, temporary.open("wb") as dst:
+                while chunk := src.read(settings.UPLOAD_CHUNK_BYTES):
+                    dst.write(chunk)
+            source = temporary
+        return self._commit(source, stored)
+
+    def _commit(self, staged: Path, stored: StoredUpload) -> StoredUpload:
+        """Registra el blob y mueve el archivo a su ruta final (o lo descarta si ya estaba)"""
+        final = self.path_for(stored.sha256, stored.format)
+        self._register(final, stored)
+        if final.exists():
+            staged.unlink(missing_ok=True)
+            metrics.incr("blob_store.dedup_hits")
+            metrics.incr("blob_store.dedup_bytes", stored.size)
+        else:
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, final)
+            metrics.incr("blob_store.stored")
+        return stored._replace(path=final.as_posix())
+
+    @staticmethod
+    def _register(final: Path, stored: StoredUpload) -> None:
+        """Crea la fila del blob con ref_count 0 o la marca como usada ahora (aleja la recolección)"""
+        db = SessionLocal()
+        try:
+            blob = db.get(ImageBlobDB, stored.sha256)
+            if blob is None:
+                db.add(ImageBlobDB(
+                    sha256=stored.sha256,
+                    path=final.as_posix(),
+                    size=stored.size,
+                    format=stored.format,
+                    content_type=stored.content_type,
+                    ref_count=0,
+                ))
+            else:
+                blob.last_referenced_at = datetime.utcnow()
+            db.commit()
+        except IntegrityError:
+            # Otra subida idéntica la registró a la vez
+            db.rollback()
+        finally:
+            db.close()
+
+    def collect_garbage(self, db: Session, grace_seconds: Optional[float] = None) -> int:
+        """
+        Borra los blobs con ref_count <= 0 que no se han usado en el periodo de
+        gracia. Antes de borrar se comprueba que ninguna fila (ni trabajo de
+        diagnóstico pendiente) apunte a ellos, por si el contador se desvió.
+        """
+        grace = settings.IMAGE_STORE_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+        candidates = db.query(ImageBlobDB.sha256, ImageBlobDB.path).filter(
+            ImageBlobDB.ref_count <= 0,
+            or_(ImageBlobDB.last_referenced_at.is_(None), ImageBlobDB.last_referenced_at < cutoff),
+            ImageBlobDB.created_at < cutoff,
+        ).all()
+        removed = 0
+        for sha256, path in candidates:
+            if self._is_referenced(db, sha256):
+                logger.warning(f"Blob {sha256[:12]} sin ref_count pero sigue referenciado (usa recount)")
+                continue
+            # Condicional: si alguien lo referenció entre medias, no se borra
+            deleted = db.query(ImageBlobDB).filter(
+                ImageBlobDB.sha256 == sha256,
+                ImageBlobDB.ref_count <= 0,
+                or_(ImageBlobDB.last_referenced_at.is_(None), ImageBlobDB.last_referenced_at < cutoff),
+            ).delete(synchronize_session=False)
+            db.commit()
+            if deleted:
+                Path(path).unlink(missing_ok=True)
+                # Miniaturas (<sha256>_<tamaño>.<ext>, ver app/utils/thumbnails.py)
+                for derivative in Path(path).parent.glob(f"{sha256}_*"):
+                    derivative.unlink(missing_ok=True)
+                removed += 1
+        metrics.incr("blob_store.collected", removed)
+        return removed
+
+    def _collect_garbage_now(self) -> int:
+        db = SessionLocal()
+        try:
+            return self.collect_garbage(db)
+        finally:
+            db.close()
+
+    async def _run_gc(self) -> None:
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                removed = await asyncio.to_thread(self._collect_garbage_now)
+            except Exception as e:
+                logger.error(f"Error en la recolección de blobs: {e}")
+                continue
+            if removed:
+                logger.info(f"🗑️  {removed} blobs sin referencias eliminados")
+
+    def start(self) -> None:
+        """Recolección periódica (fotos rechazadas, subidas abandonadas, filas borradas)"""
+        if self._gc_task is None and self.gc_interval > 0:
+            self._gc_task = asyncio.create_task(self._run_gc())
+
+    async def stop(self) -> None:
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+
+    @staticmethod
+    def _is_referenced(db: Session, sha256: str) -> bool:
+        pattern = f"%{sha256}%"
+        for model, columns in TRACKED_COLUMNS:
+            for column in columns:
+                if db.query(model).filter(getattr(model, column).like(pattern)).first() is not None:
+                    return True
+        pending = db.query(DiagnosisJobDB).filter(
+            DiagnosisJobDB.image_path.like(pattern),
+            DiagnosisJobDB.status.in_(("queued", "running")),
+        ).first()
+        return pending is not None
+
+    @staticmethod
+    def recount(db: Session) -> Dict[str, int]:
+        """Recalcula todos los ref_count a partir de las tablas (reparación / migración)"""
+        counts: Counter = Counter()
+        for model, columns in TRACKED_COLUMNS:
+            for column in columns:
+                for (value,) in db.query(getattr(model, column)).filter(getattr(model, column).like("%blobs/%")):
+                    sha256 = blob_hash_from_url(value)
+                    if sha256:
+                        counts[sha256] += 1
+        for blob in db.query(ImageBlobDB):
+            blob.ref_count = counts.get(blob.sha256, 0)
+        db.commit()
+        return dict(counts)
+
+
+def _referenced_hashes(obj, columns: Iterable[str], state: str) -> List[str]:
+    """Hashes que la fila referenciaba antes ("old") o referencia ahora ("new")"""
+    hashes = []
+    attributes = inspect(obj).attrs
+    for column in columns:
+        history = attributes[column].history
+        if state == "new":
+            values = list(history.added) + list(history.unchanged)
+        else:
+            values = list(history.deleted) + list(history.unchanged)
+            if not values and not history.added:
+                # Atributo expirado: se carga el valor guardado
+                values = [getattr(obj, column)]
+        hashes.extend(h for h in map(blob_hash_from_url, values) if h)
+    return hashes
+
+
+def _stored_value(session: Session, obj, column: str) -> Optional[str]:
+    """Valor guardado de una columna de una fila persistente, sin pasar por la sesión"""
+    state = inspect(obj)
+    if state.identity is None:
+        return None
+    mapper = state.mapper
+    criteria = [pk == value for pk, value in zip(mapper.primary_key, state.identity)]
+    return session.connection().execute(select(mapper.columns[column]).where(*criteria)).scalar()
+
+
+@event.listens_for(Session, "before_flush")
+def _track_references(session: Session, flush_context, instances) -> None:
+    """Calcula cuánto cambia el ref_count de cada blob con este flush"""
+    # Se recalcula en cada flush: un flush fallido no deja deltas a medias
+    deltas: Counter = Counter()
+    session.info["blob_ref_deltas"] = deltas
+    for model, columns in TRACKED_COLUMNS:
+        for obj in session.new:
+            if isinstance(obj, model):
+                for sha256 in _referenced_hashes(obj, columns, "new"):
+                    deltas[sha256] += 1
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                for sha256 in _referenced_hashes(obj, columns, "old"):
+                    deltas[sha256] -= 1
+        for obj in session.dirty:
+            if not isinstance(obj, model) or obj in session.deleted:
+                continue
+            attributes = inspect(obj).attrs
+            for column in columns:
+                history = attributes[column].history
+                if not history.has_changes():
+                    continue
+                previous = list(history.deleted)
+                if not previous and not history.unchanged:
+                    # Asignado sobre un atributo expirado (p. ej. tras un commit):
+                    # la sesión no conoce el valor anterior, se lee de la base de datos
+                    previous = [_stored_value(session, obj, column)]
+                for sha256 in filter(None, map(blob_hash_from_url, previous)):
+                    deltas[sha256] -= 1
+                for sha256 in filter(None, map(blob_hash_from_url, history.added)):
+                    deltas[sha256] += 1
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_reference_deltas(session: Session, flush_context) -> None:
+    """Aplica los cambios de ref_count en la misma transacción que el flush"""
+    deltas: Counter = session.info.pop("blob_ref_deltas", Counter())
+    now = datetime.utcnow()
+    connection = session.connection()
+    for sha256, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(ImageBlobDB.__table__)
+                .where(ImageBlobDB.__table__.c.sha256 == sha256)
+                .values(ref_count=ImageBlobDB.__table__.c.ref_count + delta, last_referenced_at=now)
+            )
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Instancia compartida del almacén de imágenes"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(settings.IMAGE_STORE_DIR, gc_interval=settings.IMAGE_STORE_GC_INTERVAL_SECONDS)
+    return _blob_store
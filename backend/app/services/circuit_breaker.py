@@ -0,0 +1,132 @@
+"""
+Circuit breaker para el backend del LLM.
+
+- closed: las llamadas pasan; N fallos seguidos del proveedor lo abren.
+- open: las llamadas fallan al instante (CircuitOpenError) para que el
+  llamador use su alternativa local en vez de esperar GROQ_TIMEOUT.
+- half_open: pasado el tiempo de recuperación se deja pasar una llamada de
+  prueba; si responde se cierra, si falla vuelve a abrirse.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: no se intenta la llamada"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """Estado actual (llamar con el lock tomado); open pasa a half_open por tiempo"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        logger.warning(f"Circuito '{self.name}': {self._state} -> {state}")
+        metrics.incr(f"circuit.{self.name}.to_{state}")
+        self._state = state
+        self._probes = 0
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        elif state == self.CLOSED:
+            self._failures = 0
+            self._opened_at = None
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+        metrics.incr(f"circuit.{self.name}.rejected")
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._transition(self.OPEN)
+
+    def _release_probe(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    @contextmanager
+    def guard(self, is_failure: Callable[[BaseException], bool]) -> Iterator[None]:
+        """
+        Protege un bloque: lanza CircuitOpenError si no se permite la llamada.
+        Las excepciones para las que is_failure(e) es False (errores del
+        propio request, cancelaciones) no cuentan como fallo del proveedor.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuito '{self.name}' abierto")
+        try:
+            yield
+        except BaseException as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self._release_probe()
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado para /health"""
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = round(self.recovery_timeout - (time.monotonic() - self._opened_at), 1)
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_seconds": retry_in,
+            }
@@ -0,0 +1,69 @@
+"""
+Caché de diagnósticos direccionada por contenido.
+
+La clave combina sha256(imagen) + huella del prompt (ver PromptRegistry) +
+síntomas normalizados + modelo, de modo que reenviar la misma foto devuelve
+el diagnóstico previo sin llamar a Groq. El modelo es el que respondió (el
+grande si hubo escalado), que no se conoce antes de enrutar: la búsqueda
+prueba cada modelo candidato (ver lookup_diagnosis).
+"""
+import hashlib
+import re
+import unicodedata
+from typing import Any, Dict, Optional, Sequence
+
+from app.config import get_settings
+from app.utils.cache import TieredCache
+
+settings = get_settings()
+
+_diagnosis_cache: Optional[TieredCache] = None
+
+
+def normalize_symptoms(symptoms: Optional[str]) -> str:
+    """Normaliza síntomas para que variaciones triviales compartan entrada"""
+    if not symptoms:
+        return ""
+    text = unicodedata.normalize("NFKC", symptoms).lower()
+    return re.sub(r"\s+", " ", text).strip(" .,;")
+
+
+def build_diagnosis_cache_key(
+    image_sha256: str,
+    symptoms: Optional[str],
+    model: str,
+    prompt_fingerprint: str,
+) -> str:
+    """Clave estable para un diagnóstico (a partir del sha256 de la imagen)"""
+    parts = [image_sha256, prompt_fingerprint, normalize_symptoms(symptoms), model]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+async def lookup_diagnosis(
+    cache: TieredCache,
+    image_sha256: str,
+    symptoms: Optional[str],
+    models: Sequence[str],
+    prompt_fingerprint: str,
+) -> Optional[Dict[str, Any]]:
+    """Primer diagnóstico cacheado de la foto con alguno de los modelos (en orden de preferencia)"""
+    for i, model in enumerate(models):
+        key = build_diagnosis_cache_key(image_sha256, symptoms, model, prompt_fingerprint)
+        cached = await cache.get(key, count_miss=i == len(models) - 1)
+        if cached is not None:
+            return cached
+    return None
+
+
+def get_diagnosis_cache() -> TieredCache:
+    """Instancia compartida de la caché de diagnósticos"""
+    global _diagnosis_cache
+    if _diagnosis_cache is None:
+        _diagnosis_cache = TieredCache(
+            name="diagnosis",
+            db_path=settings.DIAGNOSIS_CACHE_DB_PATH,
+            max_memory_entries=settings.DIAGNOSIS_CACHE_MAX_MEMORY_ENTRIES,
+            max_disk_entries=settings.DIAGNOSIS_CACHE_MAX_DISK_ENTRIES,
+            ttl_seconds=settings.DIAGNOSIS_CACHE_TTL_SECONDS,
+        )
+    return _diagnosis_cache
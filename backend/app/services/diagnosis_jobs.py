@@ -0,0 +1,370 @@
+"""
+Cola de diagnósticos en segundo plano.
+
+En modo asíncrono las rutas guardan la imagen, crean un trabajo en la tabla
+diagnosis_jobs y responden 202 con su id; un grupo acotado de workers los
+procesa y el cliente consulta el estado (GET /api/diagnosis/jobs/{id}) o se
+suscribe por SSE. Como el estado vive en SQLite, los trabajos pendientes
+sobreviven a un reinicio: un trabajo "running" cuyo worker murió se vuelve a
+tomar cuando vence su concesión (DIAGNOSIS_JOB_LEASE_SECONDS).
+
+Cada tipo de trabajo ("analyze", "plant_update") lo ejecuta un handler que
+registra la ruta correspondiente con `register`; el handler recibe el trabajo
+como diccionario y devuelve {"result": ..., "diagnosis_id": ...}. Si lanza
+JobRetryLater (p. ej. con el circuito de Groq abierto) el trabajo vuelve a la
+cola con un retraso en lugar de guardar un diagnóstico "queued".
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import func, or_
+
+from app.config import get_settings
+from app.models.database import DiagnosisJobDB, SessionLocal
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobRetryLater(Exception):
+    """El trabajo no puede completarse ahora; reintentar pasados `delay` segundos"""
+
+    def __init__(self, delay: float, message: str = ""):
+        super().__init__(message or f"Reintentar en {delay:.0f}s")
+        self.delay = delay
+
+
+def job_to_dict(job: DiagnosisJobDB) -> Dict[str, Any]:
+    """Representación pública de un trabajo (la que devuelven las rutas)"""
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "plant_id": job.plant_id,
+        "attempts": job.attempts,
+        "diagnosis_id": job.diagnosis_id,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "retry_after": job.run_after.isoformat() if job.run_after and job.status == "queued" else None,
+    }
+
+
+def accepted_payload(job: DiagnosisJobDB) -> Dict[str, Any]:
+    """Cuerpo de la respuesta 202 al encolar un trabajo"""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/diagnosis/jobs/{job.id}",
+        "events_url": f"/api/diagnosis/jobs/{job.id}/events",
+    }
+
+
+class DiagnosisJobQueue:
+    def __init__(
+        self,
+        workers: int = 2,
+        max_attempts: int = 5,
+        poll_interval: float = 2.0,
+        lease_seconds: float = 300.0,
+        retry_delay: float = 10.0,
+    ):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        self._running = 0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    # ---------- Encolado y consulta (camino de la petición) ----------
+
+    def enqueue(
+        self,
+        db,
+        kind: str,
+        user_id: int,
+        image_path: str,
+        plant_id: Optional[int] = None,
+        symptoms: Optional[str] = None,
+        use_cache: bool = True,
+        prompt_variant: Optional[str] = None,
+        delay: float = 0.0,
+    ) -> DiagnosisJobDB:
+        """Crea el trabajo en la BD y despierta a un worker (delay: segundos antes del primer intento)"""
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        job = DiagnosisJobDB(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            status="queued",
+            user_id=user_id,
+            plant_id=plant_id if plant_id else None,
+            image_path=image_path,
+            symptoms=symptoms,
+            use_cache=use_cache,
+            prompt_variant=prompt_variant,
+            attempts=0,
+            run_after=datetime.utcnow() + timedelta(seconds=delay) if delay > 0 else None,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        metrics.incr("diagnosis_jobs.enqueued")
+        metrics.incr(f"diagnosis_jobs.{kind}.enqueued")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    @staticmethod
+    def get(db, job_id: str) -> Optional[DiagnosisJobDB]:
+        return db.query(DiagnosisJobDB).filter(DiagnosisJobDB.id == job_id).first()
+
+    @staticmethod
+    def queue_position(db, job: DiagnosisJobDB) -> Optional[int]:
+        """Trabajos en cola por delante de este (None si ya no está en cola)"""
+        if job.status != "queued":
+            return None
+        return db.query(DiagnosisJobDB).filter(
+            DiagnosisJobDB.status == "queued",
+            DiagnosisJobDB.created_at < job.created_at,
+        ).count()
+
+    async def wait_for_change(self, job_id: str, timeout: float) -> None:
+        """Espera a que un worker de este proceso cambie el trabajo (o a que venza timeout)"""
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    def _notify(self, job_id: str) -> None:
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    # ---------- Acceso a la BD (en hilos, fuera del event loop) ----------
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Toma el trabajo más antiguo listo para ejecutarse. El UPDATE condicional
+        hace que dos workers (o dos procesos) nunca tomen el mismo trabajo.
+        """
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=self.lease_seconds)
+        ready = or_(
+            (DiagnosisJobDB.status == "queued")
+            & or_(DiagnosisJobDB.run_after.is_(None), DiagnosisJobDB.run_after <= now),
+            (DiagnosisJobDB.status == "running") & (DiagnosisJobDB.started_at < lease_expired),
+        )
+        db = SessionLocal()
+        try:
+            for _ in range(5):
+                candidate = db.query(DiagnosisJobDB).filter(ready).order_by(
+                    DiagnosisJobDB.created_at
+                ).first()
+                if candidate is None:
+                    return None
+                job = {
+                    "id": candidate.id,
+                    "kind": candidate.kind,
+                    "user_id": candidate.user_id,
+                    "plant_id": candidate.plant_id,
+                    "image_path": candidate.image_path,
+                    "symptoms": candidate.symptoms,
+                    "use_cache": candidate.use_cache,
+                    "prompt_variant": candidate.prompt_variant,
+                    "attempts": candidate.attempts + 1,
+                    "created_at": candidate.created_at,
+                }
+                previous_status = candidate.status
+                claimed = db.query(DiagnosisJobDB).filter(
+                    DiagnosisJobDB.id == job["id"],
+                    DiagnosisJobDB.status == previous_status,
+                    DiagnosisJobDB.attempts == job["attempts"] - 1,
+                ).update(
+                    {"status": "running", "started_at": now, "attempts": job["attempts"]},
+                    synchronize_session=False,
+                )
+                db.commit()
+                if claimed:
+                    if previous_status == "running":
+                        metrics.incr("diagnosis_jobs.lease_expired")
+                    return job
+                db.expire_all()
+            return None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _update(job_id: str, **values) -> None:
+        db = SessionLocal()
+        try:
+            db.query(DiagnosisJobDB).filter(DiagnosisJobDB.id == job_id).update(
+                values, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _count_by_status() -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            rows = db.query(DiagnosisJobDB.status, func.count(DiagnosisJobDB.id)).group_by(
+                DiagnosisJobDB.status
+            ).all()
+            return {status: count for status, count in rows}
+        finally:
+            db.close()
+
+    # ---------- Workers ----------
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        kind = job["kind"]
+        handler = self._handlers.get(kind)
+        metrics.observe(
+            "diagnosis_jobs.queue_wait_ms",
+            (datetime.utcnow() - job["created_at"]).total_seconds() * 1000
+        )
+        self._notify(job["id"])
+        started = time.perf_counter()
+        try:
+            if job["attempts"] > self.max_attempts:
+                # Solo llega aquí tras vencer concesiones: el worker murió en cada intento
+                raise RuntimeError(f"Agotados {self.max_attempts} intentos")
+            if handler is None:
+                raise ValueError(f"Tipo de trabajo sin handler: {kind}")
+            outcome = await handler(job)
+        except JobRetryLater as e:
+            if job["attempts"] < self.max_attempts:
+                logger.warning(f"Trabajo {job['id']} aplazado {e.delay:.0f}s: {e}")
+                metrics.incr("diagnosis_jobs.deferred")
+                await asyncio.to_thread(
+                    self._update, job["id"], status="queued", error=str(e),
+                    run_after=datetime.utcnow() + timedelta(seconds=e.delay),
+                )
+            else:
+                await self._fail(job, str(e))
+        except asyncio.CancelledError:
+            # Apagado: el trabajo vuelve a la cola para el próximo arranque
+            await asyncio.to_thread(self._update, job["id"], status="queued")
+            raise
+        except Exception as e:
+            logger.error(f"Trabajo {job['id']} ({kind}) falló en el intento {job['attempts']}: {e}")
+            if job["attempts"] < self.max_attempts:
+                metrics.incr("diagnosis_jobs.retried")
+                await asyncio.to_thread(
+                    self._update, job["id"], status="queued", error=str(e),
+                    run_after=datetime.utcnow() + timedelta(seconds=self.retry_delay * job["attempts"]),
+                )
+            else:
+                await self._fail(job, str(e))
+        else:
+            await asyncio.to_thread(
+                self._update, job["id"], status="completed", error=None,
+                result=json.dumps(outcome.get("result"), ensure_ascii=False, default=str),
+                diagnosis_id=outcome.get("diagnosis_id"),
+                finished_at=datetime.utcnow(),
+            )
+            metrics.incr("diagnosis_jobs.completed")
+            metrics.observe("diagnosis_jobs.run_ms", (time.perf_counter() - started) * 1000)
+        self._notify(job["id"])
+
+    async def _fail(self, job: Dict[str, Any], error: str) -> None:
+        metrics.incr("diagnosis_jobs.failed")
+        await asyncio.to_thread(
+            self._update, job["id"], status="failed", error=error, finished_at=datetime.utcnow()
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                logger.error(f"No se pudo leer la cola de diagnósticos: {e}")
+                job = None
+            if job is None:
+                # Sin trabajo: esperar a un enqueue de este proceso o sondear la BD
+                # (trabajos de otros procesos, reintentos diferidos, concesiones vencidas)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._running += 1
+            try:
+                await self._execute(job)
+            finally:
+                self._running -= 1
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Cola de diagnósticos iniciada con {self.workers} workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def stats(self) -> dict:
+        try:
+            by_status = self._count_by_status()
+        except Exception:
+            by_status = {}
+        return {
+            "workers": len(self._tasks),
+            "running_here": self._running,
+            "by_status": by_status,
+            "watchers": sum(len(w) for w in self._watchers.values()),
+        }
+
+
+_queue: Optional[DiagnosisJobQueue] = None
+
+
+def get_diagnosis_jobs() -> DiagnosisJobQueue:
+    """Cola compartida configurada desde settings (lazy)"""
+    global _queue
+    if _queue is None:
+        _queue = DiagnosisJobQueue(
+            workers=settings.DIAGNOSIS_JOB_WORKERS,
+            max_attempts=settings.DIAGNOSIS_JOB_MAX_ATTEMPTS,
+            poll_interval=settings.DIAGNOSIS_JOB_POLL_SECONDS,
+            lease_seconds=settings.DIAGNOSIS_JOB_LEASE_SECONDS,
+            retry_delay=settings.LLM_BREAKER_RECOVERY_SECONDS,
+        )
+    return _queue
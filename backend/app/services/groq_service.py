@@ -2,25 +2,246 @@
 Servicio para interactuar con Groq AI
 Versión LIMPIA Y OPTIMIZADA - Incluye todas las funciones necesarias
 """
+import asyncio
 import base64
-import logging
-from typing import Dict, Any
+import hashlib
 import json
+import logging
+import random
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator, Set, Tuple
 
-from groq import Groq
+import httpx
+from groq import AsyncGroq
 from app.config import get_settings
-from app.utils.prompts import DiagnosisPrompts
+from app.services.diagnosis_cache import build_diagnosis_cache_key, get_diagnosis_cache, lookup_diagnosis
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.llm_resilience import RETRYABLE_ERRORS, DeadlineExceededError, ResilientCaller
+from app.services.llm_scheduler import LLMOverloadedError, LLMScheduler, Priority, PURPOSE_PRIORITY
+from app.services.model_router import ModelRouter
+from app.services.moderation_batcher import ModerationBatcher
+from app.services.moderation_cache import build_moderation_cache_key, get_moderation_cache
+from app.services.usage_meter import get_usage_meter, usage_scope
+from app.services.blob_store import blob_hash_from_url
+from app.services.image_workers import get_image_workers
+from app.utils.image_processing import preprocess_image_for_llm, validate_image_quality
+from app.utils.json_extraction import coerce_diagnosis, moderation_verdict, parse_llm_json
+from app.utils.json_stream import IncrementalJSONObjectParser
+from app.utils.metrics import metrics
+from app.utils.moderation_filter import keyword_moderation, prefilter
+from app.utils.prompts import DiagnosisPrompts, PromptTemplate, get_prompt_registry, record_prompt_call
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Cliente asíncrono compartido: se crea una sola vez al iniciar la app y
+# reutiliza las conexiones keep-alive del pool en todas las peticiones.
+_async_client: Optional[AsyncGroq] = None
+_service: Optional["GroqService"] = None
+
+
+def init_groq_client() -> AsyncGroq:
+    """Crea (si no existe) el cliente AsyncGroq con su pool de conexiones HTTP."""
+    global _async_client
+    if _async_client is None:
+        limits = httpx.Limits(
+            max_connections=settings.GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GROQ_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.GROQ_KEEPALIVE_EXPIRY,
+        )
+        http_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=httpx.Timeout(settings.GROQ_TIMEOUT),
+        )
+        _async_client = AsyncGroq(
+            api_key=settings.GROQ_API_KEY,
+            base_url=settings.GROQ_BASE_URL or None,
+            timeout=settings.GROQ_TIMEOUT,
+            http_client=http_client,
+            max_retries=0,  # los reintentos los gestiona ResilientCaller (con plazo)
+        )
+        logger.info(
+            f"Cliente Groq asíncrono creado (pool: {settings.GROQ_MAX_CONNECTIONS} conexiones, "
+            f"{settings.GROQ_MAX_KEEPALIVE_CONNECTIONS} keep-alive"
+            f"{', base ' + settings.GROQ_BASE_URL if settings.GROQ_BASE_URL else ''})"
+        )
+    return _async_client
+
+
+async def close_groq_client() -> None:
+    """Cierra el cliente compartido y libera las conexiones del pool."""
+    global _async_client, _service
+    if _async_client is not None:
+        await _async_client.close()
+        logger.info("Cliente Groq asíncrono cerrado")
+    _async_client = None
+    _service = None
+
+
+def get_groq_service() -> "GroqService":
+    """Obtiene el servicio de Groq compartido (lo crea de forma perezosa si hace falta)."""
+    global _service
+    if _service is None:
+        _service = GroqService(init_groq_client())
+    return _service
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas en una sola ejecución.
+
+    La primera llamada con una clave lanza la tarea; las que llegan mientras
+    sigue en vuelo esperan el mismo resultado. Si todos los que esperan se
+    cancelan, la tarea compartida también se cancela.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+            metrics.incr(f"singleflight.{self.name}.executed")
+        else:
+            metrics.incr(f"singleflight.{self.name}.coalesced")
+            logger.info(f"Petición idéntica en vuelo, reutilizando resultado ({key[:12]})")
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if key in self._waiters:
+                self._waiters[key] -= 1
+                if self._waiters[key] <= 0 and not task.done():
+                    task.cancel()
+            raise
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+
+# Coalescencia de llamadas idénticas a Groq (doble envío desde la app, etc.)
+_singleflight = SingleFlight("groq")
+
+
+def get_singleflight() -> SingleFlight:
+    """Agrupador de peticiones en vuelo (para métricas)"""
+    return _singleflight
+
+
+# Planificador compartido: prioridades y presupuesto RPM/TPM del proveedor
+_scheduler: Optional[LLMScheduler] = None
+
+# Tokens que se reservan por imagen (la reserva se corrige con el uso real)
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Planificador de llamadas a Groq (se crea de forma perezosa)"""
+    global _scheduler
+    if _scheduler is None:
+        deadlines = {
+            Priority.GUIDANCE: settings.LLM_QUEUE_DEADLINE_GUIDANCE,
+            Priority.DIAGNOSIS: settings.LLM_QUEUE_DEADLINE_DIAGNOSIS,
+            Priority.COMPARISON: settings.LLM_QUEUE_DEADLINE_COMPARISON,
+            Priority.MODERATION: settings.LLM_QUEUE_DEADLINE_MODERATION,
+        }
+        _scheduler = LLMScheduler(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            queue_deadlines={p: d for p, d in deadlines.items() if d > 0},
+        )
+    return _scheduler
+
+
+_resilient_caller: Optional[ResilientCaller] = None
+
+
+def get_resilient_caller() -> ResilientCaller:
+    """Reintentos + hedging compartidos por todas las llamadas a Groq"""
+    global _resilient_caller
+    if _resilient_caller is None:
+        _resilient_caller = ResilientCaller(
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            hedge_enabled=settings.LLM_HEDGE_ENABLED,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+        )
+    return _resilient_caller
+
+
+_circuit_breaker: Optional[CircuitBreaker] = None
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Circuit breaker del backend de Groq (estado visible en /health)"""
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        _circuit_breaker = CircuitBreaker(
+            "groq",
+            failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.LLM_BREAKER_RECOVERY_SECONDS,
+        )
+    return _circuit_breaker
+
+
+_model_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """Enrutado entre el modelo de visión rápido y el grande"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(
+            fast_model=settings.GROQ_MODEL,
+            large_model=settings.GROQ_LARGE_MODEL,
+            enabled=settings.MODEL_ROUTER_ENABLED,
+            escalation_confidence=settings.MODEL_ROUTER_ESCALATION_CONFIDENCE,
+            low_quality_score=settings.MODEL_ROUTER_LOW_QUALITY_SCORE,
+            max_error_rate=settings.MODEL_ROUTER_MAX_ERROR_RATE,
+            ewma_alpha=settings.MODEL_ROUTER_EWMA_ALPHA,
+            recovery_seconds=settings.LLM_BREAKER_RECOVERY_SECONDS,
+        )
+    return _model_router
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """Fallos atribuibles al proveedor (los 4xx del request no abren el circuito)"""
+    return isinstance(error, RETRYABLE_ERRORS + (DeadlineExceededError,))
+
+
+def _estimate_tokens(prompt: str, max_tokens: int, with_image: bool = False) -> int:
+    """Reserva aproximada de tokens (≈4 caracteres por token + respuesta máxima)"""
+    return len(prompt) // 4 + max_tokens + (IMAGE_TOKEN_ESTIMATE if with_image else 0)
+
+
+def _request_key(*parts: Any) -> str:
+    """Huella de una petición a Groq (modelo, prompt, hash de imagen, parámetros)"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
 
 class GroqService:
     """Servicio para interactuar con la API de Groq AI."""
 
-    def __init__(self):
-        """Inicializa el cliente de Groq"""
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
+    def __init__(self, client: Optional[AsyncGroq] = None):
+        """Usa el cliente asíncrono compartido salvo que se inyecte otro"""
+        self.client = client or init_groq_client()
         self.model = settings.GROQ_MODEL
         self.timeout = getattr(settings, "GROQ_TIMEOUT", 30)
 
@@ -35,10 +256,54 @@ class GroqService:
         prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 2048,
+        purpose: str = "diagnosis",
+        deadline: Optional[float] = None,
+        model: Optional[str] = None,
+        image_sha256: Optional[str] = None,
     ) -> Dict[str, Any]:
-        """Analiza una imagen con un prompt específico usando modelo multimodal de Groq."""
+        """Analiza una imagen con un prompt específico usando modelo multimodal de Groq.
+
+        Llamadas concurrentes idénticas comparten una sola petición a Groq.
+        `purpose` (guidance/validation/diagnosis/comparison) define a qué
+        resolución se reduce la imagen antes de enviarla. `deadline` es el
+        tiempo total (segundos) para reintentos y hedging; por defecto GROQ_TIMEOUT.
+        Sin `model`, lo elige el enrutador según el propósito y el plazo.
+        `image_sha256` evita volver a calcular el hash si ya se conoce.
+        """
+        if model is None:
+            model = get_model_router().choose(purpose, deadline or self.timeout).model
+        image_sha256 = image_sha256 or await get_image_workers().sha256(image_bytes)
+        key = _request_key("image", model, prompt, image_sha256, temperature, max_tokens, purpose)
+        return await _singleflight.do(
+            key,
+            lambda: self._analyze_image(image_bytes, prompt, temperature, max_tokens, purpose, deadline, model),
+        )
+
+    async def _analyze_image(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        purpose: str,
+        deadline: Optional[float] = None,
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Petición real a Groq (sin coalescencia)"""
+        model = model or self.model
         try:
-            base64_image = self.encode_image(image_bytes)
+            # Reducir/recomprimir en el pool de procesos de imagen (trabajo de CPU)
+            started = time.perf_counter()
+            sent_bytes, mime_type, image_stats = await preprocess_image_for_llm(image_bytes, purpose)
+            metrics.observe("llm_image.preprocess_ms", (time.perf_counter() - started) * 1000)
+            metrics.incr(f"llm_image.{purpose}.original_bytes", image_stats["original_bytes"])
+            metrics.incr(f"llm_image.{purpose}.sent_bytes", image_stats["sent_bytes"])
+            logger.info(
+                f"Imagen para Groq ({purpose}): {image_stats['original_bytes']} -> "
+                f"{image_stats['sent_bytes']} bytes"
+            )
+
+            base64_image = self.encode_image(sent_bytes)
 
             messages = [
                 {
@@ -48,21 +313,44 @@ class GroqService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": f"data:{mime_type};base64,{base64_image}"
                             },
                         },
                     ],
                 }
             ]
 
-            logger.info(f"Enviando análisis a Groq con modelo {self.model}")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                timeout=self.timeout,
-            )
+            priority = PURPOSE_PRIORITY.get(purpose, Priority.DIAGNOSIS)
+            estimated_tokens = _estimate_tokens(prompt, max_tokens, with_image=True)
+
+            async def attempt(timeout: float):
+                async with get_llm_scheduler().slot(priority, estimated_tokens) as reservation:
+                    response = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=timeout,
+                    )
+                    reservation["tokens_used"] = getattr(response.usage, "total_tokens", None)
+                    return response
+
+            logger.info(f"Enviando análisis a Groq con modelo {model}")
+            # El modelo grande lleva su propio historial de latencias para el hedging
+            call_name = f"image.{purpose}" if model == self.model else f"image.{purpose}.large"
+            started = time.monotonic()
+            try:
+                # Un duplicado (hedge) solo tiene sentido si no va a esperar en la cola
+                with get_circuit_breaker().guard(_is_upstream_failure):
+                    response = await get_resilient_caller().call(
+                        call_name, attempt, deadline or self.timeout,
+                        hedge_allowed=lambda: get_llm_scheduler().has_idle_capacity(estimated_tokens),
+                    )
+            except Exception as e:
+                if _is_upstream_failure(e):
+                    get_model_router().record(model, None, ok=False)
+                raise
+            get_model_router().record(model, (time.monotonic() - started) * 1000, ok=True)
 
             content = response.choices[0].message.content
             usage = {
@@ -72,38 +360,173 @@ class GroqService:
             }
 
             logger.info(f"Análisis completado. Tokens usados: {usage['total_tokens']}")
-            return {"success": True, "content": content, "usage": usage, "model": self.model}
+            get_usage_meter().record(model, purpose, **usage)
+            return {
+                "success": True,
+                "content": content,
+                "usage": usage,
+                "model": model,
+                "image_bytes": {
+                    "original": image_stats["original_bytes"],
+                    "sent": image_stats["sent_bytes"],
+                },
+            }
 
+        except LLMOverloadedError as e:
+            logger.warning(str(e))
+            return {"success": False, "error": str(e), "shed": True, "content": None, "usage": None}
+        except CircuitOpenError as e:
+            return {"success": False, "error": str(e), "circuit_open": True, "content": None, "usage": None}
         except Exception as e:
             logger.error(f"Error al analizar imagen con Groq: {e}")
             return {"success": False, "error": str(e), "content": None, "usage": None}
 
+    async def stream_image_with_prompt(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        purpose: str = "diagnosis",
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Igual que analyze_image_with_prompt pero devuelve el texto a medida que se genera."""
+        if model is None:
+            model = get_model_router().choose(purpose, self.timeout).model
+        sent_bytes, mime_type, image_stats = await preprocess_image_for_llm(image_bytes, purpose)
+        metrics.incr(f"llm_image.{purpose}.original_bytes", image_stats["original_bytes"])
+        metrics.incr(f"llm_image.{purpose}.sent_bytes", image_stats["sent_bytes"])
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mime_type};base64,{self.encode_image(sent_bytes)}"},
+                    },
+                ],
+            }
+        ]
+
+        priority = PURPOSE_PRIORITY.get(purpose, Priority.DIAGNOSIS)
+        with get_circuit_breaker().guard(_is_upstream_failure):
+            async with get_llm_scheduler().slot(
+                priority, _estimate_tokens(prompt, max_tokens, with_image=True)
+            ):
+                logger.info(f"Enviando análisis en streaming a Groq con modelo {model}")
+                started = time.perf_counter()
+                first_token_ms = None
+                usage = None
+                completion_chars = 0
+                try:
+                    stream = await self.client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=self.timeout,
+                        stream=True,
+                    )
+                    async for chunk in stream:
+                        # Groq informa el consumo en el último fragmento (x_groq.usage)
+                        usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                        if not chunk.choices:
+                            continue
+                        delta = getattr(chunk.choices[0].delta, "content", None)
+                        if delta:
+                            completion_chars += len(delta)
+                            if first_token_ms is None:
+                                first_token_ms = (time.perf_counter() - started) * 1000
+                                metrics.observe("groq.stream.first_token_ms", first_token_ms)
+                            yield delta
+                except Exception as e:
+                    if _is_upstream_failure(e):
+                        get_model_router().record(model, None, ok=False)
+                    raise
+                total_ms = (time.perf_counter() - started) * 1000
+                metrics.observe("groq.stream.total_ms", total_ms)
+                get_model_router().record(model, total_ms, ok=True)
+                if usage is not None:
+                    get_usage_meter().record(
+                        model, purpose,
+                        prompt_tokens=getattr(usage, "prompt_tokens", None),
+                        completion_tokens=getattr(usage, "completion_tokens", None),
+                        total_tokens=getattr(usage, "total_tokens", None),
+                    )
+                else:
+                    # Sin datos del proveedor: misma estimación que usa el planificador
+                    prompt_tokens = _estimate_tokens(prompt, 0, with_image=True)
+                    get_usage_meter().record(
+                        model, purpose,
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_chars // 4,
+                        total_tokens=prompt_tokens + completion_chars // 4,
+                    )
+
     async def analyze_text_only(
         self,
         prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 512,
+        purpose: str = "moderation",
+        deadline: Optional[float] = None,
     ) -> Dict[str, Any]:
-        """Analiza texto sin imagen."""
+        """Analiza texto sin imagen (llamadas idénticas concurrentes se agrupan)."""
+        model = getattr(settings, "GROQ_TEXT_MODEL", self.model)
+        key = _request_key("text", model, prompt, temperature, max_tokens, purpose)
+        return await _singleflight.do(
+            key,
+            lambda: self._analyze_text(model, prompt, temperature, max_tokens, purpose, deadline),
+        )
+
+    async def _analyze_text(
+        self,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        purpose: str,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Petición de texto real a Groq (sin coalescencia)"""
         try:
-            model = getattr(settings, "GROQ_TEXT_MODEL", self.model)
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-                timeout=self.timeout,
-            )
+            priority = PURPOSE_PRIORITY.get(purpose, Priority.MODERATION)
+            estimated_tokens = _estimate_tokens(prompt, max_tokens)
+
+            async def attempt(timeout: float):
+                async with get_llm_scheduler().slot(priority, estimated_tokens) as reservation:
+                    response = await self.client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=timeout,
+                    )
+                    reservation["tokens_used"] = getattr(response.usage, "total_tokens", None)
+                    return response
+
+            with get_circuit_breaker().guard(_is_upstream_failure):
+                response = await get_resilient_caller().call(
+                    f"text.{purpose}", attempt, deadline or self.timeout,
+                    hedge_allowed=lambda: get_llm_scheduler().has_idle_capacity(estimated_tokens),
+                )
             usage = {
                 "prompt_tokens": getattr(response.usage, "prompt_tokens", None),
                 "completion_tokens": getattr(response.usage, "completion_tokens", None),
                 "total_tokens": getattr(response.usage, "total_tokens", None),
             }
+            get_usage_meter().record(model, purpose, **usage)
             return {
                 "success": True,
                 "content": response.choices[0].message.content,
                 "usage": usage
             }
+        except LLMOverloadedError as e:
+            logger.warning(str(e))
+            return {"success": False, "error": str(e), "shed": True}
+        except CircuitOpenError as e:
+            return {"success": False, "error": str(e), "circuit_open": True}
         except Exception as e:
             logger.error(f"Error en análisis de texto: {e}")
             return {"success": False, "error": str(e)}
@@ -111,23 +534,51 @@ class GroqService:
 
 # ========== FUNCIONES DE ALTO NIVEL ==========
 
-async def get_plant_diagnosis(image_path: str, symptoms: str | None = None) -> Dict[str, Any]:
+async def _route_diagnosis(service: GroqService, image_bytes: bytes) -> str:
+    """Modelo para un diagnóstico según la calidad local de la foto y el estado de cada modelo"""
+    router = get_model_router()
+    quality_score = None
+    if router.enabled:
+        try:
+            quality_score = (await validate_image_quality(image_bytes))["overall"]
+        except Exception as e:
+            logger.warning(f"Análisis local de calidad falló: {e}")
+    return router.choose("diagnosis", service.timeout, quality_score).model
+
+
+def _diagnosis_cache_models() -> List[str]:
+    """Modelos que pueden haber respondido un diagnóstico: primero el grande (mejor respuesta)"""
+    router = get_model_router()
+    if not router.enabled:
+        return [router.fast_model]
+    return [router.large_model, router.fast_model]
+
+
+async def get_plant_diagnosis(
+    image_path: str,
+    symptoms: str | None = None,
+    use_cache: bool = True,
+    prompt_variant: str | None = None,
+) -> Dict[str, Any]:
     """
     CU-02: Obtener diagnóstico completo de planta con análisis de imagen.
     
     Args:
         image_path: Ruta al archivo de imagen
         symptoms: Síntomas adicionales reportados por el usuario
+        use_cache: Si es False, ignora la caché de diagnósticos y consulta a Groq
+        prompt_variant: Variante A/B del prompt; None = la del reparto PROMPT_AB_SPLITS
     
     Returns:
-        Diccionario con diagnóstico completo incluyendo weekly_plan
+        Diccionario con diagnóstico completo incluyendo weekly_plan y la
+        procedencia del prompt (prompt_variant, prompt_fingerprint);
+        "success" es False si se devolvieron valores por defecto
     """
-    service = GroqService()
+    service = get_groq_service()
     
     # Leer imagen del disco
     try:
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
+        image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
     except Exception as e:
         logger.error(f"Error leyendo imagen {image_path}: {e}")
         return {
@@ -136,94 +587,264 @@ async def get_plant_diagnosis(image_path: str, symptoms: str | None = None) -> D
             "severity": "unknown",
             "disease_name": None,
             "recommendations": [],
-            "weekly_plan": []
+            "weekly_plan": [],
+            "success": False
         }
     
-    # Obtener prompt de diagnóstico
-    prompt = DiagnosisPrompts.get_diagnosis_prompt()
-    if symptoms:
-        prompt += f"\n\nSÍNTOMAS ADICIONALES REPORTADOS POR EL USUARIO: {symptoms}"
+    # Consultar caché (misma imagen + prompt + síntomas + modelo)
+    image_sha256 = await _image_sha256(image_path, image_bytes)
+    template, prompt = _diagnosis_prompt(image_sha256, symptoms, prompt_variant)
+    provenance = _prompt_provenance(template)
+    cache = get_diagnosis_cache() if (use_cache and settings.DIAGNOSIS_CACHE_ENABLED) else None
+    if cache is not None:
+        cached = await lookup_diagnosis(
+            cache, image_sha256, symptoms, _diagnosis_cache_models(), template.fingerprint
+        )
+        if cached is not None:
+            logger.info(f"Diagnóstico servido desde caché ({image_sha256[:12]})")
+            return {**cached, **provenance, "success": True, "cached": True}
     
     # Analizar con Groq
     logger.info(f"Iniciando diagnóstico completo desde {image_path}")
+    started = time.monotonic()
+    model = await _route_diagnosis(service, image_bytes)
+    call_started = time.monotonic()
     result = await service.analyze_image_with_prompt(
         image_bytes=image_bytes,
+        image_sha256=image_sha256,
         prompt=prompt,
         temperature=0.7,
-        max_tokens=2048
+        max_tokens=2048,
+        purpose="diagnosis",
+        model=model
     )
+    record_prompt_call(template, result, (time.monotonic() - call_started) * 1000)
     
     if not result.get("success"):
         logger.error(f"Error en análisis de Groq: {result.get('error')}")
+        if result.get("circuit_open"):
+            return queued_diagnosis_result()
         return {
             "diagnosis": "Error al analizar la imagen. Por favor intenta nuevamente.",
             "confidence": 0.0,
             "severity": "unknown",
             "disease_name": None,
             "recommendations": ["Intenta tomar otra foto con mejor iluminación"],
-            "weekly_plan": []
+            "weekly_plan": [],
+            "success": False
         }
     
-    # Parsear respuesta JSON
-    try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        diagnosis_data = json.loads(content.strip())
-        
-        # Extraer información clave
-        species = diagnosis_data.get("species", {})
-        health_score = diagnosis_data.get("health_score", 50)
-        status = diagnosis_data.get("status", "warning")
-        issues = diagnosis_data.get("issues", [])
-        immediate_actions = diagnosis_data.get("immediate_actions", [])
-        summary = diagnosis_data.get("summary", "Diagnóstico completado")
-        
-        # Determinar severidad
-        if health_score >= 70:
-            severity = "healthy"
-        elif health_score >= 50:
-            severity = "warning"
+    # Parsear respuesta JSON (tolera markdown, prosa, comas finales y truncado)
+    diagnosis_data = parse_llm_json(result["content"], "diagnosis")
+    
+    # Confianza baja (o respuesta ilegible) del modelo rápido: repetir con el grande si hay tiempo
+    router = get_model_router()
+    confidence = diagnosis_data["species"]["confidence"] if diagnosis_data is not None else 0.0
+    remaining = service.timeout - (time.monotonic() - started)
+    if router.should_escalate("diagnosis", model, confidence, remaining):
+        escalated = await service.analyze_image_with_prompt(
+            image_bytes=image_bytes,
+            image_sha256=image_sha256,
+            prompt=prompt,
+            temperature=0.7,
+            max_tokens=2048,
+            purpose="diagnosis",
+            deadline=remaining,
+            model=router.large_model
+        )
+        escalated_data = parse_llm_json(escalated["content"], "diagnosis") if escalated.get("success") else None
+        if escalated_data is not None:
+            metrics.incr("model_router.escalation_used")
+            diagnosis_data, result = escalated_data, escalated
         else:
-            severity = "critical"
-        
-        # Obtener nombre de enfermedad principal
-        disease_name = None
-        if issues:
-            severe_issues = [i for i in issues if i.get("severity") == "high"]
-            disease_name = severe_issues[0].get("name") if severe_issues else issues[0].get("name")
-        
-        # Construir recomendaciones
-        recommendations = [action.get("action", "") for action in immediate_actions[:5]]
-        
-        # Generar plan semanal
-        weekly_plan = generate_weekly_plan(status, health_score, immediate_actions)
-        
-        logger.info(f"Diagnóstico completado: {severity}, health: {health_score}%")
+            metrics.incr("model_router.escalation_failed")
+    
+    if diagnosis_data is not None:
+        diagnosis_result = build_diagnosis_result(diagnosis_data)
         
-        return {
-            "diagnosis": summary,
-            "confidence": species.get("confidence", 0.7),
-            "severity": severity,
-            "disease_name": disease_name,
-            "recommendations": recommendations if recommendations else ["Monitorear planta diariamente"],
-            "weekly_plan": weekly_plan
-        }
+        # Solo se cachean diagnósticos parseados correctamente, con el modelo que respondió
+        answered_by = result.get("model") or model
+        if cache is not None:
+            cache_key = build_diagnosis_cache_key(image_sha256, symptoms, answered_by, template.fingerprint)
+            await cache.set(cache_key, diagnosis_result)
         
-    except json.JSONDecodeError as e:
-        logger.error(f"Error parseando JSON: {e}")
-        content = result["content"]
-        return {
-            "diagnosis": content[:500],
-            "confidence": 0.5,
-            "severity": "warning",
-            "disease_name": None,
-            "recommendations": ["Consulta diagnóstico completo"],
-            "weekly_plan": []
-        }
+        return {**diagnosis_result, **provenance, "success": True, "cached": False, "model": answered_by}
+    
+    logger.error("No se encontró JSON en la respuesta de diagnóstico")
+    return {
+        "diagnosis": result["content"][:500],
+        "confidence": 0.5,
+        "severity": "warning",
+        "disease_name": None,
+        "recommendations": ["Consulta diagnóstico completo"],
+        "weekly_plan": [],
+        **provenance,
+        "success": False
+    }
+
+
+async def _image_sha256(image_path: str, image_bytes: bytes) -> str:
+    """sha256 de la foto: las del almacén lo llevan en el nombre, el resto se calcula"""
+    return blob_hash_from_url(image_path) or await get_image_workers().sha256(image_bytes)
+
+
+def _diagnosis_prompt(
+    image_sha256: str, symptoms: Optional[str], prompt_variant: Optional[str]
+) -> Tuple[PromptTemplate, str]:
+    """
+    Variante del prompt de diagnóstico para esta foto (asignación estable por
+    hash de imagen) y el texto final con los síntomas del usuario.
+    """
+    registry = get_prompt_registry()
+    template = registry.select(
+        "diagnosis", key=image_sha256, variant=prompt_variant
+    ).template
+    prompt = template.text
+    if symptoms:
+        prompt += registry.get("diagnosis_symptoms").render(symptoms=symptoms)
+    return template, prompt
+
+
+def _prompt_provenance(template: PromptTemplate) -> Dict[str, str]:
+    """Campos que se guardan con el diagnóstico para saber qué prompt lo produjo"""
+    return {"prompt_variant": template.variant, "prompt_fingerprint": template.fingerprint}
+
+
+def queued_diagnosis_result() -> Dict[str, Any]:
+    """
+    Resultado cuando el servicio de IA no está disponible (circuito abierto).
+    No se guarda como diagnóstico: las rutas encolan un trabajo para la foto
+    y los handlers de la cola lo reintentan más tarde.
+    """
+    return {
+        "diagnosis": (
+            "El servicio de diagnóstico no está disponible en este momento. "
+            "Guardamos tu foto y el diagnóstico quedó en cola; vuelve a consultarlo en unos minutos."
+        ),
+        "confidence": 0.0,
+        "severity": "queued",
+        "disease_name": None,
+        "recommendations": ["Vuelve a consultar el diagnóstico en unos minutos"],
+        "weekly_plan": [],
+        "success": False,
+        "status": "queued"
+    }
+
+
+def build_diagnosis_result(diagnosis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte el JSON de DiagnosisPrompts.get_diagnosis_prompt al formato de
+    respuesta (severidad, enfermedad principal, recomendaciones, plan semanal).
+    """
+    # Extraer información clave
+    species = diagnosis_data.get("species", {})
+    health_score = diagnosis_data.get("health_score", 50)
+    status = diagnosis_data.get("status", "warning")
+    issues = diagnosis_data.get("issues", [])
+    immediate_actions = diagnosis_data.get("immediate_actions", [])
+    summary = diagnosis_data.get("summary", "Diagnóstico completado")
+    
+    # Determinar severidad
+    if health_score >= 70:
+        severity = "healthy"
+    elif health_score >= 50:
+        severity = "warning"
+    else:
+        severity = "critical"
+    
+    # Obtener nombre de enfermedad principal
+    disease_name = None
+    if issues:
+        severe_issues = [i for i in issues if i.get("severity") == "high"]
+        disease_name = severe_issues[0].get("name") if severe_issues else issues[0].get("name")
+    
+    # Construir recomendaciones
+    recommendations = [action.get("action", "") for action in immediate_actions[:5]]
+    
+    # Generar plan semanal
+    weekly_plan = generate_weekly_plan(status, health_score, immediate_actions)
+    
+    logger.info(f"Diagnóstico completado: {severity}, health: {health_score}%")
+    
+    return {
+        "diagnosis": summary,
+        "confidence": species.get("confidence", 0.7),
+        "severity": severity,
+        "disease_name": disease_name,
+        "recommendations": recommendations if recommendations else ["Monitorear planta diariamente"],
+        "weekly_plan": weekly_plan
+    }
+
+
+async def stream_plant_diagnosis(
+    image_path: str,
+    symptoms: str | None = None,
+    use_cache: bool = True,
+    prompt_variant: str | None = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    CU-02 en streaming: emite ("field", (clave, valor)) por cada campo del JSON
+    de diagnóstico en cuanto el modelo lo cierra, y al final ("result", dict)
+    con el mismo formato que get_plant_diagnosis.
+    """
+    service = get_groq_service()
+    try:
+        image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
+    except OSError as e:
+        logger.error(f"Error leyendo imagen {image_path}: {e}")
+        yield "error", f"Error al leer imagen: {e}"
+        return
+    
+    image_sha256 = await _image_sha256(image_path, image_bytes)
+    template, prompt = _diagnosis_prompt(image_sha256, symptoms, prompt_variant)
+    provenance = _prompt_provenance(template)
+    cache = get_diagnosis_cache() if (use_cache and settings.DIAGNOSIS_CACHE_ENABLED) else None
+    if cache is not None:
+        cached = await lookup_diagnosis(
+            cache, image_sha256, symptoms, _diagnosis_cache_models(), template.fingerprint
+        )
+        if cached is not None:
+            yield "result", {**cached, **provenance, "success": True, "cached": True}
+            return
+    
+    # En streaming no se escala: los campos ya emitidos no pueden rectificarse
+    model = await _route_diagnosis(service, image_bytes)
+    parser = IncrementalJSONObjectParser()
+    chunks = []
+    try:
+        async for delta in service.stream_image_with_prompt(
+            image_bytes=image_bytes,
+            prompt=prompt,
+            temperature=0.7,
+            max_tokens=2048,
+            purpose="diagnosis",
+            model=model,
+        ):
+            chunks.append(delta)
+            for field in parser.feed(delta):
+                yield "field", field
+    except CircuitOpenError:
+        yield "result", queued_diagnosis_result()
+        return
+    except Exception as e:
+        logger.error(f"Error en diagnóstico en streaming: {e}")
+        yield "error", "Error al analizar la imagen. Por favor intenta nuevamente."
+        return
+    
+    # Si el objeto no llegó a cerrarse (truncado), se intenta reparar el texto completo
+    if parser.finished:
+        diagnosis_data = coerce_diagnosis(parser.fields)
+    else:
+        diagnosis_data = parse_llm_json("".join(chunks), "diagnosis")
+    if diagnosis_data is None:
+        yield "error", "No se pudo interpretar la respuesta del modelo."
+        return
+    
+    diagnosis_result = build_diagnosis_result(diagnosis_data)
+    if cache is not None and parser.finished:
+        cache_key = build_diagnosis_cache_key(image_sha256, symptoms, model, template.fingerprint)
+        await cache.set(cache_key, diagnosis_result)
+    yield "result", {**diagnosis_result, **provenance, "success": True, "cached": False, "model": model}
 
 
 def generate_weekly_plan(status: str, health_score: int, immediate_actions: list) -> list:
@@ -254,6 +875,23 @@ def generate_weekly_plan(status: str, health_score: int, immediate_actions: list
         ]
 
 
+def _failed_validation_response() -> Dict[str, Any]:
+    """Foto rechazada cuando ni el modelo ni el análisis local han podido evaluarla"""
+    return {
+        "success": False,
+        "guidance": "Error al analizar. Intenta de nuevo.",
+        "details": {
+            "lighting": 0.0,
+            "focus": 0.0,
+            "distance": 0.0,
+            "overall": 0.0,
+            "is_centered": False,
+            "plant_detected": False,
+            "recommendations": {"direction": "center", "distance": "ok", "lighting": "ok", "focus": "ok"}
+        }
+    }
+
+
 async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
     """
     CU-01: Validar calidad y encuadre de foto antes del diagnóstico.
@@ -265,7 +903,7 @@ async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
     Returns:
         Diccionario con resultado de validación y mensaje de guía
     """
-    service = GroqService()
+    service = get_groq_service()
     
     # Obtener prompt de validación de encuadre
     prompt = DiagnosisPrompts.get_centering_validation_prompt()
@@ -275,11 +913,19 @@ async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
         image_bytes=image_bytes,
         prompt=prompt,
         temperature=0.3,
-        max_tokens=512
+        max_tokens=512,
+        purpose="validation"
     )
     
     if not result.get("success"):
         logger.error(f"Error en validación de foto: {result.get('error')}")
+        if result.get("circuit_open") or result.get("shed"):
+            # Modo degradado: validador heurístico local
+            try:
+                return _local_validation_response(await validate_image_quality(image_bytes))
+            except Exception as e:
+                logger.warning(f"Análisis local de calidad falló: {e}")
+                return _failed_validation_response()
         return {
             "success": False,
             "guidance": "Error al analizar la foto. Por favor intenta de nuevo.",
@@ -292,21 +938,14 @@ async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
         }
     
     # Parsear respuesta JSON de Groq
-    try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        validation_json = json.loads(content.strip())
-        
-        is_centered = validation_json.get("is_centered", False)
-        plant_detected = validation_json.get("plant_detected", False)
-        confidence = validation_json.get("confidence", 0.0)
-        voice_guidance = validation_json.get("voice_guidance", "No se pudo analizar la imagen")
-        recommendations = validation_json.get("recommendations", {})
-        issues = validation_json.get("issues", [])
+    validation_json = parse_llm_json(result["content"], "validation")
+    if validation_json is not None:
+        is_centered = validation_json["is_centered"]
+        plant_detected = validation_json["plant_detected"]
+        confidence = validation_json["confidence"]
+        voice_guidance = validation_json["voice_guidance"]
+        recommendations = validation_json["recommendations"]
+        issues = validation_json["issues"]
         
         lighting_ok = recommendations.get("lighting", "ok") == "ok"
         focus_ok = recommendations.get("focus", "ok") == "ok"
@@ -336,8 +975,8 @@ async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
             }
         }
         
-    except (json.JSONDecodeError, Exception) as e:
-        logger.warning(f"Error en validación: {e}")
+    else:
+        logger.warning("Error en validación: respuesta sin JSON")
         return {
             "success": False,
             "guidance": "La imagen necesita ajustes. Centra la planta y mejora la iluminación.",
@@ -350,76 +989,103 @@ async def validate_photo_quality(image_bytes: bytes) -> Dict[str, Any]:
         }
 
 
+def _local_validation_decision(analysis: Dict[str, Any]) -> Optional[str]:
+    """
+    Decide si el análisis local basta: "accept", "reject" o None (ambiguo → IA).
+
+    Exposición y enfoque se miden de forma fiable en local; la detección de la
+    planta y su encuadre dependen del color, por eso solo deciden en los extremos.
+    """
+    recommendations = analysis["recommendations"]
+    all_ok = (
+        analysis["plant_detected"]
+        and recommendations["direction"] == "center"
+        and all(recommendations[k] == "ok" for k in ("distance", "lighting", "focus"))
+    )
+    if all_ok and analysis["overall"] >= settings.LOCAL_VALIDATION_ACCEPT_SCORE:
+        return "accept"
+    if analysis["overall"] <= settings.LOCAL_VALIDATION_REJECT_SCORE:
+        return "reject"
+    if recommendations["lighting"] != "ok" or recommendations["focus"] != "ok":
+        return "reject"
+    return None
+
+
+def _local_validation_response(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte el análisis local al formato de respuesta de validación rápida"""
+    return {
+        "success": analysis["overall"] >= 0.7,
+        "guidance": analysis["voice_guidance"],
+        "details": {
+            "lighting": analysis["lighting"],
+            "focus": analysis["focus"],
+            "distance": analysis["distance"],
+            "overall": analysis["overall"],
+            "direction": analysis["direction"],
+            "is_centered": analysis["is_centered"],
+            "plant_detected": analysis["plant_detected"],
+            "recommendations": analysis["recommendations"],
+            "source": "local"
+        }
+    }
+
+
 async def validate_photo_quality_fast(image_bytes: bytes) -> Dict[str, Any]:
     """
     MEJORA #1: Validación RÁPIDA para streaming (optimizada para < 2 segundos).
     Usa prompt más corto y menos tokens que validate_photo_quality().
     
+    Primero se analiza la foto en local (histograma, laplaciano, vegetación);
+    solo si el resultado es ambiguo se consulta al modelo de visión.
+    
     Args:
         image_bytes: Bytes de la imagen a validar
     
     Returns:
         Diccionario con resultado de validación y mensaje de guía
     """
-    service = GroqService()
-    
-    # Prompt ULTRA-CORTO para baja latencia
-    prompt = """Analiza RÁPIDAMENTE esta foto de planta.
-
-Responde SOLO en JSON (sin markdown):
-{
-    "is_centered": true/false,
-    "plant_detected": true/false,
-    "recommendations": {
-        "direction": "center/up/down/left/right",
-        "distance": "closer/farther/ok",
-        "lighting": "more/less/ok",
-        "focus": "refocus/ok"
-    },
-    "voice_guidance": "Mensaje corto en español (máximo 10 palabras)"
-}
-
-Ejemplos:
-- Si planta arriba: "Mueve la cámara hacia arriba"
-- Si muy lejos: "Acércate más"
-- Si todo ok: "Perfecto, lista para capturar"
-"""
+    local_analysis = None
+    if settings.LOCAL_VALIDATION_ENABLED:
+        try:
+            local_analysis = await validate_image_quality(image_bytes)
+        except Exception as e:
+            logger.warning(f"Análisis local de calidad falló: {e}")
+    
+    if local_analysis is not None:
+        decision = _local_validation_decision(local_analysis)
+        if decision is not None:
+            metrics.incr(f"validation.fast.local_{decision}")
+            logger.info(f"Validación rápida local: {decision} (score: {local_analysis['overall']:.2f})")
+            return _local_validation_response(local_analysis)
+    
+    metrics.incr("validation.fast.llm")
+    service = get_groq_service()
+    
+    # Prompt ULTRA-CORTO para baja latencia (variante según PROMPT_AB_SPLITS)
+    template = get_prompt_registry().select("quick_validation").template
+    started = time.monotonic()
     
     result = await service.analyze_image_with_prompt(
         image_bytes=image_bytes,
-        prompt=prompt,
+        prompt=template.text,
         temperature=0.1,
-        max_tokens=150  # Mucho menos que validate_photo_quality (512)
+        max_tokens=150,  # Mucho menos que validate_photo_quality (512)
+        purpose="guidance",  # Imagen reducida: menos bytes y tokens de visión
+        deadline=settings.WS_GUIDANCE_FRAME_TIMEOUT  # Interactivo: mismo plazo que un frame
     )
+    record_prompt_call(template, result, (time.monotonic() - started) * 1000)
     
     if not result.get("success"):
-        return {
-            "success": False,
-            "guidance": "Error al analizar. Intenta de nuevo.",
-            "details": {
-                "lighting": 0.0,
-                "focus": 0.0,
-                "distance": 0.0,
-                "overall": 0.0,
-                "is_centered": False,
-                "plant_detected": False,
-                "recommendations": {"direction": "center", "distance": "ok", "lighting": "ok", "focus": "ok"}
-            }
-        }
+        if local_analysis is not None:
+            return _local_validation_response(local_analysis)
+        return _failed_validation_response()
     
-    try:
-        content = result["content"]
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        validation_json = json.loads(content.strip())
-        
-        is_centered = validation_json.get("is_centered", False)
-        plant_detected = validation_json.get("plant_detected", False)
-        voice_guidance = validation_json.get("voice_guidance", "Ajusta la posición")
-        recommendations = validation_json.get("recommendations", {})
+    validation_json = parse_llm_json(result["content"], "quick_validation")
+    if validation_json is not None:
+        is_centered = validation_json["is_centered"]
+        plant_detected = validation_json["plant_detected"]
+        voice_guidance = validation_json["voice_guidance"]
+        recommendations = validation_json["recommendations"]
         
         lighting_ok = recommendations.get("lighting") == "ok"
         focus_ok = recommendations.get("focus") == "ok"
@@ -450,14 +1116,18 @@ Ejemplos:
                 "focus": round(focus_score, 2),
                 "distance": round(distance_score, 2),
                 "overall": round(overall_score, 2),
+                "direction": recommendations["direction"],
                 "is_centered": is_centered,
                 "plant_detected": plant_detected,
-                "recommendations": recommendations
+                "recommendations": recommendations,
+                "source": "llm"
             }
         }
         
-    except (json.JSONDecodeError, Exception) as e:
-        logger.warning(f"Error en validación rápida: {e}")
+    else:
+        logger.warning("Error en validación rápida: respuesta sin JSON")
+        if local_analysis is not None:
+            return _local_validation_response(local_analysis)
         return {
             "success": False,
             "guidance": "Centra la planta en la imagen",
@@ -473,43 +1143,141 @@ Ejemplos:
         }
 
 
+async def _moderate_single(text: str) -> Optional[bool]:
+    """Una llamada al LLM por texto; None si no hay veredicto"""
+    service = get_groq_service()
+    result = await service.analyze_text_only(
+        prompt=get_prompt_registry().get("moderation").render(text=text),
+        temperature=0.2,
+        max_tokens=20
+    )
+    if not result.get("success"):
+        return None
+    verdict = moderation_verdict(result["content"])
+    logger.info(f"Moderación: {result['content'].strip()} -> {verdict}")
+    return verdict
+
+
+async def _moderate_batch(texts: List[str]) -> List[Optional[bool]]:
+    """Un prompt para varios textos; los que el modelo omite se moderan por separado"""
+    if len(texts) == 1:
+        return [await _moderate_single(texts[0])]
+    
+    service = get_groq_service()
+    items = "\n".join(f"{i}. {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts, 1))
+    # El lote mezcla textos de varios usuarios: se contabiliza aparte
+    with usage_scope(None, "moderation.batch"):
+        result = await service.analyze_text_only(
+            prompt=get_prompt_registry().get("moderation_batch").render(items=items),
+            temperature=0.2,
+            max_tokens=32 + 16 * len(texts)
+        )
+        if not result.get("success"):
+            return [None] * len(texts)
+        
+        data = parse_llm_json(result["content"], "moderation_batch")
+        by_id = data["verdicts"] if data is not None else {}
+        verdicts: List[Optional[bool]] = [by_id.get(i) for i in range(1, len(texts) + 1)]
+        
+        missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        if missing:
+            metrics.incr("moderation.batch.missing_verdicts", len(missing))
+            singles = await asyncio.gather(*(_moderate_single(texts[i]) for i in missing))
+            for i, verdict in zip(missing, singles):
+                verdicts[i] = verdict
+    
+    if settings.MODERATION_BATCH_SHADOW_RATE > 0:
+        for text, verdict in zip(texts, verdicts):
+            if verdict is not None and random.random() < settings.MODERATION_BATCH_SHADOW_RATE:
+                _spawn_background(_shadow_compare(text, verdict))
+    return verdicts
+
+
+async def _shadow_compare(text: str, batch_verdict: bool) -> None:
+    """Repite la moderación de un texto por separado y cuenta si coincide con el lote"""
+    with usage_scope(None, "moderation.shadow"):
+        single = await _moderate_single(text)
+    if single is None:
+        return
+    outcome = "agree" if single == batch_verdict else "disagree"
+    metrics.incr(f"moderation.batch.shadow_{outcome}")
+    if outcome == "disagree":
+        logger.warning(f"Moderación por lote ({batch_verdict}) distinta de la individual ({single})")
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn_background(coro: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+_moderation_batcher: Optional[ModerationBatcher] = None
+
+
+def get_moderation_batcher() -> ModerationBatcher:
+    """Agrupador de moderaciones (comentarios y posts que llegan casi a la vez)"""
+    global _moderation_batcher
+    if _moderation_batcher is None:
+        _moderation_batcher = ModerationBatcher(
+            _moderate_batch,
+            max_batch_size=settings.MODERATION_BATCH_MAX_SIZE,
+            max_wait=settings.MODERATION_BATCH_MAX_WAIT_MS / 1000,
+        )
+    return _moderation_batcher
+
+
 async def moderate_content(text: str) -> bool:
     """
     CU-09: Moderar contenido con IA para comunidad.
     
+    Orden de decisión (cada camino cuenta en moderation.path.*):
+    1. Prefiltro local: términos bloqueados, spam de enlaces y mensajes
+       formados solo por frases habituales se resuelven sin llamar a Groq.
+    2. Caché de veredictos por texto normalizado.
+    3. LLM; con MODERATION_BATCH_ENABLED los textos que llegan casi a la vez
+       se moderan en un solo prompt (ver ModerationBatcher).
+    4. Si el LLM no da veredicto, filtro de palabras clave.
+    
     Args:
         text: Texto a moderar
     
     Returns:
         True si el contenido es apropiado, False si no
     """
-    service = GroqService()
+    if settings.MODERATION_PREFILTER_ENABLED:
+        decision = prefilter(text, max_links=settings.MODERATION_PREFILTER_MAX_LINKS)
+        metrics.incr(f"moderation.prefilter.{decision.reason}")
+        if decision.appropriate is not None:
+            metrics.incr(f"moderation.path.prefilter_{'allow' if decision.appropriate else 'block'}")
+            return decision.appropriate
     
-    prompt = f"""Eres un moderador de contenido para una comunidad de jardinería.
-Analiza si el siguiente texto es apropiado (sin spam, insultos, contenido ofensivo, o información peligrosa).
-
-TEXTO A MODERAR:
-{text}
-
-Responde SOLO con una palabra: APROPIADO o INAPROPIADO"""
+    cache = get_moderation_cache() if settings.MODERATION_CACHE_ENABLED else None
+    cache_key = build_moderation_cache_key(text)
+    if cache is not None:
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            metrics.incr("moderation.path.cache")
+            return cached["appropriate"]
     
     try:
-        result = await service.analyze_text_only(
-            prompt=prompt,
-            temperature=0.2,
-            max_tokens=20
-        )
-        
-        if not result.get("success"):
-            logger.warning("Moderación falló, permitiendo contenido por defecto")
-            return True
-        
-        content = result["content"].strip().upper()
-        is_appropriate = "APROPIADO" in content
-        
-        logger.info(f"Moderación: {content} -> {'✅' if is_appropriate else '❌'}")
-        return is_appropriate
-        
+        if settings.MODERATION_BATCH_ENABLED:
+            verdict = await get_moderation_batcher().submit(text)
+        else:
+            verdict = await _moderate_single(text)
     except Exception as e:
         logger.error(f"Error en moderación: {e}")
-        return True
+        verdict = None
+    
+    if verdict is None:
+        # Modo degradado (IA caída, circuito abierto, cola saturada o respuesta ilegible): filtro local
+        logger.warning("Moderación con IA no disponible, usando filtro de palabras clave")
+        metrics.incr("moderation.path.keyword_fallback")
+        return keyword_moderation(text)
+    
+    metrics.incr("moderation.path.llm")
+    if cache is not None:
+        await cache.set(cache_key, {"appropriate": verdict})
+    return verdict
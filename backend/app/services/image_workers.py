@@ -0,0 +1,195 @@
+"""
+Procesos para el trabajo de imagen que consume CPU.
+
+Decodificar, reducir y recomprimir fotos con Pillow (preparación para el
+LLM, análisis local de calidad, miniaturas) retiene el GIL: en un hilo, unas
+cuantas fotos grandes a la vez frenan todas las demás peticiones del worker.
+Aquí se ejecutan en un ProcessPoolExecutor que se crea al arrancar la app.
+
+La cola está acotada: como mucho workers + IMAGE_WORKER_QUEUE_DEPTH tareas
+en el pool; si no queda hueco en IMAGE_WORKER_QUEUE_TIMEOUT segundos se lanza
+ImageWorkersBusy (503). Sin pool (IMAGE_WORKERS=0, scripts) las funciones se
+ejecutan en un hilo como antes.
+
+Las funciones que se envían deben ser de nivel de módulo y recibir datos
+serializables (bytes, rutas); ver app/utils/image_processing.py.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Por debajo de este tamaño el sha256 se calcula directamente (microsegundos)
+HASH_INLINE_BYTES = 256 * 1024
+
+
+class ImageWorkersBusy(Exception):
+    """La cola de procesos de imagen está llena"""
+
+    def __init__(self, waited: float):
+        super().__init__(f"Cola de procesamiento de imágenes llena tras {waited:.1f}s")
+        self.waited = waited
+
+
+def _timed_call(fn: Callable[..., T], args: Tuple[Any, ...]) -> Tuple[T, float, float]:
+    """Se ejecuta en el proceso worker: resultado e instantes de inicio y fin"""
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def _import_worker_modules() -> None:
+    """Importa en el worker los módulos de imagen para que la primera foto no pague el arranque"""
+    import app.utils.image_processing  # noqa: F401
+    import app.utils.thumbnails  # noqa: F401
+
+
+class ImageWorkers:
+    def __init__(self, workers: int = 2, queue_depth: int = 32, queue_timeout: float = 10.0):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._busy_seconds = 0.0
+        self._started_at = 0.0
+        self._completed = 0
+        self._rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    def _create_pool(self) -> None:
+        # spawn: un fork con hilos del servidor en marcha puede heredar locks tomados
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def start(self) -> None:
+        if self._pool is not None or self.workers <= 0:
+            return
+        self._create_pool()
+        self._slots = asyncio.Semaphore(self.workers + self.queue_depth)
+        self._started_at = time.monotonic()
+        # Los procesos arrancan en segundo plano (spawn + imports tardan segundos);
+        # una foto que llegue antes simplemente espera en la cola
+        self._warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self) -> None:
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _import_worker_modules) for _ in range(self.workers)
+            ))
+        except BrokenProcessPool as e:
+            logger.error(f"No se pudieron arrancar los procesos de imagen: {e}")
+            return
+        logger.info(
+            f"Procesos de imagen listos: {self.workers} workers, cola {self.queue_depth} "
+            f"({time.monotonic() - started:.1f}s)"
+        )
+
+    async def stop(self) -> None:
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            self._warm_up_task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, op: str, fn: Callable[..., T], *args: Any, timeout: Optional[float] = -1) -> T:
+        """
+        Ejecuta fn(*args) en un proceso del pool. `op` nombra la operación en
+        las métricas; `timeout` es la espera máxima por un hueco en la cola
+        (por defecto IMAGE_WORKER_QUEUE_TIMEOUT, None = sin límite, para
+        trabajo en segundo plano).
+        """
+        if self._pool is None:
+            return await asyncio.to_thread(fn, *args)
+
+        submitted = time.time()
+        timeout = self.queue_timeout if timeout == -1 else timeout
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            metrics.incr("image_workers.rejected")
+            raise ImageWorkersBusy(time.time() - submitted)
+
+        self._in_flight += 1
+        pool = self._pool
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                pool, _timed_call, fn, args
+            )
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. sin memoria): se recrea el pool y esta tarea va a un hilo
+            metrics.incr("image_workers.broken")
+            if self._pool is pool:
+                logger.error(f"Pool de imágenes roto durante '{op}'; recreándolo")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._create_pool()
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+        self._busy_seconds += finished - started
+        self._completed += 1
+        metrics.observe("image_workers.queue_wait_ms", max(0.0, started - submitted) * 1000)
+        metrics.observe(f"image_workers.{op}_ms", (finished - started) * 1000)
+        return result
+
+    async def sha256(self, data: bytes) -> str:
+        """sha256 de unos bytes sin bloquear el event loop"""
+        if len(data) < HASH_INLINE_BYTES:
+            return hashlib.sha256(data).hexdigest()
+        # hashlib suelta el GIL: un hilo basta y no hay que copiar los bytes a otro proceso
+        return await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+
+    def stats(self) -> dict:
+        if self._pool is None:
+            return {"workers": 0, "mode": "threads"}
+        uptime = max(time.monotonic() - self._started_at, 1e-9)
+        return {
+            "workers": self.workers,
+            "mode": "processes",
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.workers),
+            "max_pending": self.workers + self.queue_depth,
+            "busy_workers": min(self._in_flight, self.workers),
+            "utilization": round(self._busy_seconds / (self.workers * uptime), 3),
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+
+_image_workers: Optional[ImageWorkers] = None
+
+
+def get_image_workers() -> ImageWorkers:
+    """Pool compartido configurado desde settings (lazy; se arranca en el startup)"""
+    global _image_workers
+    if _image_workers is None:
+        _image_workers = ImageWorkers(
+            workers=settings.IMAGE_WORKERS,
+            queue_depth=settings.IMAGE_WORKER_QUEUE_DEPTH,
+            queue_timeout=settings.IMAGE_WORKER_QUEUE_TIMEOUT,
+        )
+    return _image_workers
@@ -0,0 +1,174 @@
+"""
+Reintentos con backoff y peticiones de cobertura (hedging) para Groq.
+
+- Los errores transitorios (conexión, timeout, 429, 5xx) se reintentan con
+  backoff exponencial y jitter completo, respetando Retry-After.
+- Si un intento tarda más que el p95 observado para ese tipo de llamada, se
+  lanza un duplicado y se usa la primera respuesta que llegue.
+- Todo ocurre dentro del plazo total del llamador: nunca se reintenta ni se
+  espera si el siguiente intento no cabe en el tiempo restante.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import groq
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errores que pueden resolverse solos al reintentar
+RETRYABLE_ERRORS = (
+    groq.APIConnectionError,   # incluye APITimeoutError
+    groq.RateLimitError,
+    groq.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class DeadlineExceededError(Exception):
+    """Se agotó el plazo total del llamador antes de obtener respuesta"""
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Lee la cabecera Retry-After de un error HTTP de Groq, si la trae"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ResilientCaller:
+    """
+    Ejecuta una llamada con reintentos y hedging.
+
+    `fn(timeout)` debe hacer un intento completo con ese timeout en segundos;
+    puede ejecutarse varias veces y en paralelo (hedge).
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 95,
+        hedge_min_samples: int = 20,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[float], Awaitable[T]],
+        deadline: float,
+        hedge_allowed: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        Llama a fn hasta obtener respuesta o agotar intentos/plazo (en segundos).
+
+        hedge_allowed() se consulta antes de lanzar un duplicado (p. ej. para no
+        duplicar cuando el duplicado tendría que esperar en cola).
+        """
+        started = time.monotonic()
+        deadline_at = started + deadline
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                result = await self._hedged(name, fn, attempt, remaining, hedge_allowed)
+                metrics.observe(f"llm.{name}.total_ms", (time.monotonic() - started) * 1000)
+                return result
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                metrics.incr(f"llm.{name}.errors.{type(e).__name__}")
+                if attempt == self.max_attempts:
+                    break
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                delay = max(delay, retry_after_seconds(e) or 0)
+                if time.monotonic() + delay >= deadline_at:
+                    break
+                metrics.incr(f"llm.{name}.retries")
+                logger.warning(
+                    f"Groq ({name}) falló en intento {attempt}: {type(e).__name__}; "
+                    f"reintentando en {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+        metrics.incr(f"llm.{name}.gave_up")
+        if last_error is not None and not isinstance(last_error, asyncio.TimeoutError):
+            raise last_error
+        raise DeadlineExceededError(f"Groq ({name}) no respondió en {deadline:.1f}s")
+
+    async def _timed(self, name: str, label: str, fn: Callable[[float], Awaitable[T]], timeout: float) -> T:
+        started = time.monotonic()
+        result = await asyncio.wait_for(fn(timeout), timeout=timeout)
+        elapsed = (time.monotonic() - started) * 1000
+        metrics.observe(f"llm.{name}.attempt_ms", elapsed)
+        metrics.observe(f"llm.{name}.{label}_ms", elapsed)
+        return result
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """Segundos tras los que se lanza el duplicado (None = sin hedging)"""
+        if not self.hedge_enabled:
+            return None
+        if metrics.sample_count(f"llm.{name}.attempt_ms") < self.hedge_min_samples:
+            return None
+        p = metrics.percentile(f"llm.{name}.attempt_ms", self.hedge_percentile)
+        return p / 1000 if p else None
+
+    async def _hedged(
+        self,
+        name: str,
+        fn: Callable[[float], Awaitable[T]],
+        attempt: int,
+        remaining: float,
+        hedge_allowed: Optional[Callable[[], bool]],
+    ) -> T:
+        primary = asyncio.ensure_future(self._timed(name, f"attempt{attempt}", fn, remaining))
+        hedge_after = self._hedge_delay(name)
+        if hedge_after is None or hedge_after >= remaining:
+            try:
+                return await primary
+            finally:
+                primary.cancel()
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and (hedge_allowed is None or hedge_allowed()):
+                metrics.incr(f"llm.{name}.hedged")
+                hedge_timeout = max(0.001, remaining - hedge_after)
+                tasks.add(asyncio.ensure_future(self._timed(name, "hedge", fn, hedge_timeout)))
+
+            error: Optional[BaseException] = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.incr(f"llm.{name}.hedge_won")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,218 @@
+"""
+Planificador de llamadas al LLM: límite de concurrencia global, presupuesto
+de peticiones y tokens por minuto, y prioridades.
+
+Todas las llamadas a Groq comparten el mismo límite del proveedor. Cuando se
+llega al límite, las peticiones esperan en una cola por prioridad (la guía de
+cámara interactiva pasa antes que un diagnóstico, y este antes que una
+comparación o la moderación). Si la espera supera el plazo de su clase, la
+petición se descarta con LLMOverloadedError en vez de acumular latencia.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.utils.metrics import metrics
+
+
+class Priority(IntEnum):
+    """Clases de prioridad (menor valor = se atiende antes)"""
+    GUIDANCE = 0
+    DIAGNOSIS = 1
+    COMPARISON = 2
+    MODERATION = 3
+
+
+# purpose de GroqService -> clase de prioridad
+PURPOSE_PRIORITY: Dict[str, Priority] = {
+    "guidance": Priority.GUIDANCE,
+    "validation": Priority.GUIDANCE,
+    "diagnosis": Priority.DIAGNOSIS,
+    "comparison": Priority.COMPARISON,
+    "moderation": Priority.MODERATION,
+}
+
+
+class LLMOverloadedError(Exception):
+    """La petición esperó en cola más que el plazo de su clase"""
+
+
+class TokenBucket:
+    """Cubeta que se rellena de forma continua hasta `per_minute` unidades"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` disponibles (0 si ya los hay)"""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float) -> None:
+        if self.enabled:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """Devuelve (o cobra, si es negativo) la diferencia con el consumo estimado"""
+        if self.enabled:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "enqueued_at")
+
+    def __init__(self, priority: Priority, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Cola por prioridad delante del proveedor del LLM.
+
+    Una petición se despacha cuando hay un hueco de concurrencia y presupuesto
+    de RPM/TPM. Se atiende estrictamente por prioridad: si la primera de la
+    cola no cabe en el presupuesto, las de menor prioridad también esperan.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        queue_deadlines: Dict[Priority, float],
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.queue_deadlines = queue_deadlines
+        self.running = 0
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, estimated_tokens: int) -> AsyncIterator[dict]:
+        """
+        Reserva un hueco para una llamada. El bloque puede anotar el consumo
+        real en reservation["tokens_used"] para corregir el presupuesto; si
+        termina con error se asume que no consumió tokens (una cancelación,
+        en cambio, pudo haberlos gastado y no se devuelven).
+        """
+        await self.acquire(priority, estimated_tokens)
+        reservation = {"tokens_used": None}
+        try:
+            yield reservation
+        except Exception:
+            if reservation["tokens_used"] is None:
+                reservation["tokens_used"] = 0
+            raise
+        finally:
+            self.release(estimated_tokens, reservation["tokens_used"])
+
+    async def acquire(self, priority: Priority, estimated_tokens: int) -> None:
+        name = priority.name.lower()
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, estimated_tokens, loop.create_future())
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self._dispatch()
+
+        deadline = self.queue_deadlines.get(priority)
+        try:
+            if not waiter.future.done():
+                done, _ = await asyncio.wait({waiter.future}, timeout=deadline)
+                if not done:
+                    waiter.future.cancel()
+                    self._dispatch()
+                    metrics.incr(f"llm_scheduler.{name}.shed")
+                    raise LLMOverloadedError(
+                        f"Cola del LLM saturada: {name} esperó más de {deadline:.1f}s"
+                    )
+        except asyncio.CancelledError:
+            # Si el hueco ya se había concedido hay que devolverlo
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(estimated_tokens, 0)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            raise
+
+        wait_ms = (time.monotonic() - waiter.enqueued_at) * 1000
+        metrics.observe(f"llm_scheduler.{name}.queue_wait_ms", wait_ms)
+        metrics.incr(f"llm_scheduler.{name}.dispatched")
+
+    def release(self, estimated_tokens: int, tokens_used: Optional[int] = None) -> None:
+        self.running -= 1
+        if tokens_used is not None:
+            self.tokens.refund(estimated_tokens - tokens_used)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue and self.running < self.max_concurrency:
+            waiter = self._queue[0][2]
+            if waiter.future.done():  # cancelada o descartada por plazo
+                heapq.heappop(self._queue)
+                continue
+
+            wait = max(self.requests.time_until(1), self.tokens.time_until(waiter.tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(waiter.tokens)
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def has_idle_capacity(self, estimated_tokens: int = 0) -> bool:
+        """True si una petición nueva se despacharía sin esperar en cola"""
+        if self.running >= self.max_concurrency:
+            return False
+        if any(not waiter.future.done() for _, _, waiter in self._queue):
+            return False
+        return self.requests.time_until(1) == 0 and self.tokens.time_until(estimated_tokens) == 0
+
+    def stats(self) -> Dict[str, object]:
+        """Profundidad de cola por clase y uso del presupuesto (para /metrics)"""
+        depth = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, waiter in self._queue:
+            if not waiter.future.done():
+                depth[priority.name.lower()] += 1
+        for bucket in (self.requests, self.tokens):
+            if bucket.enabled:
+                bucket._refill()
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": depth,
+            "requests_available": round(self.requests.available, 1) if self.requests.enabled else None,
+            "tokens_available": round(self.tokens.available) if self.tokens.enabled else None,
+        }
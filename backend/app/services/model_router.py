@@ -0,0 +1,176 @@
+"""
+Enrutado adaptativo entre el modelo de visión rápido (11B) y el grande (90B).
+
+Cada petición se asigna a un modelo según su propósito, el plazo disponible,
+la calidad local de la foto y la latencia / tasa de error observadas de cada
+modelo (medias móviles exponenciales):
+
+- guía de cámara y validación: siempre el modelo rápido.
+- diagnóstico y comparación: primero el rápido; el grande directamente solo
+  si la foto es de baja calidad, y como escalado si el rápido responde con
+  confianza baja y el grande cabe en el tiempo restante.
+- si un modelo acumula errores se usa el otro; pasado `recovery_seconds`
+  sin fallos nuevos se le vuelve a enviar tráfico para comprobar si se recuperó.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Propósitos que nunca usan el modelo grande (interactivos)
+FAST_ONLY_PURPOSES = ("guidance", "validation")
+
+
+class RoutingDecision(NamedTuple):
+    model: str
+    reason: str
+
+
+class ModelStats:
+    """Latencia y tasa de error de un modelo (EWMA)"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_error_at: Optional[float] = None
+
+    def record(self, latency_ms: Optional[float], ok: bool) -> None:
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok and latency_ms is not None:
+            if self.latency_ms is None:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms += self.alpha * (latency_ms - self.latency_ms)
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        fast_model: str,
+        large_model: str,
+        enabled: bool = True,
+        escalation_confidence: float = 0.6,
+        low_quality_score: float = 0.4,
+        max_error_rate: float = 0.5,
+        ewma_alpha: float = 0.2,
+        recovery_seconds: float = 30.0,
+    ):
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self.enabled = enabled and bool(large_model) and large_model != fast_model
+        self.escalation_confidence = escalation_confidence
+        self.low_quality_score = low_quality_score
+        self.max_error_rate = max_error_rate
+        self.recovery_seconds = recovery_seconds
+        self._stats: Dict[str, ModelStats] = {
+            model: ModelStats(ewma_alpha) for model in {fast_model, large_model} if model
+        }
+        self._lock = threading.Lock()
+
+    def _healthy(self, model: str) -> bool:
+        stats = self._stats[model]
+        if stats.error_rate <= self.max_error_rate:
+            return True
+        return time.monotonic() - stats.last_error_at >= self.recovery_seconds
+
+    def _fits(self, model: str, budget_seconds: Optional[float]) -> bool:
+        """True si la latencia típica del modelo cabe en el plazo (sin datos: sí)"""
+        latency_ms = self._stats[model].latency_ms
+        return budget_seconds is None or latency_ms is None or latency_ms / 1000 < budget_seconds
+
+    def choose(
+        self,
+        purpose: str,
+        deadline: Optional[float] = None,
+        quality_score: Optional[float] = None,
+    ) -> RoutingDecision:
+        """Modelo para una petición nueva (deadline en segundos)"""
+        decision = self._choose(purpose, deadline, quality_score)
+        metrics.incr(f"model_router.{decision.model}.chosen")
+        metrics.incr(f"model_router.reason.{decision.reason}")
+        logger.info(f"Modelo para {purpose}: {decision.model} ({decision.reason})")
+        return decision
+
+    def _choose(
+        self,
+        purpose: str,
+        deadline: Optional[float],
+        quality_score: Optional[float],
+    ) -> RoutingDecision:
+        if not self.enabled:
+            return RoutingDecision(self.fast_model, "single_model")
+        with self._lock:
+            if purpose in FAST_ONLY_PURPOSES:
+                return RoutingDecision(self.fast_model, "interactive")
+
+            fast_ok = self._healthy(self.fast_model)
+            large_ok = self._healthy(self.large_model) and self._fits(self.large_model, deadline)
+            if not fast_ok and large_ok:
+                return RoutingDecision(self.large_model, "fast_unhealthy")
+            if quality_score is not None and quality_score < self.low_quality_score and large_ok:
+                return RoutingDecision(self.large_model, "low_quality")
+            return RoutingDecision(self.fast_model, "default")
+
+    def should_escalate(
+        self,
+        purpose: str,
+        model: str,
+        confidence: Optional[float],
+        remaining: Optional[float],
+    ) -> bool:
+        """
+        True si conviene repetir con el modelo grande: la respuesta del rápido
+        tiene confianza baja y el grande está sano y cabe en `remaining` segundos.
+        """
+        if not self.enabled or purpose in FAST_ONLY_PURPOSES or model != self.fast_model:
+            return False
+        if confidence is None or confidence >= self.escalation_confidence:
+            return False
+        with self._lock:
+            escalate = self._healthy(self.large_model) and self._fits(self.large_model, remaining)
+        metrics.incr("model_router.escalated" if escalate else "model_router.escalation_skipped")
+        logger.info(
+            f"Confianza {confidence:.2f} con {model}: "
+            f"{'escalando a ' + self.large_model if escalate else 'sin escalar (modelo grande no disponible a tiempo)'}"
+        )
+        return escalate
+
+    def record(self, model: str, latency_ms: Optional[float], ok: bool) -> None:
+        """Resultado de una llamada (ok=False solo para fallos del proveedor)"""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                return
+            stats.record(latency_ms, ok)
+        metrics.incr(f"model_router.{model}.{'ok' if ok else 'error'}")
+        if ok and latency_ms is not None:
+            metrics.observe(f"model_router.{model}.latency_ms", latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado por modelo (para /metrics)"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "fast_model": self.fast_model,
+                "large_model": self.large_model,
+                "models": {
+                    model: {
+                        "calls": s.calls,
+                        "errors": s.errors,
+                        "error_rate": round(s.error_rate, 3),
+                        "latency_ms": round(s.latency_ms, 1) if s.latency_ms is not None else None,
+                    }
+                    for model, s in self._stats.items()
+                },
+            }
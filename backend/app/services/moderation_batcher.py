@@ -0,0 +1,73 @@
+"""
+Micro-lotes para la moderación de contenido.
+
+Los textos que llegan dentro de una ventana corta (max_wait segundos, o
+hasta max_batch_size textos) se moderan con una sola llamada al LLM; cada
+llamador recibe el veredicto de su propio texto. Textos idénticos dentro
+del mismo lote se envían una sola vez.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Recibe textos únicos y devuelve un veredicto por texto (None = sin veredicto)
+BatchFn = Callable[[List[str]], Awaitable[List[Optional[bool]]]]
+
+
+class ModerationBatcher:
+    def __init__(self, moderate_batch: BatchFn, max_batch_size: int = 16, max_wait: float = 0.025):
+        self.moderate_batch = moderate_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> Optional[bool]:
+        """Veredicto del texto: True apropiado, False inapropiado, None sin veredicto"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.monotonic()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        now = time.monotonic()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        metrics.incr("moderation.batch.calls")
+        metrics.incr("moderation.batch.items", len(batch))
+        metrics.observe("moderation.batch.size", len(texts))
+        metrics.observe("moderation.batch.flush_wait_ms", (now - batch[0][2]) * 1000)
+
+        try:
+            verdicts = dict(zip(texts, await self.moderate_batch(texts)))
+        except Exception as e:
+            logger.error(f"Moderación por lotes falló: {e}")
+            verdicts = {}
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(verdicts.get(text))
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "in_flight_batches": len(self._tasks)}
@@ -0,0 +1,44 @@
+"""
+Caché de veredictos de moderación.
+
+La clave es sha256 del texto normalizado (minúsculas, sin tildes, espacios
+y signos de los extremos colapsados) + huellas de los prompts de moderación
+(cambian solas al editar las plantillas), así los
+comentarios repetidos ("gracias por la info") no vuelven a llegar al LLM.
+"""
+import hashlib
+from typing import Optional
+
+from app.config import get_settings
+from app.utils.cache import TieredCache
+from app.utils.moderation_filter import normalize_text
+from app.utils.prompts import get_prompt_registry
+
+settings = get_settings()
+
+_moderation_cache: Optional[TieredCache] = None
+
+
+def build_moderation_cache_key(text: str) -> str:
+    normalized = normalize_text(text).strip(" .,;:!¡?¿")
+    return hashlib.sha256(f"{moderation_prompt_version()}\x1f{normalized}".encode("utf-8")).hexdigest()
+
+
+def moderation_prompt_version() -> str:
+    """Huella conjunta de los prompts individual y por lotes (ambos llenan la caché)"""
+    registry = get_prompt_registry()
+    return registry.get("moderation").fingerprint + registry.get("moderation_batch").fingerprint
+
+
+def get_moderation_cache() -> TieredCache:
+    """Instancia compartida de la caché de moderación"""
+    global _moderation_cache
+    if _moderation_cache is None:
+        _moderation_cache = TieredCache(
+            name="moderation",
+            db_path=settings.MODERATION_CACHE_DB_PATH,
+            max_memory_entries=settings.MODERATION_CACHE_MAX_MEMORY_ENTRIES,
+            max_disk_entries=settings.MODERATION_CACHE_MAX_DISK_ENTRIES,
+            ttl_seconds=settings.MODERATION_CACHE_TTL_SECONDS,
+        )
+    return _moderation_cache
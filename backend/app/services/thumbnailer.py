@@ -0,0 +1,145 @@
+"""
+Generación de miniaturas en segundo plano.
+
+Al guardar un blob nuevo, BlobStore.put_upload llama a `schedule`; las
+miniaturas (THUMBNAIL_SIZES en WebP y JPEG, ver app/utils/thumbnails.py) se
+generan en el pool de procesos de imagen (app/services/image_workers.py),
+como mucho THUMBNAIL_WORKERS a la vez para dejar sitio a las peticiones, y
+al terminar se anotan en image_blobs.derivatives. Como los blobs se
+deduplican, una foto repetida no se vuelve a procesar.
+
+Los listados usan `variants_for` para añadir thumbnail_url/srcset con una
+sola consulta por página.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models.database import ImageBlobDB, SessionLocal
+from app.services.blob_store import blob_hash_from_url
+from app.services.image_workers import get_image_workers
+from app.utils.metrics import metrics
+from app.utils.thumbnails import derivative_path, image_variants, render_derivatives
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+def parse_sizes(value: str) -> Tuple[int, ...]:
+    """"128,384,1024" -> (128, 384, 1024)"""
+    return tuple(sorted({int(part) for part in value.split(",") if part.strip()}))
+
+
+class Thumbnailer:
+    def __init__(self, workers: int = 1, sizes: Iterable[int] = (128, 384, 1024), quality: int = 80):
+        self.workers = workers
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and bool(self.sizes)
+
+    def schedule(self, sha256: str, path: str) -> None:
+        """Encola la generación de las miniaturas de un blob (no espera)"""
+        if not self.enabled or sha256 in self._pending:
+            return
+        self._pending.add(sha256)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        task = asyncio.get_running_loop().create_task(self._generate(sha256, path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _generate(self, sha256: str, path: str) -> None:
+        try:
+            if await asyncio.to_thread(self._is_done, sha256, path):
+                return
+            async with self._slots:
+                # Segundo plano: espera su turno en la cola sin límite
+                derivatives = await get_image_workers().run(
+                    "thumbnails", render_derivatives, path, self.sizes, self.quality, timeout=None
+                )
+            await asyncio.to_thread(self._save, sha256, derivatives)
+            metrics.incr("thumbnails.generated")
+        except Exception as e:
+            metrics.incr("thumbnails.failed")
+            logger.warning(f"No se pudieron generar las miniaturas de {sha256[:12]}: {e}")
+        finally:
+            self._pending.discard(sha256)
+
+    def generate_now(self, sha256: str, path: str) -> Dict[str, List[int]]:
+        """Genera las miniaturas en este proceso (scripts de migración)"""
+        derivatives = render_derivatives(path, self.sizes, self.quality)
+        self._save(sha256, derivatives)
+        return derivatives
+
+    def _is_done(self, sha256: str, path: str) -> bool:
+        db = SessionLocal()
+        try:
+            row = db.query(ImageBlobDB.derivatives).filter(ImageBlobDB.sha256 == sha256).first()
+        finally:
+            db.close()
+        if row is None or not row.derivatives:
+            return False
+        done = {int(size) for size in json.loads(row.derivatives)}
+        return done == set(self.sizes) and derivative_path(path, max(self.sizes), "webp").exists()
+
+    @staticmethod
+    def _save(sha256: str, derivatives: Dict[str, List[int]]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ImageBlobDB).filter(ImageBlobDB.sha256 == sha256).update(
+                {"derivatives": json.dumps(derivatives)}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def lookup(db: Session, image_urls: Iterable[Optional[str]]) -> Dict[str, Dict[str, List[int]]]:
+        """Derivados disponibles por sha256 para un conjunto de URLs (una consulta)"""
+        hashes = {sha256 for sha256 in map(blob_hash_from_url, image_urls) if sha256}
+        if not hashes:
+            return {}
+        rows = db.query(ImageBlobDB.sha256, ImageBlobDB.derivatives).filter(
+            ImageBlobDB.sha256.in_(hashes), ImageBlobDB.derivatives.isnot(None)
+        )
+        return {sha256: json.loads(derivatives) for sha256, derivatives in rows}
+
+    def variants_for(self, db: Session, image_urls: List[Optional[str]]) -> List[dict]:
+        """thumbnail_url/srcset/srcset_jpeg para cada URL, en el mismo orden"""
+        available = self.lookup(db, image_urls)
+        return [image_variants(url, available.get(blob_hash_from_url(url))) for url in image_urls]
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        # Esperar a que terminen de cancelarse antes de cerrar el pool y la BD
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"concurrency": self.workers, "pending": len(self._pending)}
+
+
+_thumbnailer: Optional[Thumbnailer] = None
+
+
+def get_thumbnailer() -> Thumbnailer:
+    """Generador compartido configurado desde settings (lazy)"""
+    global _thumbnailer
+    if _thumbnailer is None:
+        _thumbnailer = Thumbnailer(
+            workers=settings.THUMBNAIL_WORKERS,
+            sizes=parse_sizes(settings.THUMBNAIL_SIZES),
+            quality=settings.THUMBNAIL_QUALITY,
+        )
+    return _thumbnailer
@@ -0,0 +1,243 @@
+"""
+Medición del consumo de tokens del LLM por usuario, endpoint y modelo.
+
+Cada respuesta de Groq suma sus tokens en un búfer en memoria agrupado por
+minuto, usuario, endpoint y modelo; una tarea de fondo vuelca el búfer a la
+tabla llm_usage cada USAGE_FLUSH_SECONDS, así el camino de la petición no
+hace ninguna consulta extra a la base de datos.
+
+Las rutas declaran quién consume con `usage_scope(user_id, endpoint)` y,
+antes de llamar al LLM, comprueban la cuota diaria con `check_quota`.
+"""
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+
+from app.config import get_settings
+from app.models.database import LLMUsageDB, SessionLocal
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class UsageScope(NamedTuple):
+    user_id: Optional[int]
+    endpoint: str
+
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("llm_usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(user_id: Optional[int], endpoint: str) -> Iterator[None]:
+    """Atribuye las llamadas al LLM hechas dentro del bloque a un usuario y endpoint"""
+    token = _scope.set(UsageScope(user_id, endpoint))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class QuotaExceededError(Exception):
+    """El usuario agotó su cuota diaria de tokens"""
+
+    def __init__(self, user_id: int, used: int, limit: int):
+        super().__init__(f"Usuario {user_id}: cuota diaria de tokens agotada ({used}/{limit})")
+        self.user_id = user_id
+        self.used = used
+        self.limit = limit
+
+
+# (minuto, user_id, endpoint, modelo) -> [requests, prompt, completion, total]
+_Key = Tuple[datetime, Optional[int], str, str]
+
+
+class UsageMeter:
+    def __init__(self, flush_interval: float = 10.0, daily_token_quota: int = 0):
+        self.flush_interval = flush_interval
+        self.daily_token_quota = daily_token_quota
+        self._buffer: Dict[_Key, List[int]] = {}
+        # Tokens del día por usuario (base leída de la BD + lo medido desde entonces)
+        self._daily: Dict[Tuple[date, int], int] = {}
+        self._lock = threading.Lock()
+        # Serializa volcado (vaciar búfer + escribir) y lectura de la base del día
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Medición (camino de la petición) ----------
+
+    def record(
+        self,
+        model: str,
+        purpose: str,
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int],
+        total_tokens: Optional[int],
+    ) -> None:
+        """Suma una respuesta del LLM al búfer (sin E/S)"""
+        scope = _scope.get()
+        user_id = scope.user_id if scope else None
+        endpoint = scope.endpoint if scope else purpose
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        total_tokens = total_tokens or (prompt_tokens + completion_tokens)
+
+        now = datetime.utcnow()
+        key = (now.replace(second=0, microsecond=0), user_id, endpoint, model)
+        with self._lock:
+            row = self._buffer.setdefault(key, [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += prompt_tokens
+            row[2] += completion_tokens
+            row[3] += total_tokens
+            daily_key = (now.date(), user_id)
+            if daily_key in self._daily:
+                self._daily[daily_key] += total_tokens
+        metrics.incr(f"llm_usage.{endpoint}.tokens", total_tokens)
+
+    # ---------- Cuotas ----------
+
+    async def tokens_used_today(self, user_id: int) -> int:
+        today = datetime.utcnow().date()
+        with self._lock:
+            used = self._daily.get((today, user_id))
+        if used is not None:
+            return used
+
+        # Primera consulta del día para este usuario: base desde la BD + búfer pendiente
+        return await asyncio.to_thread(self._init_daily, user_id, today)
+
+    def _init_daily(self, user_id: int, today: date) -> int:
+        # Con _flush_lock ningún volcado está a medio escribir: cada token está
+        # o en la BD o en el búfer, nunca en ninguno (ni en los dos)
+        with self._flush_lock:
+            stored = self._load_daily_total(user_id, today)
+            with self._lock:
+                if (today, user_id) not in self._daily:
+                    pending = sum(
+                        row[3] for (bucket, uid, _, _), row in self._buffer.items()
+                        if uid == user_id and bucket.date() == today
+                    )
+                    self._daily = {k: v for k, v in self._daily.items() if k[0] == today}
+                    self._daily[(today, user_id)] = stored + pending
+                return self._daily[(today, user_id)]
+
+    @staticmethod
+    def _load_daily_total(user_id: int, day: date) -> int:
+        start = datetime.combine(day, dt_time.min)
+        db = SessionLocal()
+        try:
+            total = db.query(func.sum(LLMUsageDB.total_tokens)).filter(
+                LLMUsageDB.user_id == user_id,
+                LLMUsageDB.bucket >= start,
+                LLMUsageDB.bucket < start + timedelta(days=1),
+            ).scalar()
+            return int(total or 0)
+        finally:
+            db.close()
+
+    async def check_quota(self, user_id: Optional[int]) -> None:
+        """Lanza QuotaExceededError si el usuario ya gastó su cuota diaria"""
+        if not self.daily_token_quota or user_id is None:
+            return
+        used = await self.tokens_used_today(user_id)
+        if used >= self.daily_token_quota:
+            metrics.incr("llm_usage.quota_rejected")
+            raise QuotaExceededError(user_id, used, self.daily_token_quota)
+
+    # ---------- Volcado a la base de datos ----------
+
+    def _drain(self) -> Dict[_Key, List[int]]:
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+        return buffer
+
+    def _write(self, buffer: Dict[_Key, List[int]]) -> None:
+        db = SessionLocal()
+        try:
+            for (bucket, user_id, endpoint, model), (requests, prompt, completion, total) in buffer.items():
+                row = db.query(LLMUsageDB).filter(
+                    LLMUsageDB.bucket == bucket,
+                    LLMUsageDB.user_id.is_(None) if user_id is None else LLMUsageDB.user_id == user_id,
+                    LLMUsageDB.endpoint == endpoint,
+                    LLMUsageDB.model == model,
+                ).first()
+                if row is None:
+                    row = LLMUsageDB(
+                        bucket=bucket, user_id=user_id, endpoint=endpoint, model=model,
+                        requests=0, prompt_tokens=0, completion_tokens=0, total_tokens=0,
+                    )
+                    db.add(row)
+                row.requests += requests
+                row.prompt_tokens += prompt
+                row.completion_tokens += completion
+                row.total_tokens += total
+            db.commit()
+        finally:
+            db.close()
+
+    async def flush(self) -> int:
+        """Escribe el búfer en llm_usage; devuelve cuántas filas agregadas se volcaron"""
+        if not self._buffer:
+            return 0
+        return await asyncio.to_thread(self._flush_now)
+
+    def _flush_now(self) -> int:
+        with self._flush_lock:
+            buffer = self._drain()
+            if not buffer:
+                return 0
+            try:
+                self._write(buffer)
+            except Exception as e:
+                # Se devuelve al búfer para el siguiente intento
+                logger.error(f"No se pudo guardar el consumo de tokens: {e}")
+                with self._lock:
+                    for key, values in buffer.items():
+                        row = self._buffer.setdefault(key, [0, 0, 0, 0])
+                        for i, value in enumerate(values):
+                            row[i] += value
+                return 0
+        metrics.incr("llm_usage.flushed_rows", len(buffer))
+        return len(buffer)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detiene la tarea de fondo y vuelca lo pendiente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+_meter: Optional[UsageMeter] = None
+
+
+def get_usage_meter() -> UsageMeter:
+    """Medidor compartido (se crea de forma perezosa)"""
+    global _meter
+    if _meter is None:
+        _meter = UsageMeter(
+            flush_interval=settings.USAGE_FLUSH_SECONDS,
+            daily_token_quota=settings.LLM_DAILY_TOKEN_QUOTA,
+        )
+    return _meter
@@ -0,0 +1,71 @@
+"""
+Autómata Aho-Corasick: busca muchos términos a la vez en una sola pasada
+por el texto (coste lineal en la longitud del texto, sin importar cuántos
+términos haya).
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class AhoCorasick:
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build(self) -> None:
+        """Enlaces de fallo por niveles (BFS)"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> List[Tuple[int, int, str]]:
+        """Todas las apariciones (inicio, fin exclusivo, término), solapadas incluidas"""
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                matches.append((i + 1 - len(pattern), i + 1, pattern))
+        return matches
+
+    def find_words(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Apariciones como palabras completas: no pueden empezar ni terminar en
+        medio de una palabra (los términos que acaban en símbolo, como
+        "bit.ly/", sí pueden ir seguidos de texto).
+        """
+        found = []
+        for start, end, pattern in self.iter_matches(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if pattern[-1].isalnum() and end < len(text) and text[end].isalnum():
+                continue
+            found.append((start, end, pattern))
+        return found
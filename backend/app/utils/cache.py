@@ -0,0 +1,207 @@
+"""
+Caché de dos niveles: LRU en memoria + persistencia en SQLite
+"""
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """
+    Caché con un nivel LRU en memoria y un nivel persistente en SQLite.
+
+    Ambos niveles expiran entradas por TTL y por tamaño (se eliminan las
+    menos usadas recientemente). Los valores deben ser serializables a JSON.
+    """
+
+    # Cada cuántas escrituras se poda el nivel SQLite
+    PRUNE_EVERY = 50
+
+    def __init__(
+        self,
+        name: str,
+        db_path: Optional[str],
+        max_memory_entries: int = 256,
+        max_disk_entries: int = 5000,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.name = name
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries(last_access)"
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Caché '{self.name}': no se pudo abrir {db_path} ({e}), solo memoria")
+            self._conn = None
+
+    # ---------- Nivel en memoria ----------
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                metrics.incr(f"cache.{self.name}.expired")
+                return None
+            self._memory.move_to_end(key)
+            # Copia para que el llamador pueda mutar el resultado sin tocar la caché
+            return copy.deepcopy(value)
+
+    def _memory_set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, copy.deepcopy(value))
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                metrics.incr(f"cache.{self.name}.evicted")
+
+    # ---------- Nivel SQLite ----------
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if self._conn is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                self._conn.commit()
+                metrics.incr(f"cache.{self.name}.expired")
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key: str, value: Any, expires_at: float) -> None:
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune_disk()
+            self._conn.commit()
+
+    def _prune_disk(self) -> None:
+        """Elimina expirados y recorta al tamaño máximo (llamar con el lock tomado)"""
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+        removed = self._conn.execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            " SELECT key FROM cache_entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        ).rowcount
+        if removed:
+            metrics.incr(f"cache.{self.name}.evicted", removed)
+
+    # ---------- API pública ----------
+
+    async def get(self, key: str, count_miss: bool = True) -> Optional[Any]:
+        """
+        Busca en memoria y luego en SQLite; registra hits/misses.
+        count_miss=False para consultas que se repiten con otra clave si fallan.
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            metrics.incr(f"cache.{self.name}.hits.memory")
+            return value
+
+        found = await asyncio.to_thread(self._disk_get, key)
+        if found is not None:
+            value, expires_at = found
+            self._memory_set(key, value, expires_at)
+            metrics.incr(f"cache.{self.name}.hits.disk")
+            return value
+
+        if count_miss:
+            metrics.incr(f"cache.{self.name}.misses")
+        return None
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Guarda el valor en ambos niveles"""
+        expires_at = time.time() + (ttl_seconds or self.ttl_seconds)
+        self._memory_set(key, value, expires_at)
+        try:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+        except sqlite3.Error as e:
+            logger.warning(f"Caché '{self.name}': error guardando en disco: {e}")
+        metrics.incr(f"cache.{self.name}.writes")
+
+    def clear(self) -> None:
+        """Vacía ambos niveles"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM cache_entries")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaños y contadores de hits/misses"""
+        hits = (metrics.counter(f"cache.{self.name}.hits.memory")
+                + metrics.counter(f"cache.{self.name}.hits.disk"))
+        misses = metrics.counter(f"cache.{self.name}.misses")
+        with self._lock:
+            memory_entries = len(self._memory)
+            disk_entries = (
+                self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+                if self._conn is not None else 0
+            )
+        return {
+            "memory_entries": memory_entries,
+            "disk_entries": disk_entries,
+            "hits_memory": metrics.counter(f"cache.{self.name}.hits.memory"),
+            "hits_disk": metrics.counter(f"cache.{self.name}.hits.disk"),
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if (hits + misses) else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,232 @@
+"""
+Servidor de /uploads con caché HTTP para las imágenes.
+
+Las rutas del almacén (blobs/ab/cd/<sha256>.<ext> y sus miniaturas
+<sha256>_<tamaño>.<ext>) nunca cambian de contenido: se sirven con un ETag
+fuerte sacado del nombre y `Cache-Control: public, max-age=31536000,
+immutable`, así el cliente Android no vuelve a pedir la misma foto en cada
+pantalla. El resto de archivos (rutas antiguas que se pueden sobrescribir)
+mantienen el ETag de Starlette y se revalidan en cada uso (`no-cache`).
+
+Además:
+- If-None-Match / If-Modified-Since responden 304 sin cuerpo.
+- Range de un solo intervalo responde 206 (If-Range incluido); un intervalo
+  fuera del archivo responde 416. Varios intervalos se sirven enteros.
+- Con IMAGE_SERVE_WEBP, si el cliente acepta image/webp y junto a un .jpg/.png
+  del almacén existe el mismo nombre en .webp (las miniaturas siempre lo
+  tienen), se sirve ese con `Vary: Accept`.
+- El cuerpo se envía con las extensiones ASGI http.response.pathsend o
+  http.response.zerocopy (sendfile) si el servidor las ofrece; si no, por
+  bloques como FileResponse.
+"""
+import os
+import re
+import stat
+from email.utils import parsedate
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from app.utils.metrics import metrics
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# <sha256>.<ext> o <sha256>_<tamaño>.<ext> (ver app/utils/thumbnails.py)
+_CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{64}(?:_\d+)?\.[a-z]+$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_WEBP_SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def is_content_addressed(path: str) -> bool:
+    return bool(_CONTENT_ADDRESSED_RE.match(os.path.basename(path)))
+
+
+def accepts_webp(accept: str) -> bool:
+    """True si la cabecera Accept pide image/webp explícitamente (con q > 0)"""
+    for item in accept.split(","):
+        media_type, *params = (part.strip() for part in item.split(";"))
+        if media_type.lower() != "image/webp":
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Intervalo [inicio, fin] (inclusivo) de una cabecera Range de un solo
+    intervalo. None = servir el archivo entero (cabecera inválida o con varios
+    intervalos); ValueError = intervalo fuera del archivo (416).
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # "bytes=-N": los N últimos bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match: comparación débil (W/ se ignora), admite listas y "*" """
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidate in header.split(",")
+    )
+
+
+class ImageFileResponse(FileResponse):
+    """FileResponse con rangos y envío por pathsend/zerocopy"""
+
+    def __init__(self, *args, byte_range: Optional[Tuple[int, int]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.byte_range = byte_range
+        self.headers["accept-ranges"] = "bytes"
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        size = self.stat_result.st_size
+        offset, end = self.byte_range or (0, size - 1)
+        count = end - offset + 1
+        extensions = scope.get("extensions") or {}
+        if self.byte_range is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+            return
+        if "http.response.zerocopy" in extensions:
+            # El servidor copia del descriptor al socket con sendfile
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopy", "file": file,
+                    "offset": offset, "count": count, "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(offset)
+            remaining = count
+            while True:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not more_body:
+                    break
+
+
+class ImageFiles(StaticFiles):
+    """StaticFiles para /uploads con la política de caché de las imágenes"""
+
+    def __init__(self, *, directory: str, serve_webp: bool = True):
+        super().__init__(directory=directory)
+        self.serve_webp = serve_webp
+
+    def _resolve(self, path: str, want_webp: bool) -> Tuple[str, Optional[os.stat_result], bool]:
+        """Ruta en disco, stat y si se sustituyó por la versión WebP"""
+        full_path, stat_result = self.lookup_path(path)
+        if want_webp and stat_result is not None:
+            root = os.path.splitext(full_path)[0]
+            try:
+                return f"{root}.webp", os.stat(f"{root}.webp"), True
+            except OSError:
+                pass
+        return full_path, stat_result, False
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        # .incoming/ y los .part de escrituras a medias no se sirven
+        if any(part.startswith(".") for part in path.split(os.sep)):
+            raise HTTPException(status_code=404)
+
+        request_headers = Headers(scope=scope)
+        immutable = is_content_addressed(path)
+        negotiable = immutable and self.serve_webp and path.lower().endswith(_WEBP_SOURCE_EXTENSIONS)
+        want_webp = negotiable and accepts_webp(request_headers.get("accept", ""))
+        try:
+            full_path, stat_result, negotiated = await anyio.to_thread.run_sync(self._resolve, path, want_webp)
+        except PermissionError:
+            raise HTTPException(status_code=401)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+
+        headers = {"cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL}
+        if immutable:
+            headers["etag"] = f'"{os.path.basename(full_path)}"'
+        if negotiable:
+            headers["vary"] = "Accept"
+        if negotiated:
+            metrics.incr("uploads.webp_negotiated")
+
+        response = ImageFileResponse(full_path, stat_result=stat_result, method=scope["method"], headers=headers)
+        if self._not_modified(response.headers, request_headers):
+            metrics.incr("uploads.not_modified")
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_matches(response.headers, request_headers):
+            try:
+                byte_range = parse_range(range_header, stat_result.st_size)
+            except ValueError:
+                return Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{stat_result.st_size}", **headers},
+                )
+            if byte_range is not None:
+                metrics.incr("uploads.partial")
+                return ImageFileResponse(
+                    full_path, stat_result=stat_result, method=scope["method"],
+                    headers=headers, byte_range=byte_range,
+                )
+        return response
+
+    @staticmethod
+    def _not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+        # If-None-Match manda sobre If-Modified-Since (RFC 9110 13.2.2)
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, response_headers["etag"])
+        if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+        last_modified = parsedate(response_headers["last-modified"])
+        return if_modified_since is not None and last_modified is not None and if_modified_since >= last_modified
+
+    @staticmethod
+    def _if_range_matches(response_headers: Headers, request_headers: Headers) -> bool:
+        """Sin If-Range, o si sigue siendo la misma representación (ETag fuerte o fecha)"""
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            return if_range == response_headers["etag"]
+        return parsedate(if_range) == parsedate(response_headers["last-modified"])
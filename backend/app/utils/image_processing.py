@@ -1,30 +1,235 @@
 """Utilidades para procesamiento de imágenes (CU-01)"""
-from PIL import Image
+from PIL import Image, ImageOps
+import numpy as np
 import io
 import base64
-from pathlib import Path
-from datetime import datetime
+from typing import Tuple, Dict, Any
 
-async def validate_image_quality(image_data: bytes) -> dict:
-    """CU-01: Validar calidad de imagen para captura guiada"""
+from fastapi import UploadFile
+
+from app.config import get_settings
+from app.services.blob_store import get_blob_store
+from app.services.image_workers import get_image_workers
+from app.utils.uploads import IMAGE_FORMATS, SNIFF_BYTES, sniff_image_format
+
+settings = get_settings()
+
+# Formatos de salida admitidos para el modelo de visión
+LLM_IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def sniff_mime_type(image_data: bytes) -> str:
+    """Content type según los bytes mágicos (JPEG si el formato no se reconoce)"""
+    image_format = sniff_image_format(image_data[:SNIFF_BYTES])
+    return IMAGE_FORMATS[image_format][1] if image_format else "image/jpeg"
+
+
+def get_llm_max_side(purpose: str) -> int:
+    """Lado mayor objetivo según el uso de la imagen"""
+    if purpose == "guidance":
+        return settings.LLM_IMAGE_MAX_SIDE_GUIDANCE
+    if purpose in ("validation", "comparison"):
+        return settings.LLM_IMAGE_MAX_SIDE_VALIDATION
+    return settings.LLM_IMAGE_MAX_SIDE_DIAGNOSIS
+
+
+def prepare_image_for_llm(image_data: bytes, purpose: str = "diagnosis") -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Prepara una foto para el modelo de visión: aplica la rotación EXIF,
+    reduce el lado mayor según el propósito, recomprime y descarta metadatos.
+
+    Returns:
+        (bytes a enviar, mime type, estadísticas con bytes originales y enviados)
+    """
+    stats = {"purpose": purpose, "original_bytes": len(image_data), "sent_bytes": len(image_data)}
+    output_format = settings.LLM_IMAGE_FORMAT.upper()
+    if not settings.LLM_IMAGE_PREPROCESS or output_format not in LLM_IMAGE_MIME_TYPES:
+        return image_data, sniff_mime_type(image_data), stats
+
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        original_size = img.size
+        original_format = img.format
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        max_side = get_llm_max_side(purpose)
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        # Sin exif= ni icc_profile=: Pillow no copia metadatos al recomprimir
+        img.save(buffer, format=output_format, quality=settings.LLM_IMAGE_QUALITY, optimize=True)
+        processed = buffer.getvalue()
+    except Exception:
+        # Si Pillow no puede decodificarla se envía tal cual, con su tipo real
+        return image_data, sniff_mime_type(image_data), stats
+
+    unchanged = img.size == original_size and original_format == output_format
+    if unchanged and len(processed) >= len(image_data):
+        return image_data, LLM_IMAGE_MIME_TYPES[output_format], stats
+
+    stats.update({
+        "sent_bytes": len(processed),
+        "original_size": list(original_size),
+        "sent_size": list(img.size),
+    })
+    return processed, LLM_IMAGE_MIME_TYPES[output_format], stats
+
+# Parámetros del analizador local de calidad
+QUALITY_ANALYSIS_SIDE = 256        # Lado mayor (px) al que se reduce la foto para analizarla
+FOCUS_REFERENCE_VARIANCE = 200.0   # Varianza del laplaciano (a 256 px) que se considera "nítida"
+PLANT_MIN_RATIO = 0.03             # Fracción mínima de píxeles vegetales para detectar planta
+CENTER_TOLERANCE = 0.15            # Desplazamiento máximo del centroide para considerarla centrada
+
+
+def _clamp(value: float) -> float:
+    return float(max(0.0, min(1.0, value)))
+
+
+def analyze_image_quality(image_data: bytes) -> Dict[str, Any]:
+    """
+    Analizador local (NumPy/Pillow) de iluminación, enfoque, encuadre y distancia.
+
+    Tarda pocos milisegundos: trabaja sobre una versión reducida de la foto.
+    Devuelve los mismos campos que la validación por IA (lighting, focus,
+    distance, overall, direction, recommendations, voice_guidance).
+    """
     img = Image.open(io.BytesIO(image_data))
-    width, height = img.size
-    
-    # Validaciones básicas
-    quality = {
-        "lighting": 0.7,  # Simulado
-        "focus": 0.8,
-        "distance": 0.6,
-        "overall": 0.7
+    img.draft("RGB", (QUALITY_ANALYSIS_SIDE, QUALITY_ANALYSIS_SIDE))  # decodificación JPEG reducida (DCT)
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((QUALITY_ANALYSIS_SIDE, QUALITY_ANALYSIS_SIDE))
+    rgb = np.asarray(img, dtype=np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    luma = 0.299 * r + 0.587 * g + 0.114 * b
+
+    # 1. Exposición: brillo medio y porcentaje de píxeles quemados/sub-expuestos
+    brightness = float(luma.mean())
+    dark_ratio = float((luma < 25).mean())
+    bright_ratio = float((luma > 235).mean())
+    lighting_score = _clamp(1.0 - abs(brightness - 130.0) / 130.0 - max(dark_ratio, bright_ratio))
+    if brightness < 70 or dark_ratio > 0.4:
+        lighting = "more"
+    elif brightness > 200 or bright_ratio > 0.3:
+        lighting = "less"
+    else:
+        lighting = "ok"
+
+    # 2. Enfoque: varianza del laplaciano
+    laplacian = (
+        luma[1:-1, :-2] + luma[1:-1, 2:] + luma[:-2, 1:-1] + luma[2:, 1:-1]
+        - 4.0 * luma[1:-1, 1:-1]
+    )
+    laplacian_var = float(laplacian.var()) if laplacian.size else 0.0
+    focus_score = _clamp(laplacian_var / FOCUS_REFERENCE_VARIANCE)
+    focus = "ok" if focus_score >= 0.3 else "refocus"
+
+    # 3. Vegetación: exceso de verde (2g - r - b) sobre cromaticidad normalizada
+    total = r + g + b + 1e-6
+    excess_green = (2 * g - r - b) / total
+    plant_mask = (excess_green > 0.1) & (luma > 20)
+    green_ratio = float(plant_mask.mean())
+    plant_detected = green_ratio >= PLANT_MIN_RATIO
+
+    # 4. Encuadre: centroide y caja contenedora de la vegetación
+    height, width = plant_mask.shape
+    direction, distance = "center", "ok"
+    centering_score, distance_score = 0.0, 0.0
+    centroid, bbox = None, None
+    if plant_detected:
+        ys, xs = np.nonzero(plant_mask)
+        cx, cy = float(xs.mean()) / width, float(ys.mean()) / height
+        x0, x1 = np.percentile(xs, [2, 98]) / width
+        y0, y1 = np.percentile(ys, [2, 98]) / height
+        centroid = [round(cx, 3), round(cy, 3)]
+        bbox = [round(float(x0), 3), round(float(y0), 3), round(float(x1), 3), round(float(y1), 3)]
+
+        dx, dy = cx - 0.5, cy - 0.5
+        centering_score = _clamp(1.0 - max(abs(dx), abs(dy)) / 0.5)
+        if max(abs(dx), abs(dy)) > CENTER_TOLERANCE:
+            if abs(dx) >= abs(dy):
+                direction = "left" if dx < 0 else "right"
+            else:
+                direction = "up" if dy < 0 else "down"
+
+        area = float((x1 - x0) * (y1 - y0))
+        touches_edges = sum([x0 < 0.02, y0 < 0.02, x1 > 0.98, y1 > 0.98])
+        if area < 0.15:
+            distance = "closer"
+            distance_score = _clamp(area / 0.15)
+        elif area > 0.9 and touches_edges >= 3:
+            distance = "farther"
+            distance_score = 0.5
+        else:
+            distance_score = 1.0
+
+    is_centered = plant_detected and direction == "center"
+    overall = 0.25 * lighting_score + 0.3 * focus_score + 0.2 * distance_score + 0.25 * centering_score
+    if not plant_detected:
+        overall *= 0.4
+
+    recommendations = {"direction": direction, "distance": distance, "lighting": lighting, "focus": focus}
+    return {
+        "lighting": round(lighting_score, 2),
+        "focus": round(focus_score, 2),
+        "distance": round(distance_score, 2),
+        "overall": round(overall, 2),
+        "direction": direction,
+        "is_centered": is_centered,
+        "plant_detected": plant_detected,
+        "recommendations": recommendations,
+        "voice_guidance": _local_voice_guidance(plant_detected, recommendations),
+        "metrics": {
+            "brightness": round(brightness, 1),
+            "laplacian_variance": round(laplacian_var, 1),
+            "green_ratio": round(green_ratio, 3),
+            "centroid": centroid,
+            "bbox": bbox,
+        },
     }
-    return quality
 
-async def save_image(image_data: bytes, plant_id: int) -> str:
-    """Guardar imagen de planta"""
-    img = Image.open(io.BytesIO(image_data))
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"plant_{plant_id}_{timestamp}.jpg"
-    path = Path(f"uploads/{filename}")
-    path.parent.mkdir(exist_ok=True)
-    img.save(path)
-    return str(path)
+
+def _local_voice_guidance(plant_detected: bool, recommendations: Dict[str, str]) -> str:
+    """Mensaje de voz corto priorizando el problema más importante"""
+    if not plant_detected:
+        return "No veo la planta, apunta la cámara hacia ella"
+    if recommendations["lighting"] == "more":
+        return "Busca un lugar con más luz"
+    if recommendations["lighting"] == "less":
+        return "Evita la luz directa del sol"
+    if recommendations["focus"] == "refocus":
+        return "Toca la pantalla para enfocar la planta"
+    direction_messages = {
+        "up": "Mueve la cámara hacia arriba",
+        "down": "Baja la cámara un poco",
+        "left": "Mueve la cámara hacia la izquierda",
+        "right": "Mueve la cámara hacia la derecha",
+    }
+    if recommendations["direction"] in direction_messages:
+        return direction_messages[recommendations["direction"]]
+    if recommendations["distance"] == "closer":
+        return "Acércate más a la planta"
+    if recommendations["distance"] == "farther":
+        return "Aléjate un poco de la planta"
+    return "Perfecto, lista para capturar"
+
+
+async def validate_image_quality(image_data: bytes) -> dict:
+    """CU-01: Validar calidad de imagen para captura guiada (análisis local, sin IA)"""
+    return await get_image_workers().run("quality", analyze_image_quality, image_data)
+
+
+async def preprocess_image_for_llm(image_data: bytes, purpose: str = "diagnosis") -> Tuple[bytes, str, Dict[str, Any]]:
+    """prepare_image_for_llm en el pool de procesos de imagen"""
+    return await get_image_workers().run("llm_preprocess", prepare_image_for_llm, image_data, purpose)
+
+
+async def save_image(upload: UploadFile) -> str:
+    """
+    Guardar imagen de planta tal cual se subió, sin decodificarla ni
+    recomprimirla, en el almacén por contenido (una foto repetida no se
+    vuelve a escribir). Devuelve la ruta del blob.
+    """
+    stored = await get_blob_store().put_upload(upload)
+    return stored.path
@@ -0,0 +1,315 @@
+"""
+Extracción tolerante de JSON en respuestas del LLM.
+
+Los modelos a veces envuelven el JSON en bloques markdown, añaden prosa antes
+o después, dejan comas finales o cortan la respuesta por max_tokens. En vez
+de descartar la llamada, se recorre el texto una sola vez buscando el objeto
+más externo y se repara lo mínimo. Cada tipo de prompt tiene además un
+normalizador que garantiza los tipos que esperan los servicios.
+
+Usa orjson si está instalado (opcional).
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.metrics import metrics
+
+try:  # pragma: no cover - depende del entorno
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Tokens estructurales: cadenas completas (o sin cerrar al final), llaves,
+# corchetes y comas. Lo demás (números, true/false, espacios) se salta.
+_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?:"|(?P<open>\\?)\Z)|[{}\[\],]')
+
+
+def _scan_object(text: str, start: int) -> Optional[Any]:
+    """
+    Recorre text desde el "{" en start hasta cerrar el objeto.
+
+    En la misma pasada anota comas finales (antes de "}" o "]") para
+    quitarlas y, si el texto termina sin cerrar (respuesta truncada), cierra
+    la cadena y los corchetes pendientes.
+    """
+    stack: List[str] = []
+    last_comma: Optional[int] = None   # coma pendiente fuera de cadenas
+    trailing_commas: List[int] = []
+    open_string: Optional[str] = None  # "" o "\\" si el texto acaba dentro de una cadena
+    end: Optional[int] = None
+
+    for match in _TOKEN_RE.finditer(text, start):
+        token = match.group()
+        pos = match.start()
+        if token[0] == '"':
+            if match.group("open") is not None:
+                open_string = match.group("open")
+                break
+            last_comma = None
+        elif token in "{[":
+            stack.append(token)
+            last_comma = None
+        elif token in "}]":
+            if last_comma is not None and not text[last_comma + 1:pos].strip():
+                trailing_commas.append(last_comma)
+            last_comma = None
+            if not stack or _CLOSERS[stack[-1]] != token:
+                return None
+            stack.pop()
+            if not stack:
+                end = match.end()
+                break
+        else:
+            last_comma = pos
+
+    if end is not None:
+        candidate = text[start:end]
+        try:
+            return _loads(candidate)
+        except ValueError:
+            if not trailing_commas:
+                return None
+        return _loads_without(candidate, trailing_commas, start, "trailing_comma")
+
+    # Respuesta truncada: cerrar lo que quedó abierto
+    if open_string is not None:
+        # Sin la barra de escape colgante, si la hay
+        candidate = text[start:len(text) - len(open_string)] + '"'
+    else:
+        candidate = text[start:].rstrip()
+        if candidate.endswith(","):
+            candidate = candidate[:-1]
+        elif candidate.endswith(":"):
+            candidate += " null"
+    candidate += "".join(_CLOSERS[opener] for opener in reversed(stack))
+    return _loads_without(candidate, trailing_commas, start, "truncated")
+
+
+def _loads_without(candidate: str, commas: List[int], offset: int, repair: str) -> Optional[Any]:
+    """Parsea candidate quitando las comas finales anotadas (posiciones en el texto original)"""
+    if commas:
+        chars = list(candidate)
+        for pos in commas:
+            chars[pos - offset] = " "
+        candidate = "".join(chars)
+    try:
+        data = _loads(candidate)
+    except ValueError:
+        return None
+    metrics.incr(f"llm_json.repaired.{repair}")
+    return data
+
+
+def extract_json_object(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Devuelve el primer objeto JSON válido del texto, o None.
+
+    Para cada "{" candidato (la prosa puede contener llaves sueltas) se prueba
+    primero el tramo hasta el último "}" y, si no es JSON válido, se escanea
+    el objeto para delimitarlo y repararlo.
+    """
+    if not text:
+        return None
+    start = text.find("{")
+    end = text.rfind("}")
+    while start != -1:
+        # Camino rápido: de este "{" al último "}" (cubre markdown y prosa)
+        if end > start:
+            try:
+                data = _loads(text[start:end + 1])
+                if isinstance(data, dict):
+                    return data
+            except ValueError:
+                pass
+        data = _scan_object(text, start)
+        if isinstance(data, dict):
+            return data
+        start = text.find("{", start + 1)
+    return None
+
+
+# ---------- Normalizadores por tipo de prompt ----------
+
+_TRUE_STRINGS = {"true", "yes", "si", "sí", "1", "ok"}
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _as_bool(value: Any, default: bool = False) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_STRINGS
+    return default
+
+
+def _as_float(value: Any, default: float) -> float:
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            return float(match.group().replace(",", "."))
+    return default
+
+
+def _as_unit(value: Any, default: float) -> float:
+    """Número en [0, 1]; acepta porcentajes (85 → 0.85)"""
+    number = _as_float(value, default)
+    if number > 1:
+        number /= 100
+    return min(1.0, max(0.0, number))
+
+
+def _as_str(value: Any, default: str = "") -> str:
+    if value is None:
+        return default
+    return value if isinstance(value, str) else str(value)
+
+
+def _as_list(value: Any) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _as_dict_list(value: Any, key: str) -> List[Dict[str, Any]]:
+    """Lista de objetos; los elementos sueltos (texto) se envuelven en {key: ...}"""
+    return [item if isinstance(item, dict) else {key: _as_str(item)} for item in _as_list(value)]
+
+
+def coerce_diagnosis(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Esquema de DiagnosisPrompts.get_diagnosis_prompt"""
+    result = dict(data)
+    species = data.get("species")
+    if not isinstance(species, dict):
+        species = {"name": _as_str(species)} if species else {}
+    species["confidence"] = _as_unit(species.get("confidence"), 0.7)
+    result["species"] = species
+
+    health_score = int(round(_as_float(data.get("health_score"), 50)))
+    result["health_score"] = min(100, max(0, health_score))
+
+    status = _as_str(data.get("status")).strip().lower()
+    if status not in ("healthy", "warning", "critical"):
+        status = ("healthy" if result["health_score"] >= 70
+                  else "warning" if result["health_score"] >= 50 else "critical")
+    result["status"] = status
+
+    issues = _as_dict_list(data.get("issues"), "name")
+    for issue in issues:
+        if "severity" in issue:
+            issue["severity"] = _as_str(issue["severity"]).strip().lower()
+    result["issues"] = issues
+    result["immediate_actions"] = _as_dict_list(data.get("immediate_actions"), "action")
+    result["symptoms"] = _as_list(data.get("symptoms"))
+    result["causes"] = _as_list(data.get("causes"))
+    result["summary"] = _as_str(data.get("summary"), "Diagnóstico completado")
+    return result
+
+
+def _coerce_recommendations(value: Any) -> Dict[str, str]:
+    if not isinstance(value, dict):
+        return {}
+    return {key: _as_str(item).strip().lower() for key, item in value.items()}
+
+
+def coerce_validation(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Esquema de DiagnosisPrompts.get_centering_validation_prompt"""
+    return {
+        "is_centered": _as_bool(data.get("is_centered")),
+        "plant_detected": _as_bool(data.get("plant_detected")),
+        "confidence": _as_unit(data.get("confidence"), 0.0),
+        "issues": [_as_str(issue) for issue in _as_list(data.get("issues"))],
+        "recommendations": _coerce_recommendations(data.get("recommendations")),
+        "voice_guidance": _as_str(data.get("voice_guidance"), "No se pudo analizar la imagen"),
+    }
+
+
+def coerce_quick_validation(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Esquema del prompt corto de validate_photo_quality_fast"""
+    recommendations = _coerce_recommendations(data.get("recommendations"))
+    recommendations.setdefault("direction", "center")
+    return {
+        "is_centered": _as_bool(data.get("is_centered")),
+        "plant_detected": _as_bool(data.get("plant_detected")),
+        "recommendations": recommendations,
+        "voice_guidance": _as_str(data.get("voice_guidance"), "Ajusta la posición"),
+    }
+
+
+def coerce_health_summary(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Esquema {health_score, issues} usado en comparaciones antes/después"""
+    health_score = int(round(_as_float(data.get("health_score"), 50)))
+    return {
+        "health_score": min(100, max(0, health_score)),
+        "issues": _as_list(data.get("issues")),
+    }
+
+
+def moderation_verdict(value: Any) -> Optional[bool]:
+    """APROPIADO → True, INAPROPIADO → False, otra cosa → None"""
+    text = _as_str(value).strip().upper()
+    if "INAPROPIADO" in text or "NO APROPIADO" in text:
+        return False
+    if "APROPIADO" in text:
+        return True
+    return None
+
+
+def coerce_moderation_batch(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Esquema {"resultados": [{"id": n, "veredicto": "APROPIADO|INAPROPIADO"}]}
+    de la moderación por lotes; también acepta {"1": "APROPIADO", ...}.
+    Devuelve {"verdicts": {id: bool}} solo con los ítems legibles.
+    """
+    verdicts: Dict[int, bool] = {}
+    items = data.get("resultados", data.get("results"))
+    if isinstance(items, list):
+        pairs = [
+            (item.get("id"), item.get("veredicto", item.get("verdict")))
+            for item in items if isinstance(item, dict)
+        ]
+    else:
+        pairs = list(data.items())
+    for key, value in pairs:
+        number = _as_float(key, -1)
+        verdict = moderation_verdict(value)
+        if number >= 0 and verdict is not None:
+            verdicts[int(number)] = verdict
+    return {"verdicts": verdicts}
+
+
+COERCERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "diagnosis": coerce_diagnosis,
+    "validation": coerce_validation,
+    "quick_validation": coerce_quick_validation,
+    "health_summary": coerce_health_summary,
+    "moderation_batch": coerce_moderation_batch,
+}
+
+
+def parse_llm_json(text: Optional[str], kind: str) -> Optional[Dict[str, Any]]:
+    """
+    Extrae y normaliza la respuesta de un prompt del tipo indicado.
+
+    Devuelve None si no hay ningún objeto JSON recuperable.
+    """
+    data = extract_json_object(text)
+    if data is None:
+        metrics.incr(f"llm_json.{kind}.failed")
+        return None
+    metrics.incr(f"llm_json.{kind}.ok")
+    return COERCERS[kind](data)
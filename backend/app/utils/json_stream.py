@@ -0,0 +1,80 @@
+"""
+Parser incremental de JSON para respuestas del LLM en streaming.
+
+Recibe el texto por fragmentos y emite cada campo de primer nivel del objeto
+raíz en cuanto se cierra, sin esperar al final de la respuesta. Ignora el
+texto previo al primer "{" (markdown, prosa) y las comas finales.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalJSONObjectParser:
+    """Emite (clave, valor) de los campos de primer nivel a medida que se completan"""
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._pos = 0            # caracteres ya escaneados
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._field_start: Optional[int] = None
+        self.started = False
+        self.finished = False
+        self.fields: dict = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Añade texto y devuelve los campos que se cerraron en este fragmento"""
+        if self.finished or not chunk:
+            return []
+        self._buffer.append(chunk)
+        text = "".join(self._buffer)
+        self._buffer = [text]
+        emitted: List[Tuple[str, Any]] = []
+
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._depth = 1
+                    self._field_start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    emitted.extend(self._close_field(text, i))
+                    self.finished = True
+                    self._pos = i + 1
+                    return emitted
+            elif char == "," and self._depth == 1:
+                emitted.extend(self._close_field(text, i))
+                self._field_start = i + 1
+
+        self._pos = len(text)
+        return emitted
+
+    def _close_field(self, text: str, end: int) -> List[Tuple[str, Any]]:
+        field_text = text[self._field_start:end].strip()
+        if not field_text:
+            return []
+        try:
+            parsed = json.loads("{" + field_text + "}")
+        except ValueError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
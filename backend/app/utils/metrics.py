@@ -0,0 +1,91 @@
+"""
+Métricas en memoria del proceso (contadores e histogramas de latencia)
+"""
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class LatencyHistogram:
+    """Histograma de latencias con una ventana acotada de muestras recientes"""
+
+    def __init__(self, max_samples: int = 1024):
+        self.samples: deque = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentil (0-100) sobre la ventana de muestras recientes"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 2) if value is not None else None
+
+        return {
+            "count": self.count,
+            "avg": rounded(self.total / self.count) if self.count else None,
+            "p50": rounded(self.percentile(50)),
+            "p95": rounded(self.percentile(95)),
+            "p99": rounded(self.percentile(99)),
+        }
+
+
+class MetricsRegistry:
+    """Registro de métricas compartido (seguro entre hilos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Incrementa un contador"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Registra una muestra (p. ej. latencia en ms) en un histograma"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def percentile(self, name: str, p: float) -> Optional[float]:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            return histogram.percentile(p) if histogram else None
+
+    def sample_count(self, name: str) -> int:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            return histogram.count if histogram else 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia de todas las métricas para exponerlas en /metrics"""
+        with self._lock:
+            return {
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self._histograms.items())
+                },
+            }
+
+
+# Instancia global usada por servicios y rutas
+metrics = MetricsRegistry()
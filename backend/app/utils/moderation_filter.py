@@ -0,0 +1,107 @@
+"""
+Filtro local de moderación.
+
+- keyword_moderation: alternativa cuando el LLM no está disponible; es
+  conservador (solo bloquea términos claramente ofensivos o patrones típicos
+  de spam) para no rechazar publicaciones normales de jardinería.
+- prefilter: delante del LLM resuelve los casos claros (términos bloqueados,
+  spam de enlaces, mensajes formados solo por frases habituales como
+  "¡gracias!" o "¿cada cuánto riegas?") y deja el resto como ambiguo.
+"""
+import re
+import unicodedata
+from typing import List, NamedTuple, Optional
+
+from app.utils.aho_corasick import AhoCorasick
+
+# Insultos y términos ofensivos (normalizados: minúsculas y sin tildes)
+BLOCKED_TERMS: List[str] = [
+    "idiota", "imbecil", "estupido", "estupida", "pendejo", "pendeja",
+    "gilipollas", "cabron", "cabrona", "hijo de puta", "hdp", "puta", "puto",
+    "mierda", "marica", "maricon", "subnormal", "retrasado", "malparido",
+    "culero", "zorra", "baboso", "tarado", "mongolo", "verga",
+]
+
+# Patrones frecuentes de spam y estafas
+SPAM_TERMS: List[str] = [
+    "gana dinero", "dinero facil", "haz clic", "click aqui", "compra ahora",
+    "oferta exclusiva", "criptomoneda", "bitcoin", "inversion garantizada",
+    "trabaja desde casa", "escribeme al whatsapp", "t.me/", "bit.ly/",
+    "casino", "apuestas",
+]
+
+# Frases habituales e inofensivas: un mensaje formado SOLO por ellas se aprueba
+ALLOWED_PHRASES: List[str] = [
+    "gracias", "muchas gracias", "mil gracias", "muchisimas gracias", "gracias por compartir",
+    "gracias por el consejo", "gracias por los consejos", "gracias por la ayuda",
+    "gracias por responder", "de nada", "por favor", "hola", "buenos dias", "buenas tardes",
+    "buenas noches", "saludos", "un saludo", "ok", "vale", "de acuerdo", "si", "no", "claro",
+    "genial", "excelente", "perfecto", "increible", "que bonita", "que bonito", "que linda",
+    "que lindo", "que hermosa", "que hermoso", "preciosa", "precioso", "hermosa", "hermoso",
+    "me encanta", "me gusta", "felicidades", "enhorabuena", "buen trabajo", "buen consejo",
+    "muy util", "muy buena", "muy bueno", "lo probare", "lo voy a probar", "a mi tambien",
+    "yo tambien", "igualmente", "suerte", "animo", "ya florecio", "que planta es",
+    "cada cuanto riegas", "cuanto riegas", "cada cuanto la riegas", "cuanta luz necesita",
+    "que sustrato usas", "que abono usas", "que le pasa", "esta enferma", "que bien",
+    "me sirvio", "me funciono", "funciono", "a mi me funciono",
+]
+
+_BLOCKED = AhoCorasick(BLOCKED_TERMS + SPAM_TERMS)
+_ALLOWED = AhoCorasick(ALLOWED_PHRASES)
+
+_LINK_RE = re.compile(r"(?:https?://|www\.)\S+|\b[\w-]+\.(?:com|net|org|info|xyz|ly|me|io|co)\b\S*")
+_PHONE_RE = re.compile(r"(?:\+?\d[\s.-]?){9,}")
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", without_accents).strip()
+
+
+def find_blocked_terms(text: str) -> List[str]:
+    """Términos ofensivos o de spam presentes en el texto"""
+    return [term for _, _, term in _BLOCKED.find_words(normalize_text(text))]
+
+
+def keyword_moderation(text: str) -> bool:
+    """True si el texto parece apropiado según el filtro local"""
+    return not find_blocked_terms(text)
+
+
+class PrefilterResult(NamedTuple):
+    appropriate: Optional[bool]  # None = ambiguo, decide el LLM
+    reason: str
+
+
+def _only_allowed_phrases(normalized: str) -> bool:
+    """True si todas las palabras del texto forman parte de alguna frase permitida"""
+    words = [(m.start(), m.end()) for m in _WORD_RE.finditer(normalized)]
+    if not words:
+        return False
+    covered = bytearray(len(normalized))
+    for start, end, _ in _ALLOWED.find_words(normalized):
+        covered[start:end] = b"\x01" * (end - start)
+    return all(all(covered[start:end]) for start, end in words)
+
+
+def prefilter(text: str, max_links: int = 2) -> PrefilterResult:
+    """Decisión local para los casos claros; el resto queda como ambiguo"""
+    normalized = normalize_text(text)
+    if not _WORD_RE.search(normalized):
+        # Solo emojis o signos ("👍", "!!!")
+        return PrefilterResult(True, "no_words")
+    if _BLOCKED.find_words(normalized):
+        return PrefilterResult(False, "blocklist")
+
+    links = len(_LINK_RE.findall(normalized))
+    if links > max_links:
+        return PrefilterResult(False, "link_spam")
+    if links or _PHONE_RE.search(normalized):
+        return PrefilterResult(None, "contact_info")
+
+    if _only_allowed_phrases(normalized):
+        return PrefilterResult(True, "allowlist")
+    return PrefilterResult(None, "ambiguous")
@@ -0,0 +1,93 @@
+"""
+Derivados de una imagen del almacén: miniaturas WebP y JPEG a varios tamaños.
+
+Se guardan junto al blob como <sha256>_<tamaño>.webp / .jpg, así su URL se
+obtiene de la del original sin consultar nada. render_derivatives se ejecuta
+en un proceso aparte (app/services/thumbnailer.py), por eso este módulo solo
+depende de PIL.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from PIL import Image, ImageOps
+
+# Tamaño (lado mayor) de la miniatura que devuelven los listados
+LIST_THUMBNAIL_SIZE = 384
+
+# extensión -> (formato PIL, opciones de guardado sin la calidad)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", {"method": 4}),
+    "jpg": ("JPEG", {"optimize": True, "progressive": True}),
+}
+
+_BLOB_NAME_RE = re.compile(r"([0-9a-f]{64})\.[a-z]+$")
+
+
+def derivative_path(blob_path: str, size: int, extension: str) -> Path:
+    path = Path(blob_path)
+    return path.with_name(f"{path.stem}_{size}.{extension}")
+
+
+def derivative_url(image_url: str, size: int, extension: str) -> str:
+    """URL de un derivado a partir de la del blob (relativa, absoluta o con "/" inicial)"""
+    return _BLOB_NAME_RE.sub(rf"\1_{size}.{extension}", image_url)
+
+
+def _save_atomic(image: Image.Image, destination: Path, image_format: str, **options) -> None:
+    partial = destination.with_name(f".{destination.name}.{os.getpid()}.part")
+    try:
+        image.save(partial, image_format, **options)
+        os.replace(partial, destination)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+
+def render_derivatives(source: str, sizes: Sequence[int], quality: int) -> Dict[str, List[int]]:
+    """
+    Genera los derivados de una imagen y devuelve {tamaño: [ancho, alto]}.
+
+    Se reduce de mayor a menor partiendo del resultado anterior, y en JPEG
+    el decodificador ya entrega la imagen a 1/2, 1/4 u 1/8 (draft), así que
+    nunca se decodifica la foto completa si no hace falta. No se amplía: si
+    la original es menor que un tamaño, ese derivado queda a su tamaño real.
+    """
+    derivatives = {}
+    with Image.open(source) as original:
+        largest = max(sizes)
+        original.draft("RGB", (largest, largest))
+        current = ImageOps.exif_transpose(original).convert("RGB")
+    for size in sorted(sizes, reverse=True):
+        current.thumbnail((size, size), Image.LANCZOS)
+        for extension, (image_format, options) in DERIVATIVE_FORMATS.items():
+            _save_atomic(current, derivative_path(source, size, extension), image_format, quality=quality, **options)
+        derivatives[str(size)] = list(current.size)
+    return derivatives
+
+
+def image_variants(image_url: Optional[str], derivatives: Optional[Dict[str, List[int]]]) -> dict:
+    """
+    Campos de miniatura para una respuesta de listado. Sin derivados (imagen
+    antigua o todavía generándose) la miniatura es la propia imagen.
+    """
+    if not image_url or not derivatives:
+        return {"thumbnail_url": image_url, "srcset": None, "srcset_jpeg": None}
+
+    # Un derivado que no se amplió puede repetir ancho con el siguiente
+    by_width = {}
+    for size in sorted(derivatives, key=int):
+        by_width.setdefault(derivatives[size][0], int(size))
+    thumbnail_size = LIST_THUMBNAIL_SIZE if str(LIST_THUMBNAIL_SIZE) in derivatives else max(by_width.values())
+
+    def srcset(extension: str) -> str:
+        return ", ".join(
+            f"{derivative_url(image_url, size, extension)} {width}w" for width, size in by_width.items()
+        )
+
+    return {
+        "thumbnail_url": derivative_url(image_url, thumbnail_size, "webp"),
+        "srcset": srcset("webp"),
+        "srcset_jpeg": srcset("jpg"),
+    }
@@ -0,0 +1,169 @@
+"""
+Subida de archivos sin decodificar.
+
+Starlette ya deja cada UploadFile en un SpooledTemporaryFile; aquí se copia
+a su destino por bloques en un hilo (sin bloquear el event loop), y en la
+misma pasada se limita el tamaño, se identifica el formato por sus bytes
+mágicos y se calcula el sha256. La memoria por subida queda en un bloque
+(UPLOAD_CHUNK_BYTES) en lugar del tamaño del archivo, y la imagen se guarda
+tal cual llegó (sin recomprimir con PIL).
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterable, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Formato -> (extensión, content type)
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "gif": (".gif", "image/gif"),
+}
+
+# Bytes necesarios para reconocer cualquiera de los formatos
+SNIFF_BYTES = 12
+
+
+class StoredUpload(NamedTuple):
+    path: str  # ruta relativa al directorio de trabajo, p. ej. "uploads/plant_1_....jpg"
+    size: int
+    sha256: str
+    format: str  # clave de IMAGE_FORMATS
+    content_type: str
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Formato de imagen según la firma de los primeros bytes (None si no es una imagen admitida)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+def _upload_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(413, f"La imagen supera el tamaño máximo ({max_bytes / (1024 * 1024):.1f} MB)")
+
+
+def _check_formats(image_format: Optional[str], allowed: Iterable[str]) -> str:
+    if image_format is None or image_format not in allowed:
+        raise HTTPException(415, "Formato de imagen no admitido (usa JPEG, PNG, WebP o GIF)")
+    return image_format
+
+
+def _copy_upload(
+    source: BinaryIO,
+    destination: Path,
+    max_bytes: int,
+    chunk_size: int,
+    allowed: Iterable[str],
+) -> StoredUpload:
+    """Copia por bloques a un archivo temporal y lo renombra al terminar (se ejecuta en un hilo)"""
+    source.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    image_format = None
+    head = b""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial = destination.with_name(f".{destination.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(partial, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _upload_too_large(max_bytes)
+                if image_format is None:
+                    head += chunk[:SNIFF_BYTES]
+                    if len(head) >= SNIFF_BYTES:
+                        image_format = _check_formats(sniff_image_format(head), allowed)
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise HTTPException(400, "La imagen está vacía")
+        if image_format is None:
+            # Archivo más corto que la firma
+            image_format = _check_formats(sniff_image_format(head), allowed)
+        extension, content_type = IMAGE_FORMATS[image_format]
+        final_path = destination.with_suffix(extension)
+        os.replace(partial, final_path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return StoredUpload(final_path.as_posix(), size, digest.hexdigest(), image_format, content_type)
+
+
+async def store_upload(
+    upload: UploadFile,
+    destination: str,
+    max_bytes: Optional[int] = None,
+    allowed_formats: Iterable[str] = IMAGE_FORMATS,
+) -> StoredUpload:
+    """
+    Guarda una imagen subida en destination (la extensión se sustituye por la
+    del formato detectado).
+
+    Raises:
+        HTTPException: 413 si supera max_bytes (UPLOAD_MAX_BYTES por defecto),
+            415 si no es una imagen admitida y 400 si está vacía
+    """
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    # Starlette conoce el tamaño del archivo ya recibido: rechazo sin copiar nada
+    if upload.size is not None and upload.size > max_bytes:
+        raise _upload_too_large(max_bytes)
+    return await asyncio.to_thread(
+        _copy_upload, upload.file, Path(destination), max_bytes,
+        settings.UPLOAD_CHUNK_BYTES, tuple(allowed_formats),
+    )
+
+
+def hash_file(path: Path) -> Tuple[int, str]:
+    """(tamaño, sha256) de un archivo ya guardado, leído por bloques"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+def _read_limited(source: BinaryIO, max_bytes: int, allowed: Iterable[str]) -> bytes:
+    source.seek(0)
+    data = source.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise _upload_too_large(max_bytes)
+    if not data:
+        raise HTTPException(400, "La imagen está vacía")
+    _check_formats(sniff_image_format(data[:SNIFF_BYTES]), allowed)
+    return data
+
+
+async def read_upload(
+    upload: UploadFile,
+    max_bytes: Optional[int] = None,
+    allowed_formats: Iterable[str] = IMAGE_FORMATS,
+) -> bytes:
+    """
+    Contenido de una imagen que solo se necesita en memoria (validaciones
+    rápidas que no se guardan), con los mismos límites que store_upload.
+    """
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    if upload.size is not None and upload.size > max_bytes:
+        raise _upload_too_large(max_bytes)
+    return await asyncio.to_thread(_read_limited, upload.file, max_bytes, tuple(allowed_formats))
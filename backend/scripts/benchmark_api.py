@@ -0,0 +1,490 @@
+"""
+Benchmark de carga y latencia de extremo a extremo de la API.
+
+Siembra una base de datos nueva (usuarios, plantas, diagnósticos, posts,
+comentarios, likes y recordatorios; tamaño configurable), arranca
+scripts/fake_groq_server.py en un hilo y lanza --concurrency usuarios
+virtuales contra app.main:app (en proceso, vía ASGI) durante --duration
+segundos con una mezcla realista de acciones:
+
+    guidance      ráfaga de frames a /api/diagnosis/validate-fast (cámara)
+    diagnosis     POST /api/diagnosis/analyze
+    feed          GET /api/community/posts
+    like          POST /api/community/posts/{id}/like
+    comment       POST /api/community/posts/{id}/comments (moderado)
+    reminders     GET /api/reminders/user/{id}
+    gamification  GET /api/gamification/stats/{id} + achievements/{id}
+
+Reporta por ruta: peticiones, throughput, p50/p95/p99 y tasa de error, y
+guarda el resultado en JSON (con el commit actual) para comparar entre
+commits con --compare. Todo corre en un directorio temporal (BD, cachés y
+uploads), así que no toca jardin.db; el .env no se lee, la configuración
+sale de las variables de entorno.
+
+Ojo con --concurrency por encima de ~12: las rutas async consultan la BD
+de forma síncrona en el event loop, y cuando el pool de SQLAlchemy (5 + 10
+conexiones) se agota la espera de una conexión bloquea el loop entero hasta
+30 s (pool_timeout); el benchmark lo muestra como colas de ~30 000 ms.
+
+Uso:
+    python scripts/benchmark_api.py [--users 200] [--concurrency 8] [--duration 60]
+        [--mix feed=6,like=3,...] [--output resultados.json] [--compare base.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+import httpx
+import uvicorn
+from PIL import Image, ImageDraw
+
+import fake_groq_server
+
+DEFAULT_MIX = {
+    "guidance": 3, "diagnosis": 1, "feed": 6, "like": 3,
+    "comment": 2, "reminders": 3, "gamification": 3,
+}
+
+COMMENTS = [
+    "¡Gracias por compartir!", "Qué bonita planta", "¿Cada cuánto riegas?",
+    "A mí me pasó lo mismo con mi monstera y la cambié de maceta",
+    "Prueba con jabón potásico, a mí me funcionó contra la araña roja",
+    "Creo que le falta luz, ponla cerca de una ventana",
+    "Mira mi blog www.plantas-baratas.com para más ofertas",
+    "Me encanta", "¿Qué sustrato usas?",
+]
+
+
+# ---------- Datos ----------
+
+def make_images(count: int, seed: int) -> List[bytes]:
+    """JPEGs sintéticos de 'plantas' (follaje verde sobre fondo) con encuadres distintos"""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", (800, 600), (rng.randint(150, 220),) * 3)
+        draw = ImageDraw.Draw(img)
+        cx, cy = 400 + rng.randint(-150, 150), 300 + rng.randint(-100, 100)
+        for _ in range(40):
+            x, y = cx + rng.randint(-160, 160), cy + rng.randint(-120, 120)
+            r = rng.randint(20, 60)
+            draw.ellipse((x - r, y - r // 2, x + r, y + r // 2), fill=(30, rng.randint(90, 170), 40))
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def seed_dataset(args) -> Dict[str, int]:
+    """Puebla la BD configurada en DATABASE_URL; devuelve cuántas filas de cada tipo"""
+    from app.models.database import (
+        SessionLocal, init_db, UserDB, PlantDB, DiagnosisDB, CommunityPostDB,
+        CommentDB, PostLikeDB, ReminderDB
+    )
+    init_db()
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        users = [
+            UserDB(
+                email=f"bench{i}@example.com", username=f"bench{i}", hashed_password="x",
+                level=rng.randint(1, 10), xp=rng.randint(0, 900), points=rng.randint(0, 5000),
+                streak_days=rng.randint(0, 30),
+            )
+            for i in range(args.users)
+        ]
+        db.add_all(users)
+        db.flush()
+        user_ids = [u.id for u in users]
+
+        plants = [
+            PlantDB(user_id=uid, name=f"Planta {uid}-{j}", species="Monstera", health_score=rng.randint(10, 100))
+            for uid in user_ids for j in range(args.plants_per_user)
+        ]
+        db.add_all(plants)
+        db.flush()
+
+        diagnoses = [
+            DiagnosisDB(
+                plant_id=p.id, user_id=p.user_id, image_url="uploads/seed.jpg", diagnosis_text="Semilla",
+                confidence=0.8, severity=rng.choice(["healthy", "warning", "critical"]), recommendations="[]",
+            )
+            for p in plants for _ in range(args.diagnoses_per_plant)
+        ]
+        db.add_all(diagnoses)
+        db.flush()
+
+        posts = [
+            CommunityPostDB(
+                diagnosis_id=rng.choice(diagnoses).id if diagnoses else None,
+                user_id=rng.choice(user_ids), description="Hojas amarillas, ¿qué hago?",
+                plant_name="Monstera", created_at=now - timedelta(minutes=i),
+            )
+            for i in range(args.posts)
+        ]
+        db.add_all(posts)
+        db.flush()
+
+        comments, likes = [], []
+        for post in posts:
+            for _ in range(args.comments_per_post):
+                comments.append(CommentDB(post_id=post.id, user_id=rng.choice(user_ids), content=rng.choice(COMMENTS)))
+            likers = rng.sample(user_ids, min(len(user_ids), args.likes_per_post))
+            likes.extend(PostLikeDB(post_id=post.id, user_id=uid) for uid in likers)
+            post.comments_count = args.comments_per_post
+            post.likes = len(likers)
+        db.add_all(comments)
+        db.add_all(likes)
+
+        reminders = [
+            ReminderDB(
+                plant_id=p.id, user_id=p.user_id, reminder_type=rng.choice(["water", "fertilize", "check"]),
+                message="Riega tu planta", scheduled_time=now + timedelta(hours=rng.randint(-48, 96)),
+                completed=rng.random() < 0.3,
+            )
+            for p in plants for _ in range(args.reminders_per_plant)
+        ]
+        db.add_all(reminders)
+        db.commit()
+        return {
+            "users": len(users), "plants": len(plants), "diagnoses": len(diagnoses), "posts": len(posts),
+            "comments": len(comments), "likes": len(likes), "reminders": len(reminders),
+            "user_ids": user_ids, "post_ids": [p.id for p in posts],
+        }
+    finally:
+        db.close()
+
+
+# ---------- Servidor LLM falso ----------
+
+def start_fake_groq(args) -> str:
+    """Arranca fake_groq_server en un hilo propio y devuelve su URL base"""
+    fake_args = fake_groq_server.parse_args([
+        "--mode", args.llm_mode, "--cassette", args.cassette,
+        "--latency-dist", args.llm_latency_dist, "--latency-ms", str(args.llm_latency_ms),
+        "--latency-sigma", str(args.llm_latency_sigma), "--ms-per-token", str(args.llm_ms_per_token),
+        "--error-rate", str(args.llm_error_rate), "--rate-limit-rate", str(args.llm_rate_limit_rate),
+        "--seed", str(args.seed),
+    ])
+    config = uvicorn.Config(
+        fake_groq_server.create_app(fake_args), host="127.0.0.1", port=args.llm_port, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit(f"No se pudo arrancar el servidor LLM falso en el puerto {args.llm_port}")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{args.llm_port}"
+
+
+# ---------- Carga ----------
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.client_errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            status = None
+            logging.getLogger(__name__).error(f"{route}: {type(e).__name__}: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if self.recording:
+            self.samples[route].append(elapsed_ms)
+            self.statuses[route][str(status or "exception")] += 1
+            if status is None or status >= 500:
+                self.errors[route] += 1
+            elif status >= 400:
+                self.client_errors[route] += 1
+        return status
+
+
+async def run_scenario(name: str, client, recorder: Recorder, rng: random.Random, data, images, args):
+    user_id = rng.choice(data["user_ids"])
+    if name == "guidance":
+        # Ráfaga de frames mientras el usuario encuadra la planta
+        for _ in range(args.guidance_frames):
+            await recorder.request(
+                client, "POST /api/diagnosis/validate-fast", "POST", "/api/diagnosis/validate-fast",
+                data={"user_id": str(user_id)}, files={"image": ("frame.jpg", rng.choice(images), "image/jpeg")},
+            )
+            await asyncio.sleep(args.guidance_interval_ms / 1000)
+    elif name == "diagnosis":
+        await recorder.request(
+            client, "POST /api/diagnosis/analyze", "POST", "/api/diagnosis/analyze",
+            data={"user_id": str(user_id)}, files={"image": ("plant.jpg", rng.choice(images), "image/jpeg")},
+        )
+    elif name == "feed":
+        await recorder.request(client, "GET /api/community/posts", "GET", "/api/community/posts", params={"limit": 20})
+    elif name == "like":
+        post_id = rng.choice(data["post_ids"])
+        await recorder.request(
+            client, "POST /api/community/posts/{id}/like", "POST", f"/api/community/posts/{post_id}/like",
+            data={"user_id": str(user_id)},
+        )
+    elif name == "comment":
+        post_id = rng.choice(data["post_ids"])
+        await recorder.request(
+            client, "POST /api/community/posts/{id}/comments", "POST", f"/api/community/posts/{post_id}/comments",
+            params={"user_id": user_id}, json={"content": rng.choice(COMMENTS), "is_solution": False},
+        )
+    elif name == "reminders":
+        await recorder.request(
+            client, "GET /api/reminders/user/{id}", "GET", f"/api/reminders/user/{user_id}",
+        )
+    elif name == "gamification":
+        # La pantalla de logros pide estadísticas y logros a la vez
+        await asyncio.gather(
+            recorder.request(client, "GET /api/gamification/stats/{id}", "GET", f"/api/gamification/stats/{user_id}"),
+            recorder.request(
+                client, "GET /api/gamification/achievements/{id}", "GET", f"/api/gamification/achievements/{user_id}"
+            ),
+        )
+
+
+async def run_load(app, data, images, mix: Dict[str, float], args) -> Recorder:
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    stop_at = time.monotonic() + args.warmup + args.duration
+
+    async def virtual_user(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        while time.monotonic() < stop_at:
+            await run_scenario(rng.choices(names, weights)[0], client, recorder, rng, data, images, args)
+            if args.think_ms:
+                await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+    async def start_recording():
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await asyncio.gather(start_recording(), *(virtual_user(i) for i in range(args.concurrency)))
+    return recorder
+
+
+# ---------- Resultados ----------
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[index], 2)
+
+
+def summarize(samples: List[float], errors: int, client_errors: int, duration: float) -> dict:
+    values = sorted(samples)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / duration, 2),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": round(values[-1], 2) if values else None,
+        "error_rate": round(errors / len(values), 4) if values else 0.0,
+        "client_error_rate": round(client_errors / len(values), 4) if values else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(routes: Dict[str, dict], total: dict):
+    print(f"{'Ruta':<46} {'req':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'error':>6}")
+    for route, s in sorted(routes.items()):
+        print(f"{route:<46} {s['requests']:>6} {s['throughput_rps']:>7.1f} {s['p50_ms'] or 0:>8.1f} "
+              f"{s['p95_ms'] or 0:>8.1f} {s['p99_ms'] or 0:>8.1f} {s['error_rate']:>6.1%}")
+    print(f"{'TOTAL':<46} {total['requests']:>6} {total['throughput_rps']:>7.1f} {total['p50_ms'] or 0:>8.1f} "
+          f"{total['p95_ms'] or 0:>8.1f} {total['p99_ms'] or 0:>8.1f} {total['error_rate']:>6.1%}")
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> List[str]:
+    """Imprime las diferencias con la línea base y devuelve las regresiones de p95/throughput/errores"""
+    regressions = []
+    print(f"\n📈 Comparación con {baseline.get('commit') or 'línea base'} ({baseline.get('timestamp')})")
+    print(f"{'Ruta':<46} {'p95 base':>9} {'p95':>9} {'Δp95':>7} {'Δreq/s':>7}")
+    rows = dict(result["routes"], TOTAL=result["total"])
+    base_rows = dict(baseline.get("routes", {}), TOTAL=baseline.get("total", {}))
+    for route, current in sorted(rows.items()):
+        base = base_rows.get(route)
+        if not base or not base.get("p95_ms") or not current.get("p95_ms"):
+            continue
+        delta_p95 = current["p95_ms"] / base["p95_ms"] - 1
+        delta_rps = current["throughput_rps"] / base["throughput_rps"] - 1 if base["throughput_rps"] else 0.0
+        print(f"{route:<46} {base['p95_ms']:>9.1f} {current['p95_ms']:>9.1f} {delta_p95:>+7.0%} {delta_rps:>+7.0%}")
+        if delta_p95 > threshold:
+            regressions.append(f"{route}: p95 {base['p95_ms']:.1f} → {current['p95_ms']:.1f} ms")
+        if delta_rps < -threshold:
+            regressions.append(f"{route}: throughput {base['throughput_rps']:.1f} → {current['throughput_rps']:.1f} req/s")
+        if current["error_rate"] > base.get("error_rate", 0) + 0.01:
+            regressions.append(f"{route}: errores {base.get('error_rate', 0):.1%} → {current['error_rate']:.1%}")
+    return regressions
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, (text or "").split(",")):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            sys.exit(f"Escenario desconocido en --mix: {name} (opciones: {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data_args = arg_parser.add_argument_group("datos sembrados")
+    data_args.add_argument("--users", type=int, default=200)
+    data_args.add_argument("--plants-per-user", type=int, default=3)
+    data_args.add_argument("--diagnoses-per-plant", type=int, default=2)
+    data_args.add_argument("--posts", type=int, default=500)
+    data_args.add_argument("--comments-per-post", type=int, default=4)
+    data_args.add_argument("--likes-per-post", type=int, default=10)
+    data_args.add_argument("--reminders-per-plant", type=int, default=3)
+    load_args = arg_parser.add_argument_group("carga")
+    load_args.add_argument("--concurrency", type=int, default=8, help="Usuarios virtuales")
+    load_args.add_argument("--duration", type=float, default=60, help="Segundos medidos")
+    load_args.add_argument("--warmup", type=float, default=5, help="Segundos iniciales sin medir")
+    load_args.add_argument("--think-ms", type=float, default=0, help="Pausa media entre acciones (exponencial)")
+    load_args.add_argument("--mix", help="Pesos por escenario, p. ej. feed=6,diagnosis=0")
+    load_args.add_argument("--guidance-frames", type=int, default=5)
+    load_args.add_argument("--guidance-interval-ms", type=float, default=200)
+    load_args.add_argument("--seed", type=int, default=42)
+    llm_args = arg_parser.add_argument_group("LLM falso (scripts/fake_groq_server.py)")
+    llm_args.add_argument("--llm-mode", choices=["replay", "synth"], default="synth")
+    llm_args.add_argument("--cassette", default=fake_groq_server.DEFAULT_CASSETTE)
+    llm_args.add_argument("--llm-port", type=int, default=8091)
+    llm_args.add_argument("--llm-latency-dist", default="lognormal")
+    llm_args.add_argument("--llm-latency-ms", type=float, default=600)
+    llm_args.add_argument("--llm-latency-sigma", type=float, default=0.4)
+    llm_args.add_argument("--llm-ms-per-token", type=float, default=0.0)
+    llm_args.add_argument("--llm-rpm", type=int, default=0, help="LLM_REQUESTS_PER_MINUTE (0 = sin límite)")
+    llm_args.add_argument("--llm-tpm", type=int, default=0, help="LLM_TOKENS_PER_MINUTE (0 = sin límite)")
+    llm_args.add_argument("--llm-error-rate", type=float, default=0.0)
+    llm_args.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    out_args = arg_parser.add_argument_group("resultados")
+    out_args.add_argument("--output", help="Archivo JSON de resultados")
+    out_args.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    out_args.add_argument("--regression-threshold", type=float, default=0.2,
+                          help="Empeoramiento relativo de p95/throughput que cuenta como regresión")
+    out_args.add_argument("--workdir", help="Directorio de trabajo (por defecto uno temporal)")
+    out_args.add_argument("--log-level", default="WARNING", help="Nivel de log de la app durante la carga")
+    args = arg_parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    for path in ("output", "compare", "cassette"):
+        if getattr(args, path):
+            setattr(args, path, os.path.abspath(getattr(args, path)))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="jardin_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    # Configuración antes del primer get_settings() (queda cacheada)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # El servidor falso no tiene cuota: por defecto sin presupuesto RPM/TPM en el planificador
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.llm_rpm)
+    os.environ["LLM_TOKENS_PER_MINUTE"] = str(args.llm_tpm)
+    llm_url = start_fake_groq(args)
+
+    print(f"🌱 Sembrando datos en {workdir} ...")
+    data = seed_dataset(args)
+    images = make_images(8, args.seed)
+    print("   " + ", ".join(f"{k}: {v}" for k, v in data.items() if isinstance(v, int)))
+
+    from app.main import app
+    from app.utils.metrics import metrics
+    logging.getLogger().setLevel(args.log_level)
+
+    async def run():
+        await app.router.startup()
+        try:
+            return await run_load(app, data, images, mix, args)
+        finally:
+            await app.router.shutdown()
+
+    print(f"🚀 {args.concurrency} usuarios virtuales, {args.duration:.0f}s (+{args.warmup:.0f}s de calentamiento), "
+          f"LLM falso en {llm_url} (~{args.llm_latency_ms:.0f} ms)\n")
+    recorder = asyncio.run(run())
+
+    routes = {
+        route: {
+            **summarize(samples, recorder.errors[route], recorder.client_errors[route], args.duration),
+            "status_codes": dict(recorder.statuses[route]),
+        }
+        for route, samples in recorder.samples.items()
+    }
+    total = summarize(
+        [v for samples in recorder.samples.values() for v in samples],
+        sum(recorder.errors.values()), sum(recorder.client_errors.values()), args.duration,
+    )
+    print_table(routes, total)
+
+    counters = metrics.snapshot()["counters"]
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "workdir")},
+        "mix": mix,
+        "dataset": {k: v for k, v in data.items() if isinstance(v, int)},
+        "routes": routes,
+        "total": total,
+        "llm_calls": {k: v for k, v in counters.items() if k.startswith(("llm_usage.", "llm_scheduler.", "groq."))},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.regression_threshold)
+        if regressions:
+            print("\n❌ Regresiones:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark de extracción de JSON en respuestas del LLM.
+
+Compara el parseo anterior (split de ```json + json.loads) con
+app.utils.json_extraction sobre un corpus de respuestas (JSONL con
+kind, variant, content) y reporta tasa de éxito y microsegundos por parseo.
+
+Uso:
+    python scripts/benchmark_json_extraction.py [corpus.jsonl] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.json_extraction import JSON_BACKEND, parse_llm_json
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_responses.jsonl")
+
+
+def legacy_parse(content, kind):
+    """Lógica que estaba copiada en groq_service y comparison_routes"""
+    try:
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0]
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0]
+        data = json.loads(content.strip())
+        return data if isinstance(data, dict) else None
+    except (ValueError, IndexError):
+        return None
+
+
+def run(parser, samples, repeat):
+    """Devuelve (éxitos por variante, µs por parseo)"""
+    ok = defaultdict(int)
+    for sample in samples:
+        if parser(sample["content"], sample["kind"]) is not None:
+            ok[sample["variant"]] += 1
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for sample in samples:
+            parser(sample["content"], sample["kind"])
+    elapsed = time.perf_counter() - started
+    return ok, elapsed / (repeat * len(samples)) * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    arg_parser.add_argument("--repeat", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    totals = defaultdict(int)
+    for sample in samples:
+        totals[sample["variant"]] += 1
+
+    results = {
+        "legacy": run(legacy_parse, samples, args.repeat),
+        f"json_extraction ({JSON_BACKEND})": run(parse_llm_json, samples, args.repeat),
+    }
+
+    print(f"📊 Corpus: {args.corpus} ({len(samples)} respuestas, {args.repeat} repeticiones)\n")
+    names = list(results)
+    print(f"{'variante':<24}" + "".join(f"{name:>28}" for name in names))
+    for variant in totals:
+        row = "".join(f"{results[name][0][variant]:>25}/{totals[variant]:<2}" for name in names)
+        print(f"{variant:<24}{row}")
+
+    print()
+    for name, (ok, micros) in results.items():
+        success = sum(ok.values())
+        print(f"{name:<28} éxito {success}/{len(samples)} ({success / len(samples):.0%})  {micros:8.1f} µs/parseo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark de la moderación por micro-lotes frente a la moderación individual.
+
+Modera un corpus etiquetado (JSONL con text, appropriate) de dos formas:
+un prompt por texto y con ModerationBatcher, con los textos llegando
+repartidos en --arrival-ms milisegundos. Reporta llamadas al LLM, tokens,
+tiempo, tamaño medio de lote, acierto frente a las etiquetas y coincidencia
+entre ambos modos. Necesita GROQ_API_KEY (o un servidor compatible).
+
+Uso:
+    python scripts/benchmark_moderation_batch.py [corpus.jsonl] [--arrival-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import get_settings
+from app.services import groq_service
+from app.services.moderation_batcher import ModerationBatcher
+from app.utils.metrics import metrics
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "moderation_samples.jsonl")
+
+
+def llm_usage():
+    """(llamadas, tokens) acumulados de moderación hasta ahora"""
+    snapshot = metrics.snapshot()["counters"]
+    tokens = sum(v for k, v in snapshot.items() if k.startswith("llm_usage.") and k.endswith(".tokens"))
+    return metrics.sample_count("llm.text.moderation.total_ms"), tokens
+
+
+async def run(moderate, texts, arrival_ms):
+    """Lanza cada texto con un retraso aleatorio en [0, arrival_ms] y mide el total"""
+    async def one(text):
+        await asyncio.sleep(random.uniform(0, arrival_ms / 1000))
+        return await moderate(text)
+
+    calls_before, tokens_before = llm_usage()
+    started = time.perf_counter()
+    verdicts = await asyncio.gather(*(one(text) for text in texts))
+    elapsed = time.perf_counter() - started
+    calls_after, tokens_after = llm_usage()
+    return verdicts, calls_after - calls_before, tokens_after - tokens_before, elapsed
+
+
+def report(name, verdicts, labels, calls, tokens, elapsed):
+    answered = [(v, l) for v, l in zip(verdicts, labels) if v is not None]
+    correct = sum(v == l for v, l in answered)
+    print(
+        f"{name:<12} llamadas {calls:>3}  tokens {tokens:>6}  {elapsed:6.2f}s  "
+        f"sin veredicto {len(verdicts) - len(answered):>2}  "
+        f"acierto {correct}/{len(answered)}"
+    )
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    arg_parser.add_argument("--arrival-ms", type=float, default=50, help="Ventana de llegada de los textos")
+    arg_parser.add_argument("--batch-size", type=int, default=get_settings().MODERATION_BATCH_MAX_SIZE)
+    arg_parser.add_argument("--max-wait-ms", type=float, default=get_settings().MODERATION_BATCH_MAX_WAIT_MS)
+    args = arg_parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    texts = [s["text"] for s in samples]
+    labels = [s["appropriate"] for s in samples]
+
+    groq_service.init_groq_client()
+    try:
+        batcher = ModerationBatcher(
+            groq_service._moderate_batch, max_batch_size=args.batch_size, max_wait=args.max_wait_ms / 1000
+        )
+        print(f"📊 Corpus: {args.corpus} ({len(texts)} textos, llegada en {args.arrival_ms:.0f} ms, "
+              f"lote ≤ {args.batch_size} / {args.max_wait_ms:.0f} ms)\n")
+
+        single = await run(groq_service._moderate_single, texts, args.arrival_ms)
+        report("individual", single[0], labels, *single[1:])
+
+        batch_calls_before = metrics.snapshot()["counters"].get("moderation.batch.calls", 0)
+        batched = await run(batcher.submit, texts, args.arrival_ms)
+        report("por lotes", batched[0], labels, *batched[1:])
+
+        batch_calls = metrics.snapshot()["counters"].get("moderation.batch.calls", 0) - batch_calls_before
+        both = [(a, b) for a, b in zip(single[0], batched[0]) if a is not None and b is not None]
+        agree = sum(a == b for a, b in both)
+        print()
+        print(f"Lotes: {batch_calls}  tamaño medio {len(texts) / max(1, batch_calls):.1f}  "
+              f"p95 espera {metrics.percentile('moderation.batch.flush_wait_ms', 95) or 0:.1f} ms")
+        print(f"Coincidencia lote vs individual: {agree}/{len(both)} ({agree / max(1, len(both)):.0%})")
+    finally:
+        await groq_service.close_groq_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,450 @@
+"""
+Servidor local compatible con la API de chat de Groq (OpenAI) para pruebas
+de carga y benchmarks sin gastar cuota.
+
+Atiende POST /openai/v1/chat/completions (normal y con stream=True) y
+responde según --mode:
+
+- replay: busca la respuesta grabada en el cassette (clave = hash del prompt
+  y de las imágenes); si no está, la sintetiza.
+- record: reenvía la petición a Groq (GROQ_API_KEY), la guarda en el
+  cassette y la devuelve; las siguientes ejecuciones en replay son offline.
+- synth: siempre sintetiza un JSON válido para el prompt detectado
+  (diagnóstico, validación, validación rápida, comparación, seguimiento,
+  consejos, moderación individual o por lotes). Es determinista: la misma
+  petición produce la misma respuesta.
+
+La latencia sigue la distribución elegida (--latency-dist fixed, uniform,
+normal o lognormal alrededor de --latency-ms) más --ms-per-token por token
+generado, y se pueden inyectar errores 500, 429 y cuelgues con
+--error-rate, --rate-limit-rate y --hang-rate. GET /stats devuelve los
+contadores del servidor.
+
+Uso:
+    python scripts/fake_groq_server.py [--port 8090] [--mode replay] [--latency-ms 600]
+    GROQ_BASE_URL=http://127.0.0.1:8090 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.config import get_settings
+from app.utils.moderation_filter import keyword_moderation
+
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "groq_cassette.jsonl")
+UPSTREAM_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+# ---------- Clave de la petición ----------
+
+def split_messages(messages: List[Dict[str, Any]]) -> Tuple[str, List[bytes]]:
+    """Texto de todos los mensajes y bytes de las imágenes (data URLs en base64)"""
+    texts, images = [], []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                url = part.get("image_url", {}).get("url", "")
+                payload = url.split(",", 1)[1] if url.startswith("data:") else url
+                try:
+                    images.append(base64.b64decode(payload))
+                except ValueError:
+                    images.append(url.encode())
+    return "\n".join(texts), images
+
+
+def request_key(prompt: str, images: List[bytes]) -> str:
+    """sha256 del prompt y de cada imagen (independiente del modelo y la temperatura)"""
+    digest = hashlib.sha256(prompt.encode("utf-8"))
+    for image in images:
+        digest.update(b"\0" + hashlib.sha256(image).digest())
+    return digest.hexdigest()
+
+
+# ---------- Respuestas sintéticas ----------
+
+def detect_kind(prompt: str) -> str:
+    """Tipo de prompt de la app a partir de marcas de su texto"""
+    if "TEXTOS A MODERAR" in prompt:
+        return "moderation_batch"
+    if "TEXTO A MODERAR" in prompt:
+        return "moderation"
+    if "SEGUIMIENTO" in prompt:
+        return "follow_up"
+    if '"species"' in prompt:
+        return "diagnosis"
+    if "RÁPIDAMENTE" in prompt:
+        return "quick_validation"
+    if "is_centered" in prompt:
+        return "validation"
+    if "health_score: 0-100" in prompt:
+        return "health_summary"
+    if "quick_tips" in prompt:
+        return "quick_tips"
+    return "text"
+
+
+SPECIES = [
+    ("Monstera", "Monstera deliciosa"), ("Pothos", "Epipremnum aureum"),
+    ("Sansevieria", "Dracaena trifasciata"), ("Ficus lira", "Ficus lyrata"),
+    ("Helecho de Boston", "Nephrolepis exaltata"), ("Tomatera", "Solanum lycopersicum"),
+    ("Rosal", "Rosa spp."), ("Albahaca", "Ocimum basilicum"),
+]
+ISSUES = [
+    ("deficiency", "Clorosis férrica", "Hojas jóvenes amarillas con nervios verdes."),
+    ("disease", "Oídio", "Polvo blanco sobre el haz de las hojas."),
+    ("pest", "Araña roja", "Punteado amarillento y telarañas finas en el envés."),
+    ("environmental", "Exceso de riego", "Hojas blandas y sustrato encharcado."),
+    ("environmental", "Quemadura solar", "Manchas marrones secas en las hojas expuestas."),
+]
+ACTIONS = [
+    "Reduce el riego a una vez por semana", "Retira las hojas afectadas",
+    "Aplica jabón potásico cada 5 días", "Mueve la planta a luz indirecta",
+    "Abona con quelato de hierro", "Mejora la ventilación alrededor de la planta",
+]
+GUIDANCE = [
+    ("center", "Perfecto, la planta está bien encuadrada"), ("up", "Mueve la cámara un poco hacia arriba"),
+    ("left", "Mueve la cámara hacia la izquierda"), ("closer", "Acércate más a la planta"),
+]
+
+
+def synth_diagnosis(rng: random.Random) -> Dict[str, Any]:
+    name, scientific = rng.choice(SPECIES)
+    health_score = rng.randint(15, 98)
+    status = "healthy" if health_score >= 70 else "warning" if health_score >= 50 else "critical"
+    issues = [
+        {
+            "type": kind, "name": issue, "severity": rng.choice(["low", "medium", "high"]),
+            "confidence": round(rng.uniform(0.5, 0.95), 2), "description": description,
+        }
+        for kind, issue, description in rng.sample(ISSUES, 0 if health_score >= 90 else rng.randint(1, 2))
+    ]
+    return {
+        "species": {"name": name, "scientific_name": scientific, "confidence": round(rng.uniform(0.45, 0.97), 2)},
+        "health_score": health_score,
+        "status": status,
+        "issues": issues,
+        "symptoms": [issue["description"] for issue in issues],
+        "causes": [f"Posible causa de {issue['name'].lower()}" for issue in issues],
+        "immediate_actions": [
+            {"priority": i + 1, "action": action, "urgency": rng.choice(["immediate", "today", "this_week"])}
+            for i, action in enumerate(rng.sample(ACTIONS, rng.randint(1, 4)))
+        ],
+        "long_term_care": {
+            "watering": "Cada 7 días con 250 ml", "light": "Luz indirecta brillante, 6 horas",
+            "fertilizer": "Abono líquido cada 15 días en primavera", "temperature": "18-26 °C",
+            "humidity": "50-60%",
+        },
+        "summary": f"{name} con salud del {health_score}%.",
+        "empathetic_message": "¡Vas por buen camino, tu planta se recuperará con estos cuidados!",
+    }
+
+
+def synthesize(kind: str, prompt: str, rng: random.Random) -> str:
+    """Contenido de la respuesta con el esquema que espera el prompt"""
+    if kind == "moderation":
+        text = prompt.split("TEXTO A MODERAR:", 1)[-1].split("Responde SOLO", 1)[0]
+        return "APROPIADO" if keyword_moderation(text) else "INAPROPIADO"
+    if kind == "moderation_batch":
+        items = prompt.split("TEXTOS A MODERAR:", 1)[-1].split("Responde SOLO", 1)[0]
+        results = []
+        for number, quoted in re.findall(r"^\s*(\d+)[.)]\s*(.*)$", items, re.MULTILINE):
+            try:
+                text = json.loads(quoted)
+            except ValueError:
+                text = quoted
+            verdict = "APROPIADO" if keyword_moderation(str(text)) else "INAPROPIADO"
+            results.append({"id": int(number), "veredicto": verdict})
+        return json.dumps({"resultados": results}, ensure_ascii=False)
+    if kind in ("diagnosis", "follow_up"):
+        data = synth_diagnosis(rng)
+        if kind == "follow_up":
+            data["comparison"] = {
+                "improvement_percentage": rng.randint(0, 100),
+                "trend": rng.choice(["improving", "stable", "declining"]),
+                "new_issues": [], "resolved_issues": [], "persistent_issues": [],
+                "recommendations_effectiveness": "working", "adjustments_needed": [],
+                "next_steps": rng.sample(ACTIONS, 2), "follow_up_needed_in": "7",
+                "progress_summary": "La planta evoluciona según lo esperado.",
+            }
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    if kind in ("validation", "quick_validation"):
+        direction, voice = rng.choice(GUIDANCE)
+        ok = direction == "center"
+        data = {
+            "is_centered": ok,
+            "plant_detected": rng.random() > 0.05,
+            "recommendations": {
+                "direction": direction if direction != "closer" else "center",
+                "distance": "closer" if direction == "closer" else "ok",
+                "lighting": "ok", "focus": "ok",
+            },
+            "voice_guidance": voice,
+        }
+        if kind == "validation":
+            data["confidence"] = round(rng.uniform(0.6, 0.95), 2)
+            data["issues"] = [] if ok else [voice]
+        return json.dumps(data, ensure_ascii=False)
+    if kind == "health_summary":
+        issues = [issue for _, issue, _ in rng.sample(ISSUES, rng.randint(0, 2))]
+        return json.dumps({"health_score": rng.randint(20, 95), "issues": issues}, ensure_ascii=False)
+    if kind == "quick_tips":
+        name, scientific = rng.choice(SPECIES)
+        return json.dumps({
+            "plant_name": f"{name} ({scientific})", "quick_tips": rng.sample(ACTIONS, 5),
+            "common_mistakes": ["Regar en exceso", "Poca luz", "Macetas sin drenaje"],
+            "seasonal_care": {"spring": "Abonar", "summer": "Regar más", "fall": "Reducir riego", "winter": "Proteger del frío"},
+            "difficulty": rng.choice(["easy", "medium", "hard"]), "best_for": "Principiantes",
+        }, ensure_ascii=False)
+    return "Respuesta sintética del servidor de pruebas."
+
+
+def estimate_usage(prompt: str, images: List[bytes], content: str) -> Dict[str, int]:
+    """Tokens aproximados (4 caracteres por token, ~85 tokens por imagen reducida)"""
+    prompt_tokens = len(prompt) // 4 + 85 * len(images)
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+# ---------- Cassette ----------
+
+class Cassette:
+    """Respuestas grabadas en JSONL: {key, kind, model, content, usage}"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.entries[entry["key"]] = entry
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+# ---------- Latencia y fallos ----------
+
+class LatencyModel:
+    def __init__(self, dist: str, mean_ms: float, sigma: float, ms_per_token: float):
+        self.dist = dist
+        self.mean_ms = mean_ms
+        self.sigma = sigma
+        self.ms_per_token = ms_per_token
+
+    def sample(self, rng: random.Random, completion_tokens: int) -> float:
+        """Segundos hasta completar la respuesta"""
+        if self.dist == "fixed":
+            base = self.mean_ms
+        elif self.dist == "uniform":
+            base = rng.uniform(self.mean_ms * (1 - self.sigma), self.mean_ms * (1 + self.sigma))
+        elif self.dist == "normal":
+            base = rng.gauss(self.mean_ms, self.mean_ms * self.sigma)
+        else:
+            # lognormal con mediana mean_ms: cola larga como la de un proveedor real
+            base = self.mean_ms * math.exp(rng.gauss(0, self.sigma))
+        return max(0.0, base + completion_tokens * self.ms_per_token) / 1000
+
+
+def error_body(message: str, error_type: str, code: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "code": code}}
+
+
+# ---------- Aplicación ----------
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    cassette = Cassette(args.cassette)
+    latency = LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma, args.ms_per_token)
+    fault_rng = random.Random(args.seed)
+    stats: Counter = Counter()
+    api_key = get_settings().GROQ_API_KEY
+
+    async def resolve(body: Dict[str, Any]) -> Dict[str, Any]:
+        """Contenido y consumo de la respuesta según el modo"""
+        prompt, images = split_messages(body.get("messages", []))
+        key = request_key(prompt, images)
+        kind = detect_kind(prompt)
+        stats[f"kind.{kind}"] += 1
+
+        if args.mode in ("replay", "record"):
+            entry = cassette.get(key)
+            if entry is not None:
+                stats["cassette.hit"] += 1
+                return entry
+            stats["cassette.miss"] += 1
+
+        if args.mode == "record":
+            upstream_body = {**body, "stream": False}
+            async with httpx.AsyncClient(timeout=120) as client:
+                response = await client.post(
+                    UPSTREAM_URL, json=upstream_body, headers={"Authorization": f"Bearer {api_key}"}
+                )
+            response.raise_for_status()
+            data = response.json()
+            entry = {
+                "key": key, "kind": kind, "model": data.get("model", body.get("model")),
+                "content": data["choices"][0]["message"]["content"], "usage": data.get("usage"),
+            }
+            cassette.add(entry)
+            stats["cassette.recorded"] += 1
+            return entry
+
+        content = synthesize(kind, prompt, random.Random(key))
+        stats["synthesized"] += 1
+        return {
+            "key": key, "kind": kind, "model": body.get("model"),
+            "content": content, "usage": estimate_usage(prompt, images, content),
+        }
+
+    def completion(entry: Dict[str, Any], model: str) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": entry["content"]},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": entry["usage"],
+        }
+
+    async def stream_chunks(entry: Dict[str, Any], model: str, seconds: float):
+        """Fragmentos SSE: primer token tras ~30% de la latencia y el resto repartido"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        content = entry["content"]
+        pieces = [content[i:i + args.chunk_chars] for i in range(0, len(content), args.chunk_chars)] or [""]
+
+        def chunk(delta: Dict[str, Any], finish_reason=None, **extra) -> str:
+            data = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+                **extra,
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(seconds * 0.3)
+        yield chunk({"role": "assistant", "content": ""})
+        gap = seconds * 0.7 / len(pieces)
+        for piece in pieces:
+            yield chunk({"content": piece})
+            await asyncio.sleep(gap)
+        # Groq informa el consumo en el último fragmento (x_groq.usage)
+        yield chunk({}, "stop", x_groq={"id": completion_id, "usage": entry["usage"]})
+        yield "data: [DONE]\n\n"
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        stats["requests"] += 1
+
+        roll = fault_rng.random()
+        if roll < args.error_rate:
+            stats["injected.500"] += 1
+            await asyncio.sleep(latency.sample(fault_rng, 0) * 0.5)
+            return JSONResponse(error_body("Fake upstream error", "internal_server_error", "internal_error"), 500)
+        roll -= args.error_rate
+        if roll < args.rate_limit_rate:
+            stats["injected.429"] += 1
+            return JSONResponse(
+                error_body("Rate limit reached (fake)", "tokens", "rate_limit_exceeded"), 429,
+                headers={"retry-after": "1"},
+            )
+        roll -= args.rate_limit_rate
+        if roll < args.hang_rate:
+            stats["injected.hang"] += 1
+            await asyncio.sleep(args.hang_seconds)
+            return JSONResponse(error_body("Gateway timeout (fake)", "internal_server_error", "timeout"), 504)
+
+        try:
+            entry = await resolve(body)
+        except httpx.HTTPError as e:
+            stats["upstream_errors"] += 1
+            return JSONResponse(error_body(f"Upstream error: {e}", "internal_server_error", "upstream"), 502)
+
+        seconds = latency.sample(fault_rng, entry["usage"]["completion_tokens"])
+        if body.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(stream_chunks(entry, model, seconds), media_type="text/event-stream")
+        await asyncio.sleep(seconds)
+        return completion(entry, model)
+
+    @app.get("/openai/v1/models")
+    async def list_models():
+        settings = get_settings()
+        models = {settings.GROQ_MODEL, settings.GROQ_LARGE_MODEL, settings.GROQ_TEXT_MODEL} - {""}
+        return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "fake"} for m in sorted(models)]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"mode": args.mode, "cassette_entries": len(cassette.entries), **dict(stats)}
+
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8090)
+    arg_parser.add_argument("--mode", choices=["replay", "record", "synth"], default="replay")
+    arg_parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    arg_parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    arg_parser.add_argument("--latency-ms", type=float, default=600, help="Media (o mediana en lognormal)")
+    arg_parser.add_argument("--latency-sigma", type=float, default=0.4, help="Dispersión relativa")
+    arg_parser.add_argument("--ms-per-token", type=float, default=0.0, help="Latencia extra por token generado")
+    arg_parser.add_argument("--chunk-chars", type=int, default=24, help="Caracteres por fragmento en streaming")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 500")
+    arg_parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+    arg_parser.add_argument("--hang-rate", type=float, default=0.0, help="Fracción de peticiones que se cuelgan")
+    arg_parser.add_argument("--hang-seconds", type=float, default=60.0)
+    arg_parser.add_argument("--seed", type=int, default=None, help="Semilla de latencias y fallos")
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == "record" and not get_settings().GROQ_API_KEY:
+        sys.exit("El modo record necesita GROQ_API_KEY")
+    print(f"🧪 Fake Groq en http://{args.host}:{args.port} (modo {args.mode}, cassette {args.cassette})")
+    print(f"   Arranca el backend con GROQ_BASE_URL=http://{args.host}:{args.port}")
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,142 @@
+"""
+Migración: imágenes al almacén direccionado por contenido
+Ejecutar: python scripts/migrate_image_blobs.py [--dry-run] [--gc] [--thumbnails]
+
+Crea la tabla image_blobs, copia cada imagen referenciada por diagnoses,
+plants, community_posts y plant_comparisons a IMAGE_STORE_DIR (las copias
+idénticas quedan en un único archivo), reescribe las rutas, recalcula los
+ref_count y borra los originales. Es idempotente: las rutas que ya apuntan a
+un blob no se tocan.
+
+--gc borra además los blobs sin referencias pasado el periodo de gracia
+(IMAGE_STORE_GC_GRACE_SECONDS); la API también lo hace cada
+IMAGE_STORE_GC_INTERVAL_SECONDS.
+--thumbnails genera las miniaturas que falten (imágenes anteriores a ellas).
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Ajustar sys.path para importar desde directorio padre
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.database import ImageBlobDB, SessionLocal, init_db
+from app.services.blob_store import TRACKED_COLUMNS, blob_hash_from_url, get_blob_store
+from app.services.thumbnailer import get_thumbnailer
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _local_path(url: str) -> Path:
+    """Ruta en disco de un valor de image_url ("/uploads/x.jpg", "uploads/x.jpg", "http://.../uploads/x.jpg")"""
+    if "://" in url:
+        url = url.split("://", 1)[1].split("/", 1)[-1]
+    return Path(url.lstrip("/"))
+
+
+def migrate_database(dry_run: bool = False):
+    """Copia las imágenes al almacén, reescribe las rutas y solo entonces borra los originales"""
+    # Tablas y columnas nuevas (image_blobs.derivatives), igual que al arrancar la app
+    init_db()
+    store = get_blob_store()
+    db = SessionLocal()
+    # ruta antigua -> ruta del blob (una imagen puede aparecer en varias filas)
+    moved = {}
+    updates = []
+    missing = 0
+    try:
+        # 1. Leer las rutas y copiar los archivos (sin transacción de escritura abierta:
+        #    el almacén registra cada blob en su propia sesión)
+        for model, columns in TRACKED_COLUMNS:
+            # Solo la clave y las columnas de imagen (no depende de otras migraciones)
+            rows = db.query(model.id, *(getattr(model, column) for column in columns)).all()
+            db.rollback()
+            for row in rows:
+                for column in columns:
+                    value = getattr(row, column)
+                    if not value or blob_hash_from_url(value):
+                        continue
+                    source = _local_path(value)
+                    if source not in moved:
+                        if not source.is_file():
+                            missing += 1
+                            logger.warning(f"⚠️  {model.__tablename__}.{column}: {value} no existe en disco")
+                            continue
+                        try:
+                            moved[source] = source.as_posix() if dry_run else store.put_file(source).path
+                        except ValueError as e:
+                            missing += 1
+                            logger.warning(f"⚠️  {e}")
+                            continue
+                    new_value = f"/{moved[source]}" if value.startswith("/") else moved[source]
+                    logger.info(f"{model.__tablename__}.{column}: {value} -> {new_value}")
+                    updates.append((model, row.id, column, new_value))
+
+        if dry_run:
+            logger.info(f"ℹ️  Simulación: {len(updates)} rutas, {len(moved)} archivos, {missing} sin archivo")
+            return
+
+        # 2. Reescribir todas las rutas en una transacción (ref_count se recalcula con recount)
+        for model, row_id, column, new_value in updates:
+            db.query(model).filter(model.id == row_id).update({column: new_value}, synchronize_session=False)
+        db.commit()
+        counts = store.recount(db)
+
+        # 3. Los originales ya no los referencia nadie
+        for source in moved:
+            source.unlink(missing_ok=True)
+        logger.info(
+            f"✅ MIGRACIÓN COMPLETADA: {len(updates)} rutas reescritas, {len(moved)} archivos, "
+            f"{len(counts)} blobs referenciados, {missing} sin archivo"
+        )
+    finally:
+        db.close()
+
+
+def collect_garbage():
+    """Borra los blobs sin referencias"""
+    db = SessionLocal()
+    try:
+        removed = get_blob_store().collect_garbage(db)
+        logger.info(f"🗑️  {removed} blobs sin referencias eliminados")
+    finally:
+        db.close()
+
+
+def generate_thumbnails():
+    """Genera las miniaturas de los blobs que no las tienen"""
+    thumbnailer = get_thumbnailer()
+    db = SessionLocal()
+    try:
+        pending = db.query(ImageBlobDB.sha256, ImageBlobDB.path).filter(ImageBlobDB.derivatives.is_(None)).all()
+    finally:
+        db.close()
+    generated = 0
+    for sha256, path in pending:
+        try:
+            thumbnailer.generate_now(sha256, path)
+            generated += 1
+        except Exception as e:
+            logger.warning(f"⚠️  {path}: {e}")
+    logger.info(f"🖼️  Miniaturas generadas para {generated} de {len(pending)} blobs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra las imágenes al almacén por contenido")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se movería")
+    parser.add_argument("--gc", action="store_true", help="Borrar después los blobs sin referencias")
+    parser.add_argument("--thumbnails", action="store_true", help="Generar las miniaturas que falten")
+    args = parser.parse_args()
+    try:
+        migrate_database(dry_run=args.dry_run)
+        if args.gc and not args.dry_run:
+            collect_garbage()
+        if args.thumbnails and not args.dry_run:
+            generate_thumbnails()
+    except Exception as e:
+        logger.error(f"❌ Error durante la migración: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
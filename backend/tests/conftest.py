@@ -0,0 +1,38 @@
+"""
+Configuración común de los tests.
+
+La base de datos y el almacén de imágenes van a un directorio temporal: las
+variables se fijan antes de importar app.* (los módulos leen la configuración
+al importarse) y además la fábrica de sesiones se enlaza a un motor propio.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_TMP = Path(tempfile.mkdtemp(prefix="jardin-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP / 'test.db'}"
+os.environ["IMAGE_STORE_DIR"] = str(_TMP / "blobs")
+os.environ["GROQ_API_KEY"] = "test"
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from app.models.database import Base, SessionLocal  # noqa: E402
+
+engine = create_engine(os.environ["DATABASE_URL"], connect_args={"check_same_thread": False})
+SessionLocal.configure(bind=engine)
+
+
+@pytest.fixture
+def db():
+    """Sesión sobre una base de datos vacía"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
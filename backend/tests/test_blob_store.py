@@ -0,0 +1,141 @@
+"""Almacén de imágenes: ref_count mantenido en el flush y recolección de basura"""
+import asyncio
+import io
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from app.models.database import DiagnosisDB, ImageBlobDB, PlantDB, SessionLocal
+from app.services import blob_store
+from app.services.blob_store import BlobStore, get_blob_store
+
+
+def _image(tmp_path, name: str, color: str) -> str:
+    """Guarda una imagen en el almacén y devuelve su ruta de blob"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), color).save(buffer, "JPEG")
+    source = tmp_path / name
+    source.write_bytes(buffer.getvalue())
+    return get_blob_store().put_file(source).path
+
+
+def _ref_count(db, path: str) -> int:
+    db.expire_all()
+    return db.query(ImageBlobDB.ref_count).filter(ImageBlobDB.path == path).scalar()
+
+
+@pytest.fixture
+def shared_blob(db, tmp_path):
+    """Una planta y un diagnóstico que apuntan al mismo blob (ya confirmados)"""
+    path = _image(tmp_path, "leaf.jpg", "green")
+    plant = PlantDB(user_id=1, name="Monstera", image_url=f"/{path}")
+    db.add(plant)
+    db.flush()
+    db.add(DiagnosisDB(user_id=1, plant_id=plant.id, image_url=f"/{path}", diagnosis_text="ok"))
+    db.commit()
+    return path, plant
+
+
+def test_new_rows_increment_ref_count(db, shared_blob):
+    path, _ = shared_blob
+    assert _ref_count(db, path) == 2
+
+
+def test_put_file_deduplicates(db, tmp_path):
+    first = _image(tmp_path, "a.jpg", "red")
+    second = _image(tmp_path, "b.jpg", "red")
+    assert first == second
+    assert db.query(ImageBlobDB).count() == 1
+
+
+def test_change_after_commit_decrements_old_blob(db, tmp_path, shared_blob):
+    path, plant = shared_blob
+    other = _image(tmp_path, "other.jpg", "blue")
+    # Tras el commit image_url está expirado: el valor anterior hay que leerlo de la base de datos
+    plant.image_url = f"/{other}"
+    db.commit()
+    assert _ref_count(db, path) == 1
+    assert _ref_count(db, other) == 1
+
+
+def test_change_to_unmanaged_path_after_commit(db, shared_blob):
+    path, plant = shared_blob
+    plant.image_url = "/uploads/other.jpg"
+    db.commit()
+    assert _ref_count(db, path) == 1
+
+
+def test_change_of_loaded_attribute(db, tmp_path, shared_blob):
+    path, plant = shared_blob
+    other = _image(tmp_path, "other.jpg", "blue")
+    assert plant.image_url == f"/{path}"
+    plant.image_url = f"/{other}"
+    db.commit()
+    assert _ref_count(db, path) == 1
+    assert _ref_count(db, other) == 1
+
+
+def test_delete_decrements_and_gc_removes_blob(db, tmp_path, shared_blob):
+    path, plant = shared_blob
+    plant.image_url = None
+    db.commit()
+    db.delete(db.query(DiagnosisDB).one())
+    db.commit()
+    assert _ref_count(db, path) == 0
+
+    assert get_blob_store().collect_garbage(db, grace_seconds=0) == 1
+    assert db.query(ImageBlobDB).count() == 0
+    assert not Path(path).exists()
+
+
+def test_gc_respects_grace_period(db, tmp_path):
+    _image(tmp_path, "orphan.jpg", "white")
+    assert get_blob_store().collect_garbage(db, grace_seconds=3600) == 0
+    assert db.query(ImageBlobDB).count() == 1
+
+
+def test_gc_keeps_referenced_blob_with_drifted_count(db, shared_blob):
+    db.query(ImageBlobDB).update({"ref_count": 0})
+    db.commit()
+    assert get_blob_store().collect_garbage(db, grace_seconds=0) == 0
+    assert db.query(ImageBlobDB).count() == 1
+
+
+def test_gc_delete_is_conditional(db, tmp_path, monkeypatch):
+    path = _image(tmp_path, "racy.jpg", "black")
+    store = get_blob_store()
+
+    def referenced_meanwhile(_db, sha256):
+        # Otra petición apunta al blob entre la selección y el borrado
+        other = SessionLocal()
+        try:
+            other.add(PlantDB(user_id=1, name="Nueva", image_url=f"/{path}"))
+            other.commit()
+        finally:
+            other.close()
+        return False
+
+    monkeypatch.setattr(store, "_is_referenced", referenced_meanwhile)
+    assert store.collect_garbage(db, grace_seconds=0) == 0
+    assert _ref_count(db, path) == 1
+    assert Path(path).exists()
+
+
+def test_periodic_gc_task(db, tmp_path, monkeypatch):
+    # Foto rechazada por calidad: queda en el almacén sin ninguna fila que la apunte
+    path = _image(tmp_path, "rejected.jpg", "yellow")
+    monkeypatch.setattr(blob_store.settings, "IMAGE_STORE_GC_GRACE_SECONDS", 0)
+    store = BlobStore(get_blob_store().root, gc_interval=0.01)
+
+    async def run():
+        store.start()
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if not Path(path).exists():
+                break
+        await store.stop()
+
+    asyncio.run(run())
+    assert not Path(path).exists()
+    assert store._gc_task is None
@@ -0,0 +1,108 @@
+"""Transiciones del circuit breaker: closed -> open -> half_open -> closed/open"""
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", fake)
+    return fake
+
+
+def _breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", failure_threshold=3, recovery_timeout=30)
+
+
+def _upstream(error: BaseException) -> bool:
+    return isinstance(error, ConnectionError)
+
+
+def _fail(breaker: CircuitBreaker, error: BaseException = ConnectionError("Groq caído")) -> None:
+    with pytest.raises(type(error)):
+        with breaker.guard(_upstream):
+            raise error
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = _breaker()
+    for _ in range(2):
+        _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard(_upstream):
+            pass
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = _breaker()
+    _fail(breaker)
+    _fail(breaker)
+    with breaker.guard(_upstream):
+        pass
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["consecutive_failures"] == 1
+
+
+def test_request_errors_do_not_count(clock):
+    breaker = _breaker()
+    for _ in range(5):
+        _fail(breaker, ValueError("prompt inválido"))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_after_recovery_timeout_allows_one_probe(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        _fail(breaker)
+    clock.now += 29
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["retry_in_seconds"] == 1.0
+    clock.now += 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_successful_probe_closes(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        _fail(breaker)
+    clock.now += 30
+    with breaker.guard(_upstream):
+        pass
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["consecutive_failures"] == 0
+
+
+def test_failed_probe_reopens(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        _fail(breaker)
+    clock.now += 30
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["retry_in_seconds"] == 30.0
+
+
+def test_probe_that_is_not_an_upstream_failure_frees_the_slot(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        _fail(breaker)
+    clock.now += 30
+    _fail(breaker, ValueError("prompt inválido"))
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
@@ -0,0 +1,39 @@
+"""Tests de la migración de columnas añadidas a tablas existentes"""
+from sqlalchemy import create_engine, inspect, text
+
+from app.models.database import ADDED_COLUMNS, Base, add_missing_columns
+
+
+def _legacy_engine(tmp_path):
+    """BD creada con el esquema actual y sin las columnas de ADDED_COLUMNS"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table, column, _ in ADDED_COLUMNS:
+            for index in Base.metadata.tables[table].indexes:
+                if column in index.columns.keys():
+                    conn.execute(text(f"DROP INDEX {index.name}"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    return engine
+
+
+def test_adds_missing_columns_and_is_idempotent(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (username) VALUES ('antiguo')"))
+
+    add_missing_columns(engine)
+    add_missing_columns(engine)
+
+    inspector = inspect(engine)
+    for table, column, _ in ADDED_COLUMNS:
+        assert column in {col["name"] for col in inspector.get_columns(table)}
+    assert "ix_diagnoses_prompt_fingerprint" in {ix["name"] for ix in inspector.get_indexes("diagnoses")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT diagnosis_count FROM users")).scalar() == 0
+
+
+def test_skips_tables_that_do_not_exist(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    add_missing_columns(engine)
+    assert inspect(engine).get_table_names() == []
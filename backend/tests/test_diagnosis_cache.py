@@ -0,0 +1,167 @@
+"""Caché de diagnósticos: clave por contenido, LRU en memoria, SQLite y TTL"""
+import asyncio
+import hashlib
+
+import pytest
+
+from app.services.diagnosis_cache import build_diagnosis_cache_key, normalize_symptoms
+from app.utils import cache as cache_module
+from app.utils.cache import TieredCache
+
+IMAGE_SHA256 = hashlib.sha256(b"\xff\xd8\xff foto de una hoja").hexdigest()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache_module.time, "time", fake)
+    return fake
+
+
+def _cache(tmp_path, **kwargs) -> TieredCache:
+    options = {"max_memory_entries": 2, "max_disk_entries": 100, "ttl_seconds": 60}
+    options.update(kwargs)
+    return TieredCache("test", str(tmp_path / "cache.db"), **options)
+
+
+def test_trivial_symptom_variations_share_a_key():
+    assert normalize_symptoms("  Hojas   AMARILLAS. ") == "hojas amarillas"
+    assert normalize_symptoms(None) == ""
+    key = build_diagnosis_cache_key(IMAGE_SHA256, "Hojas amarillas", "model", "v1")
+    assert build_diagnosis_cache_key(IMAGE_SHA256, "  hojas  amarillas.", "model", "v1") == key
+
+
+@pytest.mark.parametrize("change", [
+    {"image_sha256": hashlib.sha256(b"otra foto").hexdigest()},
+    {"symptoms": "manchas"},
+    {"model": "other-model"},
+    {"prompt_fingerprint": "fp2"},
+])
+def test_any_input_change_changes_the_key(change):
+    base = {"image_sha256": IMAGE_SHA256, "symptoms": "hojas amarillas", "model": "model", "prompt_fingerprint": "fp1"}
+    assert build_diagnosis_cache_key(**{**base, **change}) != build_diagnosis_cache_key(**base)
+
+
+def test_memory_hit_returns_a_copy(tmp_path, clock):
+    cache = _cache(tmp_path)
+    asyncio.run(cache.set("k", {"disease_name": "Oídio"}))
+    first = asyncio.run(cache.get("k"))
+    first["disease_name"] = "mutado"
+    assert asyncio.run(cache.get("k")) == {"disease_name": "Oídio"}
+
+
+def test_memory_lru_eviction_falls_back_to_disk(tmp_path, clock):
+    cache = _cache(tmp_path)
+    for key in ("a", "b", "c"):
+        asyncio.run(cache.set(key, key))
+    assert list(cache._memory) == ["b", "c"]
+    # "a" salió de memoria pero sigue en SQLite y vuelve a subir
+    assert asyncio.run(cache.get("a")) == "a"
+    assert list(cache._memory) == ["c", "a"]
+
+
+def test_entries_expire_in_both_tiers(tmp_path, clock):
+    cache = _cache(tmp_path)
+    asyncio.run(cache.set("k", "v"))
+    clock.now += 59
+    assert asyncio.run(cache.get("k")) == "v"
+    clock.now += 2
+    assert asyncio.run(cache.get("k")) is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_per_entry_ttl(tmp_path, clock):
+    cache = _cache(tmp_path)
+    asyncio.run(cache.set("short", "v", ttl_seconds=5))
+    clock.now += 6
+    assert asyncio.run(cache.get("short")) is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path, clock):
+    asyncio.run(_cache(tmp_path).set("k", {"confidence": 0.9}))
+    assert asyncio.run(_cache(tmp_path).get("k")) == {"confidence": 0.9}
+
+
+def test_disk_tier_is_pruned_to_max_entries(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(TieredCache, "PRUNE_EVERY", 1)
+    cache = _cache(tmp_path, max_disk_entries=3)
+    for i in range(5):
+        clock.now += 1
+        asyncio.run(cache.set(f"k{i}", i))
+    assert cache.stats()["disk_entries"] == 3
+
+
+class FakeVisionService:
+    """El modelo rápido responde con confianza baja y el grande con confianza alta"""
+
+    model = "fast-model"
+    timeout = 30.0
+
+    def __init__(self):
+        self.calls = []
+
+    async def analyze_image_with_prompt(self, **kwargs):
+        model = kwargs["model"]
+        self.calls.append(model)
+        confidence = 0.95 if model == "large-model" else 0.2
+        content = f'{{"species": {{"name": "Monstera", "confidence": {confidence}}}, "health_score": 80}}'
+        return {"success": True, "content": content, "model": model, "usage": {}}
+
+
+@pytest.fixture
+def escalating_service(tmp_path, monkeypatch):
+    from app.services import groq_service
+    from app.services.model_router import ModelRouter
+
+    service = FakeVisionService()
+    monkeypatch.setattr(groq_service, "get_groq_service", lambda: service)
+    monkeypatch.setattr(groq_service, "get_model_router", lambda: ModelRouter("fast-model", "large-model"))
+    monkeypatch.setattr(groq_service, "get_diagnosis_cache", lambda: _cache(tmp_path))
+
+    async def route_fast(service, image_bytes):
+        return "fast-model"
+
+    monkeypatch.setattr(groq_service, "_route_diagnosis", route_fast)
+    monkeypatch.setattr(groq_service.settings, "DIAGNOSIS_CACHE_ENABLED", True)
+    return service
+
+
+def test_escalated_diagnosis_is_cached_under_the_model_that_answered(tmp_path, escalating_service):
+    from app.services.groq_service import get_plant_diagnosis
+    from app.utils.prompts import get_prompt_registry
+
+    photo = tmp_path / "hoja.jpg"
+    photo.write_bytes(b"\xff\xd8\xff foto")
+    first = asyncio.run(get_plant_diagnosis(str(photo)))
+    assert escalating_service.calls == ["fast-model", "large-model"]
+    assert (first["model"], first["confidence"], first["cached"]) == ("large-model", 0.95, False)
+
+    sha256 = hashlib.sha256(photo.read_bytes()).hexdigest()
+    fingerprint = get_prompt_registry().get("diagnosis", first["prompt_variant"]).fingerprint
+    cache = _cache(tmp_path)
+    assert asyncio.run(cache.get(build_diagnosis_cache_key(sha256, None, "large-model", fingerprint))) is not None
+    assert asyncio.run(cache.get(build_diagnosis_cache_key(sha256, None, "fast-model", fingerprint))) is None
+
+    # La misma foto se sirve de caché aunque el enrutado vuelva a elegir el modelo rápido
+    second = asyncio.run(get_plant_diagnosis(str(photo)))
+    assert escalating_service.calls == ["fast-model", "large-model"]
+    assert (second["confidence"], second["cached"]) == (0.95, True)
+
+
+def test_lookup_counts_a_single_miss(tmp_path):
+    from app.services.diagnosis_cache import lookup_diagnosis
+    from app.utils.metrics import metrics
+
+    cache = _cache(tmp_path)
+    before = metrics.counter("cache.test.misses")
+    found = asyncio.run(lookup_diagnosis(cache, IMAGE_SHA256, None, ["large", "fast"], "fp"))
+    assert found is None
+    assert metrics.counter("cache.test.misses") == before + 1
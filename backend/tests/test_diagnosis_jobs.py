@@ -0,0 +1,133 @@
+"""Cola de diagnósticos: reclamación atómica, concesiones, aplazamientos e intentos"""
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.database import DiagnosisJobDB
+from app.services.diagnosis_jobs import DiagnosisJobQueue, JobRetryLater
+
+
+def _queue(handler, **kwargs) -> DiagnosisJobQueue:
+    queue = DiagnosisJobQueue(**kwargs)
+    queue.register("analyze", handler)
+    return queue
+
+
+async def _ok(job):
+    return {"result": {"ok": True}, "diagnosis_id": None}
+
+
+def _job(db, job_id: str) -> DiagnosisJobDB:
+    db.expire_all()
+    return db.get(DiagnosisJobDB, job_id)
+
+
+def test_job_is_claimed_only_once(db):
+    queue = _queue(_ok)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    start = threading.Barrier(8)
+    claimed = []
+
+    def worker():
+        start.wait()
+        claimed.append(queue._claim())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [c for c in claimed if c is not None]
+    assert [w["id"] for w in winners] == [job.id]
+    assert _job(db, job.id).status == "running"
+    assert _job(db, job.id).attempts == 1
+
+
+def test_running_job_with_live_lease_is_not_claimed(db):
+    queue = _queue(_ok, lease_seconds=300)
+    queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    assert queue._claim() is not None
+    assert queue._claim() is None
+
+
+def test_expired_lease_is_reclaimed(db):
+    queue = _queue(_ok, lease_seconds=60)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    assert queue._claim()["attempts"] == 1
+    # El worker murió: la concesión vence sin que el trabajo termine
+    db.query(DiagnosisJobDB).update({"started_at": datetime.utcnow() - timedelta(seconds=120)})
+    db.commit()
+
+    reclaimed = queue._claim()
+    assert reclaimed["id"] == job.id
+    assert reclaimed["attempts"] == 2
+    assert _job(db, job.id).status == "running"
+
+
+def test_retry_later_requeues_with_run_after(db):
+    async def breaker_open(job):
+        raise JobRetryLater(30, "circuito abierto")
+
+    queue = _queue(breaker_open, max_attempts=3)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    asyncio.run(queue._execute(queue._claim()))
+
+    row = _job(db, job.id)
+    assert row.status == "queued"
+    assert row.error == "circuito abierto"
+    assert row.run_after > datetime.utcnow() + timedelta(seconds=25)
+    # No está listo hasta que pase run_after
+    assert queue._claim() is None
+
+
+def test_completed_job_stores_result(db):
+    queue = _queue(_ok)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    asyncio.run(queue._execute(queue._claim()))
+    row = _job(db, job.id)
+    assert row.status == "completed"
+    assert row.result == '{"ok": true}'
+    assert row.finished_at is not None
+
+
+@pytest.mark.parametrize("error", [RuntimeError("Groq 500"), JobRetryLater(5)])
+def test_max_attempts_ends_in_failed(db, error):
+    calls = []
+
+    async def failing(job):
+        calls.append(job["attempts"])
+        raise error
+
+    queue = _queue(failing, max_attempts=2, retry_delay=0)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    for _ in range(2):
+        db.query(DiagnosisJobDB).update({"run_after": None})
+        db.commit()
+        asyncio.run(queue._execute(queue._claim()))
+
+    row = _job(db, job.id)
+    assert calls == [1, 2]
+    assert row.status == "failed"
+    assert row.finished_at is not None
+    assert queue._claim() is None
+
+
+def test_lease_expired_past_max_attempts_fails_without_running(db):
+    calls = []
+
+    async def handler(job):
+        calls.append(job)
+        return {"result": None}
+
+    queue = _queue(handler, max_attempts=1, lease_seconds=60)
+    job = queue.enqueue(db, "analyze", user_id=1, image_path="uploads/x.jpg")
+    queue._claim()
+    db.query(DiagnosisJobDB).update({"started_at": datetime.utcnow() - timedelta(seconds=120)})
+    db.commit()
+
+    asyncio.run(queue._execute(queue._claim()))
+    assert calls == []
+    assert _job(db, job.id).status == "failed"
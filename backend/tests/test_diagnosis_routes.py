@@ -0,0 +1,160 @@
+"""Rutas de diagnóstico con el servicio de IA no disponible: el diagnóstico se encola"""
+import asyncio
+import io
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.models.database import DiagnosisDB, DiagnosisJobDB
+from app.routes import diagnosis
+from app.services.diagnosis_jobs import get_diagnosis_jobs
+from app.services.groq_service import queued_diagnosis_result
+
+COMPLETED = {
+    "diagnosis": "Oídio en las hojas",
+    "confidence": 0.9,
+    "severity": "medium",
+    "disease_name": "Oídio",
+    "recommendations": ["Retira las hojas afectadas"],
+    "weekly_plan": [],
+    "success": True,
+}
+
+
+def _photo() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (40, 140, 60)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(diagnosis.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def ai_down(monkeypatch):
+    async def unavailable(*args, **kwargs):
+        return queued_diagnosis_result()
+
+    monkeypatch.setattr(diagnosis, "get_plant_diagnosis", unavailable)
+
+
+def _files():
+    return {"image": ("hoja.jpg", _photo(), "image/jpeg")}
+
+
+def _only_job(db) -> DiagnosisJobDB:
+    db.expire_all()
+    jobs = db.query(DiagnosisJobDB).all()
+    assert len(jobs) == 1
+    return jobs[0]
+
+
+def test_analyze_enqueues_job_instead_of_placeholder(client, db, ai_down):
+    response = client.post("/api/diagnosis/analyze", files=_files(), data={"symptoms": "manchas"})
+
+    assert response.status_code == 202
+    job = _only_job(db)
+    assert response.json()["job_id"] == job.id
+    assert response.headers["Location"] == f"/api/diagnosis/jobs/{job.id}"
+    assert (job.kind, job.status, job.symptoms) == ("analyze", "queued", "manchas")
+    # El primer intento espera a que el circuito pueda cerrarse
+    assert job.run_after > datetime.utcnow()
+    assert db.query(DiagnosisDB).count() == 0
+
+
+def test_queued_job_stores_the_diagnosis_when_ai_recovers(client, db, ai_down, monkeypatch):
+    job_id = client.post("/api/diagnosis/analyze", files=_files()).json()["job_id"]
+
+    async def recovered(*args, **kwargs):
+        return dict(COMPLETED)
+
+    monkeypatch.setattr(diagnosis, "get_plant_diagnosis", recovered)
+    db.query(DiagnosisJobDB).update({"run_after": None})
+    db.commit()
+    queue = get_diagnosis_jobs()
+    asyncio.run(queue._execute(queue._claim()))
+
+    job = _only_job(db)
+    assert job.id == job_id
+    assert job.status == "completed"
+    stored = db.get(DiagnosisDB, job.diagnosis_id)
+    assert stored.disease_name == "Oídio"
+    assert stored.image_url == job.image_path
+
+
+def test_stream_ends_with_queued_event(client, db, ai_down, monkeypatch):
+    async def unavailable_stream(*args, **kwargs):
+        yield "result", queued_diagnosis_result()
+
+    monkeypatch.setattr(diagnosis, "stream_plant_diagnosis", unavailable_stream)
+    response = client.post("/api/diagnosis/analyze/stream", files=_files())
+
+    events = [block for block in response.text.split("\n\n") if block]
+    assert [block.split("\n")[0] for block in events] == ["event: accepted", "event: queued"]
+    payload = json.loads(events[-1].split("data: ", 1)[1])
+    assert payload["job_id"] == _only_job(db).id
+    assert db.query(DiagnosisDB).count() == 0
+
+
+def test_capture_guidance_returns_job(client, db, ai_down, monkeypatch):
+    async def good_photo(image_bytes):
+        return {"success": True, "guidance": "Perfecto", "details": {"overall": 0.9}}
+
+    monkeypatch.setattr(diagnosis, "validate_photo_quality", good_photo)
+    body = client.post("/api/diagnosis/capture-guidance", files=_files(), data={"speculative": "false"}).json()
+
+    job = _only_job(db)
+    assert body["has_diagnosis"] is True
+    assert body["diagnosis"]["status"] == "queued"
+    assert body["diagnosis"]["job_id"] == job.id
+    assert body["diagnosis"]["diagnosis_id"] is None
+    assert db.query(DiagnosisDB).count() == 0
+
+
+def test_stream_wraps_unknown_fields_in_partial_event(client, db, monkeypatch):
+    async def streamed(*args, **kwargs):
+        yield "field", ("health_score", 80)
+        yield "field", ("done", "inventado por el modelo")
+        yield "result", dict(COMPLETED)
+
+    monkeypatch.setattr(diagnosis, "stream_plant_diagnosis", streamed)
+    response = client.post("/api/diagnosis/analyze/stream", files=_files())
+
+    events = [block for block in response.text.split("\n\n") if block]
+    names = [block.split("\n")[0] for block in events]
+    assert names == ["event: accepted", "event: health_score", "event: partial", "event: diagnosis", "event: done"]
+    partial = json.loads(events[2].split("data: ", 1)[1])
+    assert partial == {"field": "done", "value": "inventado por el modelo"}
+
+
+def test_stream_persists_with_its_own_session(client, db, monkeypatch):
+    async def streamed(*args, **kwargs):
+        yield "result", dict(COMPLETED)
+
+    opened, closed = [], []
+    session_factory = diagnosis.SessionLocal
+
+    def tracking_session():
+        session = session_factory()
+        close = session.close
+        session.close = lambda: (closed.append(session), close())
+        opened.append(session)
+        return session
+
+    monkeypatch.setattr(diagnosis, "stream_plant_diagnosis", streamed)
+    monkeypatch.setattr(diagnosis, "SessionLocal", tracking_session)
+    response = client.post("/api/diagnosis/analyze/stream", files=_files())
+
+    done = json.loads(response.text.strip().split("\n\n")[-1].split("data: ", 1)[1])
+    # El generador abre su propia sesión, la cierra y el diagnóstico queda guardado
+    assert len(opened) == 1
+    assert closed == opened
+    assert db.get(DiagnosisDB, done["diagnosis_id"]).disease_name == "Oídio"
@@ -0,0 +1,38 @@
+"""Guía de cámara por WebSocket: cada frame recibe respuesta aunque falle"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import diagnosis
+from app.utils.metrics import metrics
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.include_router(diagnosis.router)
+    return TestClient(app)
+
+
+def test_frame_error_is_reported(monkeypatch):
+    async def broken(frame):
+        raise ValueError("frame corrupto")
+
+    monkeypatch.setattr(diagnosis, "validate_photo_quality_fast", broken)
+    before = metrics.counter("ws.guidance.frames_error")
+    with _client().websocket_connect("/api/diagnosis/ws/guidance") as ws:
+        ws.send_bytes(b"\xff\xd8\xff frame")
+        message = ws.receive_json()
+    assert message["type"] == "error"
+    assert message["seq"] == 1
+    assert metrics.counter("ws.guidance.frames_error") == before + 1
+
+
+def test_frame_guidance(monkeypatch):
+    async def scored(frame):
+        return {"success": True, "guidance": "Perfecto", "details": {"overall": 0.9}}
+
+    monkeypatch.setattr(diagnosis, "validate_photo_quality_fast", scored)
+    with _client().websocket_connect("/api/diagnosis/ws/guidance") as ws:
+        ws.send_bytes(b"\xff\xd8\xff frame")
+        message = ws.receive_json()
+    assert message["type"] == "guidance"
+    assert message["voice_guidance"] == "Perfecto"
@@ -0,0 +1,140 @@
+"""/uploads: ETag, caché inmutable, 304, rangos y negociación de WebP"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.image_files import IMMUTABLE_CACHE_CONTROL, ImageFiles, parse_range
+
+SHA = "ab" * 32
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(tmp_path):
+    blobs = tmp_path / "blobs" / "ab" / "ab"
+    blobs.mkdir(parents=True)
+    (blobs / f"{SHA}.jpg").write_bytes(DATA)
+    (blobs / f"{SHA}_128.jpg").write_bytes(b"jpeg-thumbnail")
+    (blobs / f"{SHA}_128.webp").write_bytes(b"webp-thumbnail")
+    (tmp_path / "blobs" / ".incoming").mkdir()
+    (tmp_path / "blobs" / ".incoming" / "x.part").write_bytes(b"partial")
+    (tmp_path / "plants").mkdir()
+    (tmp_path / "plants" / "plant_1.jpg").write_bytes(b"legacy")
+    app = FastAPI()
+    app.mount("/uploads", ImageFiles(directory=str(tmp_path)))
+    return TestClient(app)
+
+
+BLOB_URL = f"/uploads/blobs/ab/ab/{SHA}.jpg"
+THUMB_URL = f"/uploads/blobs/ab/ab/{SHA}_128.jpg"
+
+
+def test_blob_has_strong_etag_and_immutable_cache(client):
+    response = client.get(BLOB_URL)
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["etag"] == f'"{SHA}.jpg"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+@pytest.mark.parametrize("if_none_match", [f'"{SHA}.jpg"', f'W/"{SHA}.jpg"', f'"otro", "{SHA}.jpg"', "*"])
+def test_if_none_match_is_304(client, if_none_match):
+    response = client.get(BLOB_URL, headers={"If-None-Match": if_none_match})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{SHA}.jpg"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_other_etag_is_200(client):
+    assert client.get(BLOB_URL, headers={"If-None-Match": '"otro"'}).status_code == 200
+
+
+def test_range_is_206(client):
+    response = client.get(BLOB_URL, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+    assert response.headers["content-length"] == "100"
+
+
+def test_suffix_and_open_ranges(client):
+    assert client.get(BLOB_URL, headers={"Range": "bytes=-24"}).content == DATA[-24:]
+    assert client.get(BLOB_URL, headers={"Range": "bytes=1000-"}).content == DATA[1000:]
+
+
+def test_unsatisfiable_range_is_416(client):
+    response = client.get(BLOB_URL, headers={"Range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_multiple_ranges_get_the_whole_file(client):
+    response = client.get(BLOB_URL, headers={"Range": "bytes=0-1,10-11"})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_mismatch_ignores_range(client):
+    stale = client.get(BLOB_URL, headers={"Range": "bytes=0-9", "If-Range": '"otro"'})
+    assert stale.status_code == 200
+    fresh = client.get(BLOB_URL, headers={"Range": "bytes=0-9", "If-Range": f'"{SHA}.jpg"'})
+    assert fresh.status_code == 206
+
+
+def test_webp_is_negotiated_from_accept(client):
+    webp = client.get(THUMB_URL, headers={"Accept": "image/avif,image/webp,*/*"})
+    assert webp.content == b"webp-thumbnail"
+    assert webp.headers["content-type"] == "image/webp"
+    assert webp.headers["etag"] == f'"{SHA}_128.webp"'
+    assert webp.headers["vary"] == "Accept"
+
+    jpeg = client.get(THUMB_URL, headers={"Accept": "image/webp;q=0, */*"})
+    assert jpeg.content == b"jpeg-thumbnail"
+    assert jpeg.headers["vary"] == "Accept"
+
+
+def test_original_without_webp_sibling_is_served_as_is(client):
+    response = client.get(BLOB_URL, headers={"Accept": "image/webp"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content == DATA
+
+
+def test_legacy_path_is_revalidated(client):
+    response = client.get("/uploads/plants/plant_1.jpg")
+    assert response.headers["cache-control"] == "no-cache"
+    assert "vary" not in response.headers
+    again = client.get("/uploads/plants/plant_1.jpg", headers={"If-None-Match": response.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_hidden_and_missing_files_are_404(client):
+    assert client.get("/uploads/blobs/.incoming/x.part").status_code == 404
+    assert client.get("/uploads/nope.jpg").status_code == 404
+
+
+def test_head_has_no_body(client):
+    response = client.head(BLOB_URL)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(DATA))
+    assert response.content == b""
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-0", (0, 0)),
+    ("bytes=5-", (5, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=2-100", (2, 9)),
+    ("bytes=-100", (0, 9)),
+    ("items=0-1", None),
+    ("bytes=0-1,3-4", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=5-2", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 10)
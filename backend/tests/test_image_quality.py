@@ -0,0 +1,79 @@
+"""Tests del analizador local de calidad de imagen"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from app.utils.image_processing import analyze_image_quality
+
+EXPECTED_KEYS = {
+    "lighting", "focus", "distance", "overall", "direction", "is_centered",
+    "plant_detected", "recommendations", "voice_guidance", "metrics",
+}
+
+
+def _plant_image(size=400, leaf=0.6, offset=(0, 0), brightness=1.0, blur=0.0) -> bytes:
+    """Fondo gris con una "hoja" verde texturizada"""
+    rng = np.random.default_rng(42)
+    pixels = np.full((size, size, 3), 120, dtype=np.float32)
+    half = int(size * leaf / 2)
+    cx, cy = size // 2 + offset[0], size // 2 + offset[1]
+    texture = rng.integers(0, 80, (2 * half, 2 * half)).astype(np.float32)
+    region = pixels[cy - half:cy + half, cx - half:cx + half]
+    region[..., 0] = 40 + texture * 0.3
+    region[..., 1] = 120 + texture
+    region[..., 2] = 30 + texture * 0.3
+    pixels = np.clip(pixels * brightness, 0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels, "RGB")
+    if blur:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def test_returns_same_fields_as_ai_validation():
+    result = analyze_image_quality(_plant_image())
+    assert EXPECTED_KEYS <= result.keys()
+    assert set(result["recommendations"]) == {"direction", "distance", "lighting", "focus"}
+    for field in ("lighting", "focus", "distance", "overall"):
+        assert 0.0 <= result[field] <= 1.0
+
+
+def test_sharp_centered_plant_is_ready_to_capture():
+    result = analyze_image_quality(_plant_image())
+    assert result["plant_detected"]
+    assert result["is_centered"]
+    assert result["recommendations"] == {
+        "direction": "center", "distance": "ok", "lighting": "ok", "focus": "ok",
+    }
+    assert result["voice_guidance"] == "Perfecto, lista para capturar"
+
+
+@pytest.mark.parametrize("kwargs, field, advice", [
+    ({"blur": 6}, "focus", "refocus"),
+    ({"brightness": 0.3}, "lighting", "more"),
+    ({"leaf": 0.2}, "distance", "closer"),
+])
+def test_defects_lower_the_score(kwargs, field, advice):
+    good = analyze_image_quality(_plant_image())
+    bad = analyze_image_quality(_plant_image(**kwargs))
+    assert bad["recommendations"][field] == advice
+    assert bad["overall"] < good["overall"]
+
+
+def test_off_center_plant_gets_direction():
+    result = analyze_image_quality(_plant_image(leaf=0.3, offset=(120, 0)))
+    assert result["direction"] == "right"
+    assert not result["is_centered"]
+
+
+def test_no_vegetation_is_penalised():
+    gray = Image.new("RGB", (300, 300), (128, 128, 128))
+    buffer = io.BytesIO()
+    gray.save(buffer, format="PNG")
+    result = analyze_image_quality(buffer.getvalue())
+    assert not result["plant_detected"]
+    assert result["overall"] < analyze_image_quality(_plant_image())["overall"]
+    assert result["voice_guidance"] == "No veo la planta, apunta la cámara hacia ella"
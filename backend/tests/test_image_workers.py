@@ -0,0 +1,95 @@
+"""Tests de la cola acotada de procesos de imagen"""
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services.image_workers import HASH_INLINE_BYTES, ImageWorkers, ImageWorkersBusy
+
+
+def _with_thread_pool(workers: ImageWorkers) -> ThreadPoolExecutor:
+    """Arranca el pool con hilos en lugar de procesos (mismo contrato de Executor)"""
+    pool = ThreadPoolExecutor(max_workers=workers.workers)
+    workers._pool = pool
+    workers._slots = asyncio.Semaphore(workers.workers + workers.queue_depth)
+    return pool
+
+
+def test_without_pool_runs_inline_in_a_thread():
+    workers = ImageWorkers(workers=0)
+
+    async def main():
+        await workers.start()
+        return await workers.run("double", lambda x: (x * 2, threading.current_thread().name), 21)
+
+    result, thread_name = asyncio.run(main())
+    assert result == 42
+    assert thread_name != threading.main_thread().name
+    assert not workers.running
+    assert workers.stats() == {"workers": 0, "mode": "threads"}
+
+
+def test_full_queue_raises_busy():
+    workers = ImageWorkers(workers=1, queue_depth=1, queue_timeout=0.05)
+    release = threading.Event()
+
+    async def main():
+        pool = _with_thread_pool(workers)
+        try:
+            running = [asyncio.create_task(workers.run("slow", release.wait, 5)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            assert workers.stats()["in_flight"] == 2
+            with pytest.raises(ImageWorkersBusy) as busy:
+                await workers.run("slow", release.wait, 5)
+            assert busy.value.waited >= 0.05
+            release.set()
+            assert await asyncio.gather(*running) == [True, True]
+            # Con la cola libre se vuelve a aceptar trabajo
+            assert await workers.run("fast", len, b"abc") == 3
+        finally:
+            release.set()
+            pool.shutdown(wait=True)
+
+    asyncio.run(main())
+    stats = workers.stats()
+    assert (stats["rejected"], stats["completed"], stats["in_flight"]) == (1, 3, 0)
+
+
+def test_busy_handler_returns_503():
+    from app.main import image_workers_busy_handler
+
+    response = asyncio.run(image_workers_busy_handler(None, ImageWorkersBusy(10.0)))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_broken_pool_is_recreated_and_task_runs_inline(monkeypatch):
+    workers = ImageWorkers(workers=1)
+
+    class BrokenPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("worker muerto")
+
+    recreated = []
+    monkeypatch.setattr(workers, "_create_pool", lambda: recreated.append(True))
+
+    async def main():
+        workers._pool = BrokenPool(max_workers=1)
+        workers._slots = asyncio.Semaphore(2)
+        try:
+            return await workers.run("op", sum, [1, 2, 3])
+        finally:
+            workers._pool.shutdown()
+
+    assert asyncio.run(main()) == 6
+    assert recreated == [True]
+    assert workers._in_flight == 0
+
+
+def test_sha256_small_and_large():
+    workers = ImageWorkers(workers=0)
+    for data in (b"x" * 10, b"y" * (HASH_INLINE_BYTES + 1)):
+        assert asyncio.run(workers.sha256(data)) == hashlib.sha256(data).hexdigest()
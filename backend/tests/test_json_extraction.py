@@ -0,0 +1,71 @@
+"""Tests de la extracción tolerante de JSON en respuestas del LLM"""
+import pytest
+
+from app.utils.json_extraction import extract_json_object, parse_llm_json
+from app.utils.metrics import metrics
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1, "b": [1, 2]}',
+    '```json\n{"a": 1, "b": [1, 2]}\n```',
+    'Aquí tienes el análisis:\n```\n{"a": 1, "b": [1, 2]}\n```\nEspero que ayude {sic}.',
+    'Resultado {no es json} y luego {"a": 1, "b": [1, 2]} fin',
+])
+def test_fenced_and_prose_wrapped_json(text):
+    assert extract_json_object(text) == {"a": 1, "b": [1, 2]}
+
+
+def test_trailing_commas_are_removed():
+    before = metrics.counter("llm_json.repaired.trailing_comma")
+    data = extract_json_object('{"a": [1, 2,], "b": {"c": "x",},}')
+    assert data == {"a": [1, 2], "b": {"c": "x"}}
+    assert metrics.counter("llm_json.repaired.trailing_comma") == before + 1
+
+
+def test_commas_inside_strings_are_kept():
+    assert extract_json_object('{"a": "uno, dos,", "b": "}]"}') == {"a": "uno, dos,", "b": "}]"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Cortado dentro de una cadena
+    ('{"summary": "Hojas amarill', {"summary": "Hojas amarill"}),
+    # Cortado tras una coma, con listas y objetos abiertos
+    ('```json\n{"issues": [{"name": "oidio"},', {"issues": [{"name": "oidio"}]}),
+    # Cortado tras los dos puntos
+    ('{"a": 1, "b":', {"a": 1, "b": None}),
+    # Cortado justo después de una barra de escape
+    ('{"a": "x\\', {"a": "x"}),
+])
+def test_truncated_json_is_closed(text, expected):
+    before = metrics.counter("llm_json.repaired.truncated")
+    assert extract_json_object(text) == expected
+    assert metrics.counter("llm_json.repaired.truncated") == before + 1
+
+
+@pytest.mark.parametrize("text", [None, "", "sin json", "[1, 2, 3]", '{"a": }'])
+def test_unrecoverable_returns_none(text):
+    assert extract_json_object(text) is None
+
+
+def test_parse_llm_json_coerces_diagnosis():
+    text = '```json\n{"health_score": "85%", "species": "Monstera", "issues": ["oidio"], "status": "Bien"'
+    data = parse_llm_json(text, "diagnosis")
+    assert data["health_score"] == 85
+    assert data["status"] == "healthy"
+    assert data["species"] == {"name": "Monstera", "confidence": 0.7}
+    assert data["issues"] == [{"name": "oidio"}]
+    assert data["summary"] == "Diagnóstico completado"
+
+
+def test_parse_llm_json_coerces_validation():
+    data = parse_llm_json('{"is_centered": "sí", "plant_detected": 1, "confidence": 80}', "validation")
+    assert data["is_centered"] is True
+    assert data["plant_detected"] is True
+    assert data["confidence"] == 0.8
+    assert data["recommendations"] == {}
+
+
+def test_parse_llm_json_counts_failures():
+    before = metrics.counter("llm_json.validation.failed")
+    assert parse_llm_json("no puedo ver la imagen", "validation") is None
+    assert metrics.counter("llm_json.validation.failed") == before + 1
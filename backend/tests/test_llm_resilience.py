@@ -0,0 +1,94 @@
+"""Reintentos con backoff: nunca se sale del plazo total del llamador"""
+import asyncio
+import time
+
+import groq
+import httpx
+import pytest
+
+from app.services.llm_resilience import DeadlineExceededError, ResilientCaller
+
+
+def _caller(**kwargs) -> ResilientCaller:
+    options = {"max_attempts": 3, "base_delay": 0.01, "max_delay": 0.05, "hedge_enabled": False}
+    options.update(kwargs)
+    return ResilientCaller(**options)
+
+
+def _rate_limited(retry_after: str) -> groq.RateLimitError:
+    response = httpx.Response(
+        429, headers={"retry-after": retry_after}, request=httpx.Request("POST", "http://groq.test")
+    )
+    return groq.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    async def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise asyncio.TimeoutError()
+        return "ok"
+
+    assert asyncio.run(_caller().call("test_retry", flaky, deadline=5)) == "ok"
+    assert len(attempts) == 3
+    # Cada intento recibe solo el tiempo que queda
+    assert attempts[0] > attempts[1] > attempts[2]
+
+
+def test_slow_backend_gives_up_at_the_deadline():
+    async def hangs(timeout):
+        await asyncio.sleep(10)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(_caller(max_attempts=10).call("test_deadline", hangs, deadline=0.3))
+    assert time.monotonic() - started < 0.5
+
+
+def test_retry_after_beyond_the_deadline_is_not_waited():
+    attempts = []
+
+    async def limited(timeout):
+        attempts.append(1)
+        raise _rate_limited("30")
+
+    started = time.monotonic()
+    with pytest.raises(groq.RateLimitError):
+        asyncio.run(_caller().call("test_retry_after", limited, deadline=2))
+    assert attempts == [1]
+    assert time.monotonic() - started < 0.5
+
+
+def test_retry_after_within_the_deadline_is_respected():
+    attempts = []
+
+    async def limited_once(timeout):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _rate_limited("0.2")
+        return "ok"
+
+    assert asyncio.run(_caller().call("test_retry_after_ok", limited_once, deadline=2)) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+
+
+def test_non_retryable_errors_fail_fast():
+    attempts = []
+
+    async def bad_request(timeout):
+        attempts.append(1)
+        raise ValueError("prompt inválido")
+
+    with pytest.raises(ValueError):
+        asyncio.run(_caller().call("test_fail_fast", bad_request, deadline=5))
+    assert attempts == [1]
+
+
+def test_last_error_is_raised_after_max_attempts():
+    async def always_limited(timeout):
+        raise _rate_limited("0")
+
+    with pytest.raises(groq.RateLimitError):
+        asyncio.run(_caller(max_attempts=2).call("test_exhausted", always_limited, deadline=5))
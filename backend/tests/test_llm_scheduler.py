@@ -0,0 +1,101 @@
+"""Cubetas de RPM/TPM y cola por prioridad del planificador del LLM"""
+import asyncio
+
+import pytest
+
+from app.services import llm_scheduler
+from app.services.llm_scheduler import LLMOverloadedError, LLMScheduler, Priority, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_scheduler.time, "monotonic", fake)
+    return fake
+
+
+def test_bucket_starts_full_and_refills_continuously(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.time_until(60) == 0
+    bucket.consume(60)
+    assert bucket.time_until(1) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.time_until(30) == 0
+    assert bucket.time_until(31) == pytest.approx(1.0)
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    clock.now += 3600
+    bucket._refill()
+    assert bucket.available == 60
+
+
+def test_request_larger_than_capacity_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(per_minute=100)
+    bucket.consume(50)
+    # Una petición de 500 tokens nunca cabría: se limita a la capacidad
+    assert bucket.time_until(500) == pytest.approx(30.0)
+    bucket.consume(500)
+    assert bucket.available == -50
+
+
+def test_refund_corrects_the_estimate(clock):
+    bucket = TokenBucket(per_minute=1000)
+    bucket.consume(800)
+    bucket.refund(800 - 300)  # consumió 300 de los 800 reservados
+    assert bucket.available == 700
+    bucket.refund(-200)  # consumió más de lo estimado
+    assert bucket.available == 500
+
+
+def test_disabled_bucket_never_waits(clock):
+    bucket = TokenBucket(per_minute=0)
+    bucket.consume(10**6)
+    assert not bucket.enabled
+    assert bucket.time_until(10**6) == 0
+
+
+def test_scheduler_waits_for_budget_by_priority():
+    async def run():
+        scheduler = LLMScheduler(
+            max_concurrency=10, requests_per_minute=60, tokens_per_minute=0, queue_deadlines={}
+        )
+        scheduler.requests.available = 1
+        order = []
+
+        async def call(priority, name):
+            async with scheduler.slot(priority, 0):
+                order.append(name)
+
+        # Se despacha la primera; la de prioridad GUIDANCE adelanta a la de COMPARISON
+        first = asyncio.create_task(call(Priority.DIAGNOSIS, "first"))
+        await asyncio.sleep(0)
+        comparison = asyncio.create_task(call(Priority.COMPARISON, "comparison"))
+        guidance = asyncio.create_task(call(Priority.GUIDANCE, "guidance"))
+        await asyncio.wait_for(asyncio.gather(first, comparison, guidance), 5)
+        return order
+
+    assert asyncio.run(run()) == ["first", "guidance", "comparison"]
+
+
+def test_scheduler_sheds_after_queue_deadline():
+    async def run():
+        scheduler = LLMScheduler(
+            max_concurrency=1, requests_per_minute=0, tokens_per_minute=0,
+            queue_deadlines={Priority.MODERATION: 0.05},
+        )
+        async with scheduler.slot(Priority.DIAGNOSIS, 0):
+            with pytest.raises(LLMOverloadedError):
+                await scheduler.acquire(Priority.MODERATION, 0)
+        return scheduler.running
+
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,12 @@
+"""Endpoint /metrics"""
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_metrics_include_db_backed_stats(db):
+    body = TestClient(app).get("/metrics").json()
+
+    assert isinstance(body["diagnosis_jobs"]["by_status"], dict)
+    assert {"diagnosis", "moderation"} <= body["caches"].keys()
+    assert "disk_entries" in body["caches"]["diagnosis"]
@@ -0,0 +1,111 @@
+"""Tests del enrutado adaptativo entre el modelo rápido y el grande"""
+import pytest
+
+from app.services import model_router as router_module
+from app.services.model_router import ModelRouter, ModelStats
+
+FAST, LARGE = "fast-11b", "large-90b"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(router_module.time, "monotonic", fake)
+    return fake
+
+
+def make_router(**kwargs):
+    return ModelRouter(FAST, LARGE, **kwargs)
+
+
+def test_ewma_latency_and_error_rate():
+    stats = ModelStats(alpha=0.5)
+    stats.record(100.0, ok=True)
+    assert stats.latency_ms == 100.0  # la primera muestra inicializa la media
+    stats.record(300.0, ok=True)
+    assert stats.latency_ms == 200.0
+    stats.record(None, ok=False)
+    assert stats.latency_ms == 200.0  # los fallos no cuentan para la latencia
+    assert stats.error_rate == 0.5
+    stats.record(100.0, ok=True)
+    assert stats.error_rate == 0.25
+    assert stats.latency_ms == 150.0
+    assert (stats.calls, stats.errors) == (4, 1)
+
+
+def test_single_model_when_large_missing_or_equal():
+    assert ModelRouter(FAST, "").choose("diagnosis").reason == "single_model"
+    assert ModelRouter(FAST, FAST).choose("diagnosis").reason == "single_model"
+    assert make_router(enabled=False).choose("diagnosis", quality_score=0.0).model == FAST
+
+
+def test_interactive_purposes_always_fast():
+    router = make_router()
+    for _ in range(5):
+        router.record(FAST, None, ok=False)
+    assert router.choose("guidance") == (FAST, "interactive")
+    assert router.choose("validation", quality_score=0.0) == (FAST, "interactive")
+
+
+def test_low_quality_goes_to_large_only_if_it_fits():
+    router = make_router(low_quality_score=0.4)
+    assert router.choose("diagnosis", quality_score=0.8) == (FAST, "default")
+    assert router.choose("diagnosis", quality_score=0.2) == (LARGE, "low_quality")
+    router.record(LARGE, 5000.0, ok=True)
+    assert router.choose("diagnosis", deadline=3.0, quality_score=0.2) == (FAST, "default")
+    assert router.choose("diagnosis", deadline=10.0, quality_score=0.2) == (LARGE, "low_quality")
+
+
+def test_unhealthy_fast_model_fails_over_and_recovers(clock):
+    router = make_router(max_error_rate=0.5, ewma_alpha=0.5, recovery_seconds=30)
+    router.record(FAST, None, ok=False)
+    assert router.choose("diagnosis") == (FAST, "default")  # 0.5 no supera el umbral
+    router.record(FAST, None, ok=False)
+    assert router.choose("diagnosis") == (LARGE, "fast_unhealthy")
+    clock.now += 29
+    assert router.choose("diagnosis").model == LARGE
+    clock.now += 1
+    assert router.choose("diagnosis") == (FAST, "default")
+
+
+@pytest.mark.parametrize("confidence, expected", [
+    (None, False),
+    (0.6, False),   # en el umbral no se escala
+    (0.59, True),
+    (0.1, True),
+])
+def test_escalation_threshold(confidence, expected):
+    router = make_router(escalation_confidence=0.6)
+    assert router.should_escalate("diagnosis", FAST, confidence, remaining=None) is expected
+
+
+def test_escalation_requires_fast_model_and_non_interactive_purpose():
+    router = make_router()
+    assert not router.should_escalate("diagnosis", LARGE, 0.1, remaining=None)
+    assert not router.should_escalate("guidance", FAST, 0.1, remaining=None)
+
+
+def test_escalation_respects_remaining_time_and_health(clock):
+    router = make_router(ewma_alpha=1.0)
+    router.record(LARGE, 4000.0, ok=True)
+    assert not router.should_escalate("diagnosis", FAST, 0.1, remaining=3.0)
+    assert router.should_escalate("diagnosis", FAST, 0.1, remaining=5.0)
+    router.record(LARGE, None, ok=False)
+    assert not router.should_escalate("diagnosis", FAST, 0.1, remaining=5.0)
+
+
+def test_stats_ignores_unknown_models():
+    router = make_router()
+    router.record("otro", 10.0, ok=True)
+    router.record(FAST, 123.45, ok=True)
+    stats = router.stats()
+    assert set(stats["models"]) == {FAST, LARGE}
+    assert stats["models"][FAST] == {"calls": 1, "errors": 0, "error_rate": 0.0, "latency_ms": 123.5}
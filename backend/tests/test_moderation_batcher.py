@@ -0,0 +1,91 @@
+"""Tests de los micro-lotes de moderación"""
+import asyncio
+
+from app.services.moderation_batcher import ModerationBatcher
+
+
+class FakeModerator:
+    """Modera por lotes: los textos con "malo" son inapropiados"""
+
+    def __init__(self, fail_on=None, short=False):
+        self.calls = []
+        self.fail_on = fail_on
+        self.short = short
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail_on and self.fail_on in texts:
+            raise RuntimeError("lote fallido")
+        verdicts = ["malo" not in text for text in texts]
+        return verdicts[:-1] if self.short else verdicts
+
+
+def test_fan_out_one_call_per_window():
+    moderator = FakeModerator()
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_batch_size=16, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(t) for t in ["hola", "algo malo", "adiós"]))
+
+    assert asyncio.run(main()) == [True, False, True]
+    assert moderator.calls == [["hola", "algo malo", "adiós"]]
+
+
+def test_duplicates_sent_once():
+    moderator = FakeModerator()
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(t) for t in ["a", "malo", "a", "malo"]))
+
+    assert asyncio.run(main()) == [True, False, True, False]
+    assert moderator.calls == [["a", "malo"]]
+
+
+def test_full_batch_flushes_without_waiting():
+    moderator = FakeModerator()
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_batch_size=2, max_wait=10)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(t) for t in ["a", "b", "c", "d"])), timeout=1
+        )
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [True] * 4
+    assert moderator.calls == [["a", "b"], ["c", "d"]]
+    assert stats == {"pending": 0, "in_flight_batches": 0}
+
+
+def test_leftover_items_flushed_by_timer():
+    moderator = FakeModerator()
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_batch_size=2, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(t) for t in ["a", "b", "c"]))
+
+    assert asyncio.run(main()) == [True, True, True]
+    assert moderator.calls == [["a", "b"], ["c"]]
+
+
+def test_failed_batch_does_not_affect_other_batches():
+    moderator = FakeModerator(fail_on="rompe")
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_batch_size=2, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(t) for t in ["rompe", "x", "malo", "y"]))
+
+    # El primer lote falla (sin veredicto); el segundo se modera con normalidad
+    assert asyncio.run(main()) == [None, None, False, True]
+
+
+def test_missing_verdicts_are_none():
+    moderator = FakeModerator(short=True)
+
+    async def main():
+        batcher = ModerationBatcher(moderator, max_wait=0.01)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+    assert asyncio.run(main()) == [True, None]
@@ -0,0 +1,61 @@
+"""Tests del autómata Aho-Corasick y del prefiltro local de moderación"""
+import pytest
+
+from app.utils.aho_corasick import AhoCorasick
+from app.utils.moderation_filter import (
+    find_blocked_terms,
+    keyword_moderation,
+    normalize_text,
+    prefilter,
+)
+
+
+def test_overlapping_matches():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    assert sorted(automaton.iter_matches("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_empty_patterns_are_ignored():
+    assert AhoCorasick(["", "a"]).iter_matches("aa") == [(0, 1, "a"), (1, 2, "a")]
+
+
+def test_find_words_respects_word_boundaries():
+    automaton = AhoCorasick(["puta", "bit.ly/"])
+    assert automaton.find_words("computadora disputa") == []
+    assert automaton.find_words("eres una puta.") == [(9, 13, "puta")]
+    # Los términos que acaban en símbolo pueden ir pegados a más texto
+    assert automaton.find_words("mira bit.ly/abc") == [(5, 12, "bit.ly/")]
+
+
+def test_normalize_text_removes_accents_case_and_spaces():
+    assert normalize_text("  ¡ESTÚPIDO\n  Imbécil!  ") == "¡estupido imbecil!"
+
+
+@pytest.mark.parametrize("text, terms", [
+    ("Eres un IDIOTA", ["idiota"]),
+    ("qué imbécil", ["imbecil"]),
+    ("Estúpida planta", ["estupida"]),
+    ("Inversión   garantizada, escríbeme al WhatsApp", ["inversion garantizada", "escribeme al whatsapp"]),
+    ("Mi hija disputa la maceta", []),
+])
+def test_blocked_terms_with_accents_and_case(text, terms):
+    assert find_blocked_terms(text) == terms
+    assert keyword_moderation(text) is (not terms)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("👍👍", (True, "no_words")),
+    ("¡Muchas GRACIAS!", (True, "allowlist")),
+    ("Qué bonita, ¿cada cuánto riegas?", (True, "allowlist")),
+    ("Gracias, IMBÉCIL", (False, "blocklist")),
+    ("ver a.com b.com c.com", (False, "link_spam")),
+    ("más info en www.vivero.com", (None, "contact_info")),
+    ("llámame al 600 123 456", (None, "contact_info")),
+    ("Gracias, las hojas tienen manchas marrones", (None, "ambiguous")),
+])
+def test_prefilter_decisions(text, expected):
+    assert tuple(prefilter(text)) == expected
+
+
+def test_prefilter_link_limit_is_configurable():
+    assert prefilter("ver a.com b.com c.com", max_links=5).appropriate is None
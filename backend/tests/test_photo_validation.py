@@ -0,0 +1,25 @@
+"""Validación de foto en modo degradado (IA no disponible)"""
+import asyncio
+
+import pytest
+
+from app.services import groq_service
+from app.services.groq_service import validate_photo_quality, validate_photo_quality_fast
+
+
+class OpenCircuitService:
+    async def analyze_image_with_prompt(self, **kwargs):
+        return {"success": False, "error": "circuito abierto", "circuit_open": True}
+
+
+@pytest.fixture
+def ai_down(monkeypatch):
+    monkeypatch.setattr(groq_service, "get_groq_service", lambda: OpenCircuitService())
+
+
+def test_unreadable_photo_is_rejected_when_local_fallback_fails(ai_down):
+    result = asyncio.run(validate_photo_quality(b"no es una imagen"))
+
+    assert result["success"] is False
+    assert result["details"]["overall"] == 0.0
+    assert result == asyncio.run(validate_photo_quality_fast(b"no es una imagen"))
@@ -0,0 +1,33 @@
+"""Tests de la preparación de la foto para el modelo de visión"""
+import pytest
+
+from app.utils import image_processing
+from app.utils.image_processing import prepare_image_for_llm
+
+# Firma válida y datos corruptos: Pillow no puede decodificarlas
+TRUNCATED = {
+    "image/png": b"\x89PNG\r\n\x1a\n" + b"\x00" * 20,
+    "image/webp": b"RIFF\x00\x00\x00\x00WEBPVP8 " + b"\x00" * 20,
+    "image/gif": b"GIF89a" + b"\x00" * 20,
+    "image/jpeg": b"\xff\xd8\xff" + b"\x00" * 20,
+}
+
+
+@pytest.mark.parametrize("mime_type, data", TRUNCATED.items())
+def test_undecodable_image_keeps_its_real_type(mime_type, data):
+    sent, sent_type, stats = prepare_image_for_llm(data)
+    assert sent == data
+    assert sent_type == mime_type
+    assert stats["sent_bytes"] == len(data)
+
+
+def test_unknown_bytes_default_to_jpeg():
+    assert prepare_image_for_llm(b"no es una imagen")[1] == "image/jpeg"
+
+
+def test_preprocess_disabled_sends_original_type(monkeypatch):
+    monkeypatch.setattr(image_processing.settings, "LLM_IMAGE_PREPROCESS", False)
+    data = TRUNCATED["image/png"]
+    assert prepare_image_for_llm(data) == (data, "image/png", {
+        "purpose": "diagnosis", "original_bytes": len(data), "sent_bytes": len(data),
+    })
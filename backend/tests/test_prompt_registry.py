@@ -0,0 +1,108 @@
+"""Tests del registro de prompts: huellas, plantillas y reparto A/B"""
+import pytest
+
+from app.utils.prompts import (
+    DIAGNOSIS_PROMPT,
+    PromptRegistry,
+    PromptTemplate,
+    build_prompt_registry,
+    parse_prompt_splits,
+)
+
+
+def test_fingerprint_is_stable_and_depends_on_name_variant_and_text():
+    template = PromptTemplate("diagnosis", "default", "Texto")
+    assert template.fingerprint == PromptTemplate("diagnosis", "default", "Texto").fingerprint
+    assert len(template.fingerprint) == 16
+    assert template.version == f"diagnosis/default@{template.fingerprint}"
+    others = {
+        PromptTemplate("otro", "default", "Texto").fingerprint,
+        PromptTemplate("diagnosis", "compact", "Texto").fingerprint,
+        PromptTemplate("diagnosis", "default", "Texto.").fingerprint,
+    }
+    assert template.fingerprint not in others
+    assert len(others) == 3
+
+
+def test_registry_fingerprints_do_not_change_between_builds():
+    first, second = build_prompt_registry(), build_prompt_registry()
+    assert first.describe() == second.describe()
+    # La variante por defecto conserva el texto histórico
+    assert first.get("diagnosis").text == DIAGNOSIS_PROMPT
+
+
+def test_render_keeps_json_braces_and_fills_params():
+    template = PromptTemplate("t", "default", 'Planta {plant_type}: {{"ok": true}} fin', params=("plant_type",))
+    assert template.render(plant_type="rosa") == 'Planta rosa: {"ok": true} fin'
+    # Sin parámetros el texto es literal
+    assert PromptTemplate("t", "default", '{"a": 1}').render() == '{"a": 1}'
+
+
+@pytest.mark.parametrize("text, params", [
+    ("Hola {nombre} {otro}", ("nombre",)),  # parámetro no declarado
+    ("Hola", ("nombre",)),                  # parámetro declarado sin usar
+    ("Hola {nombre!r}", ("nombre",)),
+])
+def test_invalid_templates_are_rejected(text, params):
+    with pytest.raises(ValueError):
+        PromptTemplate("t", "default", text, params=params)
+
+
+def test_variants_must_share_params():
+    registry = PromptRegistry()
+    registry.register("t", "{a}", params=("a",))
+    with pytest.raises(ValueError):
+        registry.register("t", "{b}", variant="otra", params=("b",))
+
+
+def test_parse_prompt_splits_ignores_malformed_entries():
+    assert parse_prompt_splits("diagnosis:compact=0.2, quick_validation:compact=0.5,,roto,x:y=z") == {
+        "diagnosis": {"compact": 0.2},
+        "quick_validation": {"compact": 0.5},
+    }
+
+
+def _registry(splits):
+    registry = PromptRegistry()
+    registry.register("p", "A")
+    registry.register("p", "B", variant="b")
+    registry.configure_splits(splits)
+    return registry
+
+
+def test_select_is_deterministic_per_key():
+    registry = _registry({"p": {"b": 0.5}})
+    keys = [f"imagen-{i}" for i in range(200)]
+    first = [registry.select("p", key=key).template.variant for key in keys]
+    assert first == [registry.select("p", key=key).template.variant for key in keys]
+    assert first == [_registry({"p": {"b": 0.5}}).select("p", key=key).template.variant for key in keys]
+    # Con 200 claves el reparto se acerca al 50%
+    assert 60 < first.count("b") < 140
+
+
+def test_select_explicit_variant_wins_and_unknown_falls_back():
+    registry = _registry({"p": {"b": 0.5}})
+    assert registry.select("p", key="x", variant="default") == (registry.get("p"), "explicit")
+    assert registry.select("p", variant="no-existe").assigned_by in ("split", "default")
+
+
+def test_select_without_splits_uses_default():
+    registry = _registry({})
+    assert registry.select("p", key="x") == (registry.get("p"), "default")
+
+
+@pytest.mark.parametrize("splits", [
+    {"p": {"desconocida": 0.5}},
+    {"p": {"b": 1.5}},
+    {"p": {"b": 0}},
+])
+def test_invalid_splits_are_ignored(splits):
+    registry = _registry(splits)
+    assert all(registry.select("p", key=str(i)).assigned_by == "default" for i in range(20))
+
+
+def test_describe_reports_weights():
+    rows = {row["variant"]: row for row in _registry({"p": {"b": 0.25}}).describe()}
+    assert rows["default"]["weight"] == 0.75
+    assert rows["b"]["weight"] == 0.25
+    assert rows["b"]["chars"] == 1
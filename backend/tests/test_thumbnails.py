@@ -0,0 +1,110 @@
+"""Tests de las miniaturas derivadas de los blobs"""
+import asyncio
+import json
+
+from PIL import Image
+
+from app.models.database import ImageBlobDB
+from app.services.thumbnailer import Thumbnailer, parse_sizes
+from app.utils.thumbnails import derivative_path, derivative_url, image_variants, render_derivatives
+
+SHA = "ab" * 32
+
+
+def _blob(tmp_path, size=(2000, 1000)):
+    path = tmp_path / f"{SHA}.jpg"
+    Image.new("RGB", size, (40, 140, 60)).save(path, "JPEG")
+    return path
+
+
+def test_parse_sizes_sorts_and_deduplicates():
+    assert parse_sizes("1024, 128,384,128,") == (128, 384, 1024)
+
+
+def test_derivative_names_next_to_blob():
+    assert derivative_path(f"uploads/blobs/ab/ab/{SHA}.jpg", 384, "webp").as_posix() == (
+        f"uploads/blobs/ab/ab/{SHA}_384.webp"
+    )
+    assert derivative_url(f"http://host/uploads/blobs/ab/ab/{SHA}.png", 128, "jpg") == (
+        f"http://host/uploads/blobs/ab/ab/{SHA}_128.jpg"
+    )
+
+
+def test_render_derivatives_sizes_and_formats(tmp_path):
+    source = _blob(tmp_path)
+    derivatives = render_derivatives(str(source), (128, 384, 1024), quality=80)
+    assert derivatives == {"1024": [1024, 512], "384": [384, 192], "128": [128, 64]}
+    for size, (width, height) in derivatives.items():
+        for extension, image_format in (("webp", "WEBP"), ("jpg", "JPEG")):
+            with Image.open(derivative_path(str(source), int(size), extension)) as image:
+                assert image.format == image_format
+                assert image.size == (width, height)
+    # Sin temporales a medio escribir
+    assert not list(tmp_path.glob(".*.part"))
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    source = _blob(tmp_path, size=(300, 200))
+    assert render_derivatives(str(source), (128, 384), quality=80) == {"384": [300, 200], "128": [128, 85]}
+
+
+def test_image_variants_without_derivatives_uses_original():
+    url = f"/uploads/blobs/ab/ab/{SHA}.jpg"
+    assert image_variants(url, None) == {"thumbnail_url": url, "srcset": None, "srcset_jpeg": None}
+    assert image_variants(None, {"128": [128, 64]})["thumbnail_url"] is None
+
+
+def test_image_variants_srcset():
+    url = f"/uploads/blobs/ab/ab/{SHA}.jpg"
+    base = url[:-len(".jpg")]
+    variants = image_variants(url, {"128": [128, 64], "384": [300, 200], "1024": [300, 200]})
+    assert variants["thumbnail_url"] == f"{base}_384.webp"
+    # El derivado de 1024 no se amplió: repite ancho con el de 384 y se omite
+    assert variants["srcset"] == f"{base}_128.webp 128w, {base}_384.webp 300w"
+    assert variants["srcset_jpeg"] == f"{base}_128.jpg 128w, {base}_384.jpg 300w"
+
+
+def test_generate_now_records_derivatives(db, tmp_path):
+    source = _blob(tmp_path)
+    db.add(ImageBlobDB(sha256=SHA, path=str(source), size=1, ref_count=1))
+    db.commit()
+    thumbnailer = Thumbnailer(workers=1, sizes=(128, 384), quality=70)
+    assert not thumbnailer._is_done(SHA, str(source))
+
+    thumbnailer.generate_now(SHA, str(source))
+
+    db.expire_all()
+    row = db.get(ImageBlobDB, SHA)
+    assert json.loads(row.derivatives) == {"384": [384, 192], "128": [128, 64]}
+    assert thumbnailer._is_done(SHA, str(source))
+    url = f"/uploads/blobs/ab/ab/{SHA}.jpg"
+    assert [v["thumbnail_url"] for v in thumbnailer.variants_for(db, [url, None])] == [
+        f"/uploads/blobs/ab/ab/{SHA}_384.webp", None,
+    ]
+
+
+def test_disabled_without_workers_or_sizes():
+    assert not Thumbnailer(workers=0).enabled
+    assert not Thumbnailer(workers=2, sizes=()).enabled
+
+
+def test_stop_waits_for_cancelled_tasks(monkeypatch):
+    thumbnailer = Thumbnailer(workers=1, sizes=(128,))
+    cleaned_up = []
+
+    async def slow_generate(sha256, path):
+        try:
+            await asyncio.sleep(60)
+        finally:
+            await asyncio.sleep(0)
+            cleaned_up.append(sha256)
+
+    monkeypatch.setattr(thumbnailer, "_generate", slow_generate)
+
+    async def run():
+        thumbnailer.schedule(SHA, "foto.jpg")
+        await asyncio.sleep(0)
+        await thumbnailer.stop()
+        return cleaned_up[:]
+
+    assert asyncio.run(run()) == [SHA]
@@ -0,0 +1,84 @@
+"""Subida por bloques: límites, formato por firma y limpieza del .part"""
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.utils import uploads
+from app.utils.uploads import store_upload
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 60
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 60
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Bloques menores que la firma: el formato se detecta a través de varios bloques
+    monkeypatch.setattr(uploads.settings, "UPLOAD_CHUNK_BYTES", 5)
+
+
+def _upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename="foto.bin", size=size)
+
+
+def _store(data: bytes, destination, **kwargs):
+    return asyncio.run(store_upload(_upload(data), str(destination), **kwargs))
+
+
+def _leftovers(directory):
+    return sorted(p.name for p in directory.iterdir())
+
+
+def test_stores_with_detected_extension_and_hash(tmp_path):
+    stored = _store(PNG, tmp_path / "plant_1.jpg")
+    assert stored.path == (tmp_path / "plant_1.png").as_posix()
+    assert stored.format == "png"
+    assert stored.content_type == "image/png"
+    assert stored.size == len(PNG)
+    assert stored.sha256 == hashlib.sha256(PNG).hexdigest()
+    assert _leftovers(tmp_path) == ["plant_1.png"]
+
+
+def test_too_large_is_413_and_cleans_up(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        _store(JPEG, tmp_path / "big.jpg", max_bytes=32)
+    assert error.value.status_code == 413
+    assert _leftovers(tmp_path) == []
+
+
+def test_declared_size_is_rejected_before_copying(tmp_path):
+    upload = _upload(JPEG, size=10**9)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(store_upload(upload, str(tmp_path / "big.jpg")))
+    assert error.value.status_code == 413
+    assert _leftovers(tmp_path) == []
+
+
+def test_unsupported_format_is_415_and_cleans_up(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        _store(b"<html>no soy una imagen</html>", tmp_path / "x.jpg")
+    assert error.value.status_code == 415
+    assert _leftovers(tmp_path) == []
+
+
+def test_format_outside_allowed_list_is_415(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        _store(PNG, tmp_path / "x.jpg", allowed_formats=("jpeg",))
+    assert error.value.status_code == 415
+    assert _leftovers(tmp_path) == []
+
+
+def test_file_shorter_than_signature_is_415(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        _store(b"\xff\xd8", tmp_path / "x.jpg")
+    assert error.value.status_code == 415
+    assert _leftovers(tmp_path) == []
+
+
+def test_empty_file_is_400_and_cleans_up(tmp_path):
+    with pytest.raises(HTTPException) as error:
+        _store(b"", tmp_path / "x.jpg")
+    assert error.value.status_code == 400
+    assert _leftovers(tmp_path) == []
@@ -0,0 +1,61 @@
+"""Medidor de tokens: base diaria consistente con un volcado en curso"""
+import asyncio
+import threading
+
+from app.services.usage_meter import UsageMeter, usage_scope
+
+
+def _record(meter: UsageMeter, user_id: int, tokens: int) -> None:
+    with usage_scope(user_id, "diagnosis"):
+        meter.record("model", "diagnosis", tokens, 0, tokens)
+
+
+def test_daily_total_combines_database_and_buffer(db):
+    meter = UsageMeter()
+    _record(meter, 7, 100)
+    asyncio.run(meter.flush())
+    _record(meter, 7, 30)
+    assert asyncio.run(meter.tokens_used_today(7)) == 130
+    _record(meter, 7, 5)
+    assert asyncio.run(meter.tokens_used_today(7)) == 135
+
+
+def test_daily_total_during_flush_is_not_undercounted(db):
+    meter = UsageMeter()
+    _record(meter, 7, 100)
+    writing = threading.Event()
+    release = threading.Event()
+    write = meter._write
+
+    def slow_write(buffer):
+        # Búfer ya vaciado pero aún sin confirmar en la BD
+        writing.set()
+        release.wait(5)
+        write(buffer)
+
+    meter._write = slow_write
+    flusher = threading.Thread(target=lambda: asyncio.run(meter.flush()))
+    flusher.start()
+    assert writing.wait(5)
+
+    async def first_check():
+        check = asyncio.create_task(meter.tokens_used_today(7))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await check
+
+    assert asyncio.run(first_check()) == 100
+    flusher.join()
+    assert asyncio.run(meter.tokens_used_today(7)) == 100
+
+
+def test_failed_flush_keeps_tokens_in_buffer(db):
+    meter = UsageMeter()
+    _record(meter, 7, 40)
+
+    def broken_write(buffer):
+        raise RuntimeError("BD caída")
+
+    meter._write = broken_write
+    assert asyncio.run(meter.flush()) == 0
+    assert asyncio.run(meter.tokens_used_today(7)) == 40